@@ -2,6 +2,8 @@
 ASGI config for messagingapi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP is served by Django, websockets by the message consumers in
+``message.routing``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -15,4 +17,12 @@ from django.core.asgi import get_asgi_application
 load_dotenv()
 os.getenv('DJANGO_SETTINGS_MODULE')
 
-application = get_asgi_application()
+django_asgi_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from message.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_application,
+    'websocket': URLRouter(websocket_urlpatterns),
+})
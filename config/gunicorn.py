@@ -0,0 +1,38 @@
+"""
+Gunicorn settings, `gunicorn -c config/gunicorn.py config.wsgi`.
+
+Threaded workers: requests mostly wait on the database, threads overlap the
+waiting for a fraction of the memory of more processes. Every thread keeps
+its own connection to each database it uses (see DATABASE_POOLING), a dyno
+holds up to workers x threads of them per database, read replicas included.
+Over all dynos, plus the release and media worker processes, that has to
+stay below the connection limit of the database, or go through PgBouncer.
+Hence a small default of one worker per CPU plus one, WEB_CONCURRENCY sets
+the count for the dyno size and connection limit at hand.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:%s' % os.getenv('PORT', '8000')
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Recycle workers now and then to bound slow memory growth, staggered so
+# they don't all restart at once.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = timeout
+# The router in front keeps connections to the dyno open between requests.
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    databases = 1 + len(os.getenv('DATABASE_REPLICA_URLS', '').split())
+    server.log.info('%s workers x %s threads, up to %s connections per database, %s over %s database(s).',
+                    workers, threads, workers * threads, workers * threads * databases, databases)
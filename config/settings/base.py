@@ -37,20 +37,35 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'corsheaders',
+    'channels',
     'django_firebase',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'message.authentication.StatelessJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'message.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'message.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'message.throttling.AnonThrottle',
+        'message.throttling.UserThrottle',
+        'message.throttling.MethodScopeThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '480/min',
-        'user': '480/min'
+        'user': '480/min',
+        'message_post': '120/min',
+        'poll': '240/min',
     },
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 
@@ -89,6 +104,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'message.metrics.MetricsMiddleware',
+    'message.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -121,6 +138,91 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Real-time message delivery, the in-memory layer needs no broker but only
+# reaches connections served by the same process: it does for runserver, in
+# development. Production serves websockets from the ASGI process of the
+# Procfile, apart from gunicorn, and needs Redis in between (see production).
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+
+# Seconds a serialized club or user detail stays cached, entries are
+# invalidated on change so this only bounds memory use.
+REPRESENTATION_CACHE_TIMEOUT = 60 * 60
+
+
+# Seconds a process trusts its cached copy of a user's club memberships.
+MEMBERSHIP_CACHE_TTL = 30
+
+# Users loaded by StatelessJWTAuthentication, kept per process. A size of
+# 0 turns the cache off.
+AUTH_USER_CACHE_SIZE = 256
+AUTH_USER_CACHE_TTL = 60
+
+# Chunked media uploads. Part files are kept in MEDIA_UPLOAD_DIR until the
+# upload completes, on the same filesystem as MEDIA_ROOT they are moved into
+# place rather than copied.
+MEDIA_UPLOAD_DIR = os.getenv('MEDIA_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads'))
+MEDIA_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+MEDIA_UPLOAD_CHUNK_SIZE = 8 * 1024 ** 2
+MEDIA_UPLOAD_EXPIRY = timedelta(days=1)
+
+# Background media processing, run by `manage.py process_media`. Jobs are
+# leased for MEDIA_JOB_LEASE seconds, a worker dying mid-job leaves it to be
+# picked up again once the lease runs out.
+MEDIA_WORKERS = 2
+MEDIA_JOB_LEASE = 300
+MEDIA_JOB_MAX_ATTEMPTS = 5
+
+# Throttle counters are kept per process and pushed to the shared cache
+# every THROTTLE_SYNC_EVERY[scope] requests of a client or
+# THROTTLE_SYNC_INTERVAL seconds. Polling is only counted per process.
+THROTTLE_SYNC_EVERY = {'anon': 10, 'user': 20, 'message_post': 5}
+THROTTLE_SYNC_INTERVAL = 5
+THROTTLE_LOCAL_SIZE = 100000
+
+# Message history tiers. Deleted messages are kept MESSAGE_DELETED_RETENTION
+# before `manage.py archive_messages` purges them. With the archive enabled it
+# also moves messages older than MESSAGE_ARCHIVE_AFTER to the archive table,
+# which history reads then merge in.
+MESSAGE_ARCHIVE_ENABLED = os.getenv('MESSAGE_ARCHIVE_ENABLED', 'false').lower() == 'true'
+MESSAGE_ARCHIVE_AFTER = timedelta(days=365)
+MESSAGE_ARCHIVE_BATCH_SIZE = 1000
+MESSAGE_DELETED_RETENTION = timedelta(days=30)
+
+# Monthly partitioning of the message table by created_at, PostgreSQL only.
+# `manage.py partition_messages --convert` partitions the table, then set
+# MESSAGE_PARTITIONING. Run daily, the command keeps MESSAGE_PARTITIONS_AHEAD
+# months of partitions ready and detaches those older than
+# MESSAGE_PARTITION_RETENTION (None: never). History pages read the last
+# MESSAGE_RECENT_WINDOW first, only scanning the recent partitions.
+MESSAGE_PARTITIONING = os.getenv('MESSAGE_PARTITIONING', 'false').lower() == 'true'
+MESSAGE_PARTITIONS_AHEAD = 3
+MESSAGE_PARTITION_RETENTION = None
+MESSAGE_RECENT_WINDOW = timedelta(days=31)
+
+# Read replicas, aliases in DATABASES. Safe requests to the read views use
+# one of DATABASE_REPLICAS, except for users who wrote in the last
+# REPLICA_PIN_SECONDS, which should be longer than replication lags.
+DATABASE_ROUTERS = ['message.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in os.getenv('DATABASE_REPLICAS', '').split(',') if alias]
+REPLICA_PIN_SECONDS = 10
+
+# Request metrics, served at /metrics to `Authorization: Bearer
+# <METRICS_TOKEN>` only, closed while it is unset. A METRICS_SAMPLE_RATE
+# share of requests is measured, those slower than METRICS_SLOW_REQUEST_MS
+# are logged, with their SQL when METRICS_CAPTURE_SQL is set: keeping every
+# statement of every sampled request costs memory, turn it on to debug.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '1.0'))
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', '500'))
+METRICS_CAPTURE_SQL = os.getenv('METRICS_CAPTURE_SQL', 'false').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 
 
 # Password validation
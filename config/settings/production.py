@@ -1,5 +1,6 @@
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 import django_heroku
 from config.settings.base import *
 from .base import *
@@ -25,6 +26,39 @@ DATABASES = {
 
 DATABASES['default'] = dj_database_url.config(default=os.getenv("DATABASE_URL", None))
 
+# Read replicas (e.g. Heroku followers), as space separated database URLs.
+DATABASE_REPLICAS = []
+for number, url in enumerate(os.getenv('DATABASE_REPLICA_URLS', '').split(), 1):
+    DATABASES['replica%s' % number] = dj_database_url.parse(url)
+    DATABASE_REPLICAS.append('replica%s' % number)
+
+# How database connections are reused, DATABASE_POOLING:
+#   persistent  every gunicorn thread keeps its connections for
+#               DATABASE_CONN_MAX_AGE seconds, checked before each request
+#               (the default),
+#   pgbouncer   the same through PgBouncer in transaction pooling mode, which
+#               can't keep server side cursors open across transactions,
+#   none        new connections for every request.
+# config/gunicorn.py sets how many threads hold connections.
+DATABASE_POOLING = os.getenv('DATABASE_POOLING', 'persistent')
+if DATABASE_POOLING not in ('persistent', 'pgbouncer', 'none'):
+    raise ImproperlyConfigured('Unknown DATABASE_POOLING %r.' % DATABASE_POOLING)
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = 0 if DATABASE_POOLING == 'none' else int(os.getenv('DATABASE_CONN_MAX_AGE', '600'))
+    database['CONN_HEALTH_CHECKS'] = DATABASE_POOLING != 'none'
+    database['DISABLE_SERVER_SIDE_CURSORS'] = DATABASE_POOLING == 'pgbouncer'
+
+# gunicorn broadcasts new messages, the websocket process (daphne, see the
+# Procfile) delivers them: both reach each other through Redis. Without
+# REDIS_URL there is no channel layer, messages aren't pushed and websockets
+# are refused. The proxy in front routes /ws/ to the websocket process.
+CHANNEL_LAYERS = {}
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS['default'] = {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+    }
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
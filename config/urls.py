@@ -22,6 +22,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework.documentation import include_docs_urls
 
+from message.metrics import metrics_view
+
 core_schema_view = include_docs_urls(title='Messaging App API')
 schema_view = get_schema_view(
     openapi.Info(
@@ -41,6 +43,7 @@ urlpatterns = [
     path('', core_schema_view),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('api/v1/', include(('message.urls', 'message'), namespace='messages')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
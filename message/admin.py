@@ -1,6 +1,7 @@
 from datetime import timedelta
 from django.contrib import admin
 from .models import UserProfile, Club, ClubUser, UserMessage
+from .search import search_messages
 
 
 # Register your models here.
@@ -30,6 +31,11 @@ class AdminUserMessage(admin.ModelAdmin):
     list_filter = ('body',)
     empty_value_display = '-empty field-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_messages(queryset, search_term), False
+
 
 admin.site.register(UserProfile, AdminUserProfile)
 admin.site.register(Club, AdminClub)
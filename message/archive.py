@@ -0,0 +1,75 @@
+"""
+The cold tier of message history.
+
+Messages older than MESSAGE_ARCHIVE_AFTER move in batches from the message
+table to ArchivedMessage, keeping the hot table and its indexes small.
+History reads (the message pages and exports) merge both tiers on
+(created_at, id), so clients can't tell where a message lives. Archived
+messages are left out of search and of the nested ``messages`` of clubs and
+profiles.
+
+Messages with an attachment or that an inbox entry shows as its latest
+stay hot, rows pointing at them would otherwise break.
+
+The tier is off unless MESSAGE_ARCHIVE_ENABLED is set, reads then never
+look at the archive.
+"""
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.db.models import Max
+
+from . import cache
+from .models import ArchivedMessage, InboxEntry, UserMessage
+
+ARCHIVE_FIELDS = ('id', 'sender_id', 'body', 'body_type', 'msg_type', 'content_type_id',
+                  'object_id', 'created_at', 'updated_at',)
+NEWEST_KEY = 'message:archive:newest'
+
+
+def archivable(before):
+    latest = InboxEntry.objects.filter(last_message__isnull=False).values('last_message_id')
+    return (UserMessage.objects.filter(created_at__lt=before, attachment__isnull=True)
+            .exclude(id__in=latest))
+
+
+def archive_messages(before, batch_size=1000):
+    """Move live messages created before ``before`` to the archive, oldest first, returns how many."""
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(archivable(before).order_by('created_at', 'id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ArchivedMessage.objects.bulk_create(ArchivedMessage(**row) for row in rows)
+            # A plain DELETE: moving a message must not run the signals
+            # that take a deleted message out of inboxes.
+            batch = UserMessage.all_objects.filter(id__in=[row['id'] for row in rows])
+            batch._raw_delete(batch.db)
+            cache.invalidate_targets({(row['content_type_id'], row['object_id']) for row in rows})
+        moved += len(rows)
+    shared_cache.delete(NEWEST_KEY)
+    return moved
+
+
+def purge_deleted(before):
+    """Delete for good the messages soft deleted before ``before``, returns how many."""
+    _, counts = UserMessage.all_objects.filter(deleted_at__lt=before).delete()
+    return counts.get(UserMessage._meta.label, 0)
+
+
+def newest_archived():
+    """When the newest archived message was created, None while the archive is empty."""
+    newest = shared_cache.get(NEWEST_KEY)
+    if newest is None:
+        newest = ArchivedMessage.objects.aggregate(newest=Max('created_at'))['newest'] or ''
+        shared_cache.set(NEWEST_KEY, newest, None)
+    return newest or None
+
+
+def reaches_archive(oldest):
+    """Whether history going back past ``oldest`` (None: all of it) can include archived messages."""
+    if not getattr(settings, 'MESSAGE_ARCHIVE_ENABLED', False):
+        return False
+    newest = newest_archived()
+    return newest is not None and (oldest is None or oldest <= newest)
@@ -0,0 +1,105 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+_users = OrderedDict()
+_lock = threading.Lock()
+
+
+def load_user(user_id):
+    """
+    Fetch an active user, through a small per-process LRU of recently loaded
+    users sized by AUTH_USER_CACHE_SIZE and aged out after
+    AUTH_USER_CACHE_TTL seconds. Callers get their own copy to mutate.
+    """
+    size = getattr(settings, 'AUTH_USER_CACHE_SIZE', 256)
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] > now:
+            _users.move_to_end(user_id)
+            return copy.copy(entry[1])
+
+    user = User.objects.filter(id=user_id, is_active=True).first()
+    if user is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if size:
+        with _lock:
+            _users[user_id] = (now + getattr(settings, 'AUTH_USER_CACHE_TTL', 60), user)
+            _users.move_to_end(user_id)
+            while len(_users) > size:
+                _users.popitem(last=False)
+    return copy.copy(user)
+
+
+def forget_user(user_id):
+    with _lock:
+        _users.pop(user_id, None)
+
+
+class TokenClaimsUser(SimpleLazyObject):
+    """
+    A User built from the claims of a validated access token. The claims
+    answer ``id``, ``pk``, ``username`` and ``email`` directly, anything else
+    loads the real User on first use and is then served by it.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims, loader):
+        self.__dict__['_claims'] = claims
+        super().__init__(loader)
+
+    def __getattr__(self, name):
+        if self._wrapped is empty and name in self._claims:
+            return self._claims[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        # LazyObject would load the user, ``if request.user`` is everywhere.
+        return True
+
+    def __eq__(self, other):
+        if self._wrapped is empty:
+            return getattr(other, 'pk', None) == self._claims['pk'] and isinstance(other, User)
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self._claims['pk'])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the user claims embedded at login instead
+    of loading the user on every request. Polling endpoints that only need
+    the user's id authenticate without a query.
+
+    Deactivating a user is only noticed once a request needs the full user,
+    or when the access token expires. Permissions are never answered from
+    claims: ``is_staff`` and ``is_active`` come from the loaded user. The
+    process that saved the change forgets its copy at once, other processes
+    notice a demotion or deactivation once their copy is older than
+    AUTH_USER_CACHE_TTL.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        claims = {'id': user_id, 'pk': user_id}
+        for claim in ('username', 'email'):
+            if claim in validated_token:
+                claims[claim] = validated_token[claim]
+        return TokenClaimsUser(claims, lambda: load_user(user_id))
@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from . import inbox
+from .contenttypes import get_content_type
+from .models import Club, ClubUser, UserMessage, UserProfile
+
+WORDS = ('hello', 'meeting', 'tomorrow', 'lunch', 'the', 'a', 'deploy', 'review', 'thanks', 'ok',
+         'see', 'you', 'at', 'noon', 'shipping', 'release', 'coffee', 'weekend', 'plan', 'sounds', 'good')
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run a block in a transaction that is always rolled back, for seeding throwaway data."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@contextmanager
+def fast_hashing():
+    """Hash passwords with MD5 so seeding users doesn't dominate a run."""
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+        yield
+
+
+@contextmanager
+def unthrottled():
+    """Lift every throttle rate, a benchmark sends far more requests than any client may."""
+    rates = SimpleRateThrottle.THROTTLE_RATES
+    saved = dict(rates)
+    rates.update(dict.fromkeys(rates))
+    try:
+        yield
+    finally:
+        rates.update(saved)
+
+
+def seed_messaging(users=200, clubs=20, members=50, messages=100000, club_share=0.7,
+                   password='Passw0rd!', seed=0, batch_size=10000):
+    """
+    Seed users with profiles, clubs with memberships and ``messages`` messages,
+    ``club_share`` of them to clubs from their members and the rest direct
+    messages between users, in batches so millions fit in memory. The same
+    ``seed`` seeds the same data. Returns the users, profiles and clubs.
+    """
+    rng = random.Random(seed)
+    prefix = 'seed%s_' % seed
+    hashed = make_password(password)
+    User.objects.bulk_create(
+        (User(username='%s%s' % (prefix, i), email='%s%s@example.com' % (prefix, i), password=hashed)
+         for i in range(users)), batch_size=batch_size)
+    seeded_users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+    UserProfile.objects.bulk_create((UserProfile(user=user) for user in seeded_users), batch_size=batch_size)
+    profiles = list(UserProfile.objects.filter(user__in=seeded_users).order_by('user_id'))
+
+    seeded_clubs = Club.objects.bulk_create(
+        Club(owner=rng.choice(seeded_users), title='club %s' % i) for i in range(clubs))
+    memberships, club_members = [], {}
+    for club in seeded_clubs:
+        owner_profile = profiles[seeded_users.index(club.owner)]
+        chosen = {owner_profile.id: owner_profile}
+        chosen.update((profile.id, profile) for profile in rng.sample(profiles, min(members, len(profiles))))
+        club_members[club.id] = [profile.user_id for profile in chosen.values()]
+        memberships.extend(ClubUser(user=profile, club=club) for profile in chosen.values())
+    ClubUser.objects.bulk_create(memberships, batch_size=batch_size)
+
+    club_type, profile_type = get_content_type(Club), get_content_type(UserProfile)
+
+    def make_message():
+        body = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 30)))
+        if seeded_clubs and rng.random() < club_share:
+            club = rng.choice(seeded_clubs)
+            return UserMessage(sender_id=rng.choice(club_members[club.id]), body=body,
+                               content_type=club_type, object_id=club.id)
+        return UserMessage(sender=rng.choice(seeded_users), body=body,
+                           content_type=profile_type, object_id=rng.choice(profiles).id)
+
+    remaining = messages
+    while remaining > 0:
+        batch = [make_message() for _ in range(min(batch_size, remaining))]
+        UserMessage.objects.bulk_create(batch)
+        remaining -= len(batch)
+    # Inbox entries for the latest message of every target in the last batch.
+    latest = {}
+    for message in batch if messages else ():
+        latest[(message.content_type_id, message.object_id)] = message
+    inbox.record_messages(list(latest.values()))
+    return seeded_users, profiles, seeded_clubs
+
+
+def measure(func, repeat=20, warmup=2, budget=None):
+    """
+    Call ``func`` ``repeat`` times and summarise its latency in milliseconds
+    and throughput, the queries of one call and, when it returns a response,
+    its status and size. With a ``budget`` in seconds, calls stop once it is
+    spent, slow cases get fewer calls rather than holding up a run.
+    """
+    deadline = time.perf_counter() + budget if budget else None
+    for _ in range(warmup):
+        func()
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    with CaptureQueriesContext(connection) as queries:
+        result = func()
+    total = sum(timings)
+
+    timings.sort()
+    summary = {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'max_ms': round(timings[-1], 3),
+        'rps': round(len(timings) * 1000 / total, 1) if total else None,
+        'calls': len(timings),
+        'queries': len(queries),
+    }
+    if hasattr(result, 'status_code'):
+        summary['status'] = result.status_code
+    content = getattr(result, 'content', None)
+    if content is not None:
+        summary['bytes'] = len(content)
+    return summary
+
+
+def format_table(rows, columns):
+    """Render a list of dicts as a fixed-width text table."""
+    widths = [max(len(str(column)), *(len(str(row.get(column, ''))) for row in rows)) for column in columns]
+    lines = ['  '.join(str(column).ljust(width) for column, width in zip(columns, widths))]
+    for row in rows:
+        lines.append('  '.join(str(row.get(column, '')).ljust(width) for column, width in zip(columns, widths)))
+    return '\n'.join(lines)
@@ -0,0 +1,110 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .contenttypes import get_target_model
+from .models import Club, ClubUser, UserProfile
+from .replicas import reading_replica
+
+CLUB = 'club'
+USER = 'user'
+SENDER = 'sender'
+
+
+def version_key(kind, pk):
+    return 'message:%s:%s:version' % (kind, pk)
+
+
+def get_version(kind, pk):
+    key = version_key(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock, a version that was evicted must not start
+        # over and match representations cached under its old values.
+        cache.add(key, int(time.time() * 1000))
+        version = cache.get(key)
+    return version
+
+
+def sender_versions(user_ids):
+    """The current versions of users as message senders, {user id: version}."""
+    keys = {version_key(SENDER, user_id): user_id for user_id in user_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for user_id in set(keys.values()) - set(versions):
+        versions[user_id] = get_version(SENDER, user_id)
+    return versions
+
+
+def shown_senders(targets):
+    """Ids of the senders of the messages prefetched on clubs and profiles."""
+    return {message.sender_id for target in targets for message in getattr(target, '_prefetched_messages', ())}
+
+
+def cached_representation(kind, pk, build):
+    """
+    Return the serialized representation of an object from the cache, or
+    build and cache it. Entries are keyed by the object's current version so
+    a bump makes every older entry unreachable. ``build`` returns the
+    representation and the ids of the message senders it shows, whose
+    versions are kept with it: a sender who changed since gets it rebuilt.
+    """
+    key = 'representation:%s:%s:%s' % (kind, pk, get_version(kind, pk))
+    entry = cache.get(key)
+    if entry is not None:
+        data, senders = entry
+        if sender_versions(senders) == senders:
+            return data
+    data, senders = build()
+    timeout = getattr(settings, 'REPRESENTATION_CACHE_TIMEOUT', 300)
+    if reading_replica():
+        # Built from a replica that may not have the writes of this version yet.
+        timeout = min(timeout, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+    cache.set(key, (data, sender_versions(senders)), timeout)
+    return data
+
+
+def bump(kind, pks):
+    for pk in set(pks):
+        try:
+            cache.incr(version_key(kind, pk))
+        except ValueError:
+            get_version(kind, pk)
+
+
+def invalidate(clubs=(), users=(), senders=()):
+    """Bump versions once the current transaction commits."""
+    clubs, users, senders = set(clubs), set(users), set(senders)
+    if clubs or users or senders:
+        transaction.on_commit(lambda: (bump(CLUB, clubs), bump(USER, users), bump(SENDER, senders)))
+
+
+def profile_dependents(profile_ids):
+    """Users and clubs whose representation nests the given profiles."""
+    users = UserProfile.objects.filter(id__in=profile_ids).values_list('user_id', flat=True)
+    clubs = ClubUser.objects.filter(user__in=profile_ids).values_list('club_id', flat=True)
+    return set(users), set(clubs)
+
+
+def invalidate_targets(targets):
+    """Invalidate the clubs and profiles, as (content type id, object id), messages went to."""
+    clubs, profile_ids = set(), set()
+    for content_type_id, object_id in targets:
+        if get_target_model(content_type_id) is Club:
+            clubs.add(object_id)
+        else:
+            profile_ids.add(object_id)
+    users, member_clubs = profile_dependents(profile_ids) if profile_ids else ((), ())
+    invalidate(clubs=clubs | set(member_clubs), users=users)
+
+
+def invalidate_sender(user_id):
+    """
+    A user or profile changed, every representation showing them changes:
+    their own and their clubs', which nest the profile, and any showing
+    their messages, through their version as a sender.
+    """
+    profile_ids = UserProfile.objects.filter(user=user_id).values_list('id', flat=True)
+    users, clubs = profile_dependents(profile_ids)
+    invalidate(clubs=clubs, users=users | {user_id}, senders=[user_id])
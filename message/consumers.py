@@ -0,0 +1,72 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import StatelessJWTAuthentication
+from .events import group_name
+from .membership import is_member
+from .models import Club, UserProfile
+
+
+@database_sync_to_async
+def get_user(scope):
+    """Authenticate a websocket with the access token passed as ``?token=``."""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = query.get('token', [None])[0]
+    if token is None:
+        return None
+    authentication = StatelessJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, TokenError):
+        return None
+
+
+class MessageConsumer(AsyncJsonWebsocketConsumer):
+    group_name = None
+
+    async def connect(self):
+        self.user = await get_user(self.scope)
+        target = await self.get_target() if self.user is not None else None
+        # Without a channel layer nothing would ever be delivered.
+        if target is None or self.channel_layer is None:
+            await self.close()
+            return
+        self.group_name = group_name(target)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.group_name is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Messages are posted through the REST API, the socket only delivers them.
+        pass
+
+    async def message_created(self, event):
+        await self.send_json(event['message'])
+
+    async def get_target(self):
+        """The Club or UserProfile the user subscribes to, None to refuse the connection."""
+        return None
+
+
+class ClubMessageConsumer(MessageConsumer):
+
+    @database_sync_to_async
+    def get_target(self):
+        club_id = self.scope['url_route']['kwargs']['club_id']
+        if not is_member(self.user, club_id):
+            return None
+        return Club.objects.filter(id=club_id).first()
+
+
+class UserMessageConsumer(MessageConsumer):
+
+    @database_sync_to_async
+    def get_target(self):
+        user_id = self.scope['url_route']['kwargs']['user_id']
+        return UserProfile.objects.filter(id=user_id, user=self.user.id).first()
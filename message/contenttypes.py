@@ -0,0 +1,77 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_migrate
+
+# The models a message can be addressed to, with the label the API uses for them.
+TARGET_LABELS = {
+    'message.Club': 'club',
+    'message.UserProfile': 'user',
+}
+
+_content_types = {}
+_models = {}
+_labels = {}
+_label_models = {}
+
+
+def load():
+    """
+    Resolve the ContentType of every message target model with a single
+    query and keep the mapping for the life of the process.
+    """
+    if _content_types:
+        return
+    models = {apps.get_model(name): label for name, label in TARGET_LABELS.items()}
+    content_types = ContentType.objects.get_for_models(*models)
+    for model, content_type in content_types.items():
+        _models[content_type.id] = model
+        _labels[content_type.id] = models[model]
+        _label_models[models[model]] = model
+    # Filled last, it doubles as the "loaded" flag for other threads.
+    _content_types.update(content_types)
+
+
+def clear(**kwargs):
+    _content_types.clear()
+    _models.clear()
+    _labels.clear()
+    _label_models.clear()
+
+
+# Migrating or flushing the database can give content types new ids.
+post_migrate.connect(clear, dispatch_uid='message.contenttypes.clear')
+
+
+def get_content_type(model):
+    load()
+    content_type = _content_types.get(model)
+    if content_type is None:
+        return ContentType.objects.get_for_model(model)
+    return content_type
+
+
+def get_target_model(content_type_id):
+    load()
+    return _models[content_type_id]
+
+
+def get_target_label(content_type_id):
+    load()
+    return _labels[content_type_id]
+
+
+def get_label_model(label):
+    load()
+    return _label_models[label]
+
+
+
+def hydrate_targets(messages):
+    """
+    Fill ``content_object`` on a list of messages addressed to a mix of
+    clubs and profiles with one query per target model, not one per message.
+    """
+    load()
+    prefetch_related_objects(list(messages), 'content_object')
+    return messages
@@ -0,0 +1,25 @@
+"""
+Health checks for persistent database connections.
+
+With CONN_MAX_AGE above 0 a worker thread keeps its database connection
+between requests and skips the connection setup (TCP, TLS, authentication,
+a backend process on PostgreSQL) on each. A kept connection can die in
+between: the server restarted, a pooler or firewall dropped it. Databases
+with CONN_HEALTH_CHECKS get a round trip before a request reuses their
+connection, and a new connection when it fails instead of a failed request.
+Django does this itself from 4.1 on, the check only runs on older versions.
+"""
+import django
+from django.db import connections
+
+BUILTIN_HEALTH_CHECKS = django.VERSION >= (4, 1)
+
+
+def check_connections():
+    """Close the kept connections that stopped working, the next query opens a new one."""
+    if BUILTIN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None
+                and not connection.in_atomic_block and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,18 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def group_name(target):
+    """Channel layer group of the connections subscribed to a Club or UserProfile."""
+    return '%s.%s' % (target._meta.model_name, target.id)
+
+
+def broadcast_message(target, data):
+    """Push a serialized message to every connection subscribed to its target."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group_name(target), {
+        'type': 'message.created',
+        'message': data,
+    })
@@ -0,0 +1,66 @@
+import heapq
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .archive import reaches_archive
+from .contenttypes import get_content_type, get_target_label
+from .models import UserMessage, UserProfile
+from .pagination import encode_position
+
+EXPORT_FIELDS = ('id', 'sender_id', 'body', 'body_type', 'msg_type', 'content_type_id',
+                 'object_id', 'created_at', 'updated_at',)
+CHUNK_SIZE = 2000
+
+
+def club_history(club, model=UserMessage):
+    return model.objects.filter_by_instance(club)
+
+
+def user_history(user, model=UserMessage):
+    """Everything a user sent plus everything addressed to their profile."""
+    profiles = UserProfile.objects.filter(user=user).values('id')
+    received = Q(content_type=get_content_type(UserProfile), object_id__in=profiles)
+    return model.objects.filter(Q(sender=user) | received)
+
+
+def history_rows(queryset, position, chunk_size):
+    queryset = queryset.order_by('created_at', 'id')
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+    return queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def export_rows(queryset, position=None, chunk_size=CHUNK_SIZE, archived=None):
+    """
+    Iterate messages oldest first as plain dicts, resuming after a decoded
+    cursor position. Rows come from a server-side cursor in chunks, without
+    building model instances, so memory stays flat however long the history.
+    ``archived`` messages, when the archive is in use, are merged in order.
+    """
+    rows = history_rows(queryset, position, chunk_size)
+    if archived is not None and reaches_archive(None):
+        rows = heapq.merge(history_rows(archived, position, chunk_size), rows,
+                           key=lambda row: (row['created_at'], row['id']))
+    for row in rows:
+        row['target_type'] = get_target_label(row.pop('content_type_id'))
+        row['cursor'] = encode_position(row['created_at'], row['id'])
+        yield row
+
+
+def ndjson(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield (encoder.encode(row) + '\n').encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of byte strings incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,131 @@
+"""
+Sparse fieldsets and expansions for the API serializers.
+
+``?fields=id,body,sender.username`` limits a response to the named fields,
+a dotted name selects inside a nested object and a bare one keeps it whole.
+``?expand=owner`` renders a related object in full where it is otherwise
+given by its id. Both apply to reads, input is validated against every field.
+
+Renderers with ``native_values`` (MessagePack) get representations with
+datetimes and UUIDs left as they are, for the renderer to encode.
+"""
+import sys
+
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from .metrics import timed_serialization
+
+# Fields whose representation is a string the native renderers can do without.
+NATIVE_FIELDS = (serializers.DateTimeField, serializers.UUIDField)
+
+
+def parse(value):
+    """Turn ``'id,sender.username'`` into ``{'id': {}, 'sender': {'username': {}}}``."""
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def request_fieldsets(request):
+    """The ``fields`` and ``expand`` trees of a request, ``fields`` is None when absent."""
+    if request is None:
+        return None, {}
+    return (parse(request.query_params.get('fields')),
+            parse(request.query_params.get('expand')) or {})
+
+
+def native_values(request):
+    return getattr(getattr(request, 'accepted_renderer', None), 'native_values', False)
+
+
+def wants(fieldset, name):
+    return fieldset is None or name in fieldset
+
+
+def subset(fieldset, name):
+    """The fieldset of a nested object, None (everything) unless narrowed."""
+    if fieldset is None:
+        return None
+    return fieldset.get(name) or None
+
+
+class FieldsetMixin:
+    """
+    Serializer support for ``fields`` and ``expand``. The top-level
+    serializer reads them from the request in its context, nested ones are
+    handed their part by their parent: declared nested serializers through
+    ``get_fields``, those built in method fields through ``nested``.
+
+    ``expandable_fields`` maps a field to the serializer (or its name in the
+    serializer's module) that renders it when expanded.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, native=None, **kwargs):
+        # Set first, some serializers build their fields while initializing.
+        request = (kwargs.get('context') or {}).get('request')
+        if fields is None and expand is None:
+            fields, expand = request_fieldsets(request)
+        self.fieldset = fields
+        self.expansions = expand or {}
+        self.native = native_values(request) if native is None else native
+        super().__init__(*args, **kwargs)
+
+    def nested(self, name):
+        """Keyword arguments narrowing a serializer built for field ``name``."""
+        return {'fields': subset(self.fieldset, name), 'expand': self.expansions.get(name, {}),
+                'native': self.native}
+
+    @timed_serialization
+    def to_representation(self, instance):
+        if not self.native:
+            return super().to_representation(instance)
+        # A plain dict, with datetimes and UUIDs passed through unconverted.
+        data = {}
+        for field in self._readable_fields:
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            if attribute is None or (isinstance(attribute, PKOnlyObject) and attribute.pk is None):
+                data[field.field_name] = None
+            elif isinstance(field, NATIVE_FIELDS):
+                data[field.field_name] = attribute
+            else:
+                data[field.field_name] = field.to_representation(attribute)
+        return data
+
+    def expandable(self, name):
+        """The serializer class rendering field ``name`` when expanded."""
+        serializer_class = self.expandable_fields[name]
+        if isinstance(serializer_class, str):
+            serializer_class = getattr(sys.modules[type(self).__module__], serializer_class)
+        return serializer_class
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.expandable_fields:
+            if name in self.expansions and name in fields:
+                fields[name] = self.expandable(name)(read_only=True)
+
+        if self.fieldset is not None and not hasattr(self.root, 'initial_data'):
+            for name in list(fields):
+                if name not in self.fieldset:
+                    del fields[name]
+
+        for name, field in fields.items():
+            if isinstance(field, serializers.ListSerializer):
+                field = field.child
+            if isinstance(field, FieldsetMixin):
+                field.fieldset = subset(self.fieldset, name)
+                field.expansions = self.expansions.get(name, {})
+                field.native = self.native
+        return fields
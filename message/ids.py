@@ -0,0 +1,60 @@
+"""
+Time-ordered UUIDs, version 7 of RFC 9562: 48 bits of Unix time in
+milliseconds, then random bits. New rows land at the right edge of a
+primary key index instead of anywhere in it like uuid4 ids do, and an id
+tells when its row was made.
+
+Ids made by one process in the same millisecond still increase: the 12 bits
+after the version count up from a random start. Rows keep uuid4 ids made
+before, both kinds are valid ids, only version 7 ones carry a time.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+COUNTER_MAX = 0xfff
+
+_lock = threading.Lock()
+_last = {'ms': 0, 'counter': 0}
+
+
+def uuid7():
+    with _lock:
+        ms = time.time_ns() // 1000000
+        if ms > _last['ms']:
+            # Start low enough that a busy millisecond doesn't run out.
+            counter = random.getrandbits(11)
+        else:
+            # The same millisecond, or the clock went back: stay after the last id.
+            ms, counter = _last['ms'], _last['counter'] + 1
+            if counter > COUNTER_MAX:
+                ms, counter = ms + 1, random.getrandbits(11)
+        _last['ms'], _last['counter'] = ms, counter
+    tail = int.from_bytes(os.urandom(8), 'big') & (1 << 62) - 1
+    return uuid.UUID(int=ms << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | tail)
+
+
+def uuid7_time(value):
+    """When a version 7 id was made, None for any other id."""
+    try:
+        value = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except ValueError:
+        return None
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp(0, dt_timezone.utc) + timedelta(milliseconds=value.int >> 80)
+
+
+def created_bounds(value):
+    """
+    Filter arguments bounding created_at to the millisecond a version 7 id
+    was made in, none for other ids. Only valid for models whose created_at
+    is taken from their id, see ``models.CreatedAtField``.
+    """
+    created_at = uuid7_time(value)
+    if created_at is None:
+        return {}
+    return {'created_at__gte': created_at, 'created_at__lt': created_at + timedelta(milliseconds=1)}
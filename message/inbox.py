@@ -0,0 +1,215 @@
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import Case, F, Q, Value, When
+
+from .contenttypes import get_content_type
+from .models import Club, ClubUser, InboxEntry, UserMessage, UserProfile
+
+PREVIEW_LENGTH = 100
+
+
+def preview(message):
+    return (message.body or '')[:PREVIEW_LENGTH]
+
+
+def conversation_keys(messages):
+    """
+    Pair each message with the inbox keys, (user id, content type id, object
+    id), of the conversation it belongs to.
+
+    A club message lands in every member's inbox under the club. A direct
+    message lands in the recipient's inbox under the sender's profile and in
+    the sender's inbox under the recipient's profile.
+    """
+    club_type = get_content_type(Club)
+    profile_type = get_content_type(UserProfile)
+    club_ids = {m.object_id for m in messages if m.content_type_id == club_type.id}
+    direct = [m for m in messages if m.content_type_id == profile_type.id]
+
+    members = defaultdict(list)
+    if club_ids:
+        for club_id, user_id in ClubUser.objects.filter(club__in=club_ids).values_list(
+                'club_id', 'user__user_id'):
+            members[club_id].append(user_id)
+
+    profile_users, user_profiles = {}, {}
+    if direct:
+        profiles = UserProfile.objects.filter(
+            Q(id__in={m.object_id for m in direct}) | Q(user__in={m.sender_id for m in direct}))
+        for profile_id, user_id in profiles.values_list('id', 'user_id'):
+            profile_users[profile_id] = user_id
+            user_profiles[user_id] = profile_id
+
+    pairs = []
+    for message in messages:
+        keys = []
+        if message.content_type_id == club_type.id:
+            keys = [(user_id, club_type.id, message.object_id) for user_id in members[message.object_id]]
+        elif message.object_id in profile_users and message.sender_id in user_profiles:
+            keys = list(dict.fromkeys([
+                (profile_users[message.object_id], profile_type.id, user_profiles[message.sender_id]),
+                (message.sender_id, profile_type.id, message.object_id),
+            ]))
+        pairs.append((message, keys))
+    return pairs
+
+
+def by_target(keys):
+    """Group inbox keys by target: {(content type id, object id): user ids}."""
+    targets = defaultdict(set)
+    for user_id, content_type_id, object_id in keys:
+        targets[content_type_id, object_id].add(user_id)
+    return targets
+
+
+def target_entries(content_type_id, object_id, user_ids):
+    return InboxEntry.objects.filter(content_type=content_type_id, object_id=object_id, user__in=user_ids)
+
+
+def upsert_entries(rows):
+    """
+    Insert inbox entries, (user id, content type id, object id, latest
+    message, unread count, last read at) rows, in one statement per batch.
+    An entry a concurrent writer created first takes the new message too,
+    unless it already shows a later one: rows read up to last_read_at set
+    its unread count, the others add theirs.
+    """
+    fields = [InboxEntry._meta.get_field(name) for name in (
+        'user', 'content_type', 'object_id', 'last_message', 'last_message_at', 'preview',
+        'unread_count', 'last_read_at')]
+    connection = connections[router.db_for_write(InboxEntry)]
+    qn = connection.ops.quote_name
+    names = dict({field.name: qn(field.column) for field in fields}, table=qn(InboxEntry._meta.db_table))
+    # Writers may commit out of order, the latest message shown is kept.
+    names['newer'] = 'excluded.%(last_message_at)s >= %(table)s.%(last_message_at)s' % names
+    upsert = (
+        'INSERT INTO %(table)s ({columns}) VALUES {values} '
+        'ON CONFLICT (%(user)s, %(content_type)s, %(object_id)s) DO UPDATE SET '
+        '%(last_message)s = CASE WHEN %(newer)s '
+        'THEN excluded.%(last_message)s ELSE %(table)s.%(last_message)s END, '
+        '%(last_message_at)s = CASE WHEN %(newer)s '
+        'THEN excluded.%(last_message_at)s ELSE %(table)s.%(last_message_at)s END, '
+        '%(preview)s = CASE WHEN %(newer)s THEN excluded.%(preview)s ELSE %(table)s.%(preview)s END, '
+        '%(unread_count)s = CASE WHEN excluded.%(last_read_at)s IS NULL '
+        'THEN %(table)s.%(unread_count)s + excluded.%(unread_count)s ELSE excluded.%(unread_count)s END, '
+        '%(last_read_at)s = COALESCE(excluded.%(last_read_at)s, %(table)s.%(last_read_at)s)' % names)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    batch_size = connection.ops.bulk_batch_size(fields, rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            values = []
+            for user_id, content_type_id, object_id, latest, unread, read_at in batch:
+                row = (user_id, content_type_id, object_id, latest.id, latest.created_at, preview(latest),
+                       unread, read_at)
+                values.extend(field.get_db_prep_save(value, connection) for field, value in zip(fields, row))
+            cursor.execute(upsert.format(columns=', '.join(qn(field.column) for field in fields),
+                                         values=', '.join([placeholders] * len(batch))), values)
+
+
+def record_messages(messages):
+    """
+    Fold newly created messages into the inbox entries of their
+    conversations. Every member of a target gets the same messages, so the
+    entries of the readers move in one UPDATE per target however many they
+    are, only their senders and entries yet to exist are written row by row.
+    """
+    grouped = defaultdict(list)
+    for message, keys in conversation_keys(messages):
+        for key in keys:
+            grouped[key].append(message)
+
+    batches = defaultdict(set)
+    groups = {}
+    for (user_id, content_type_id, object_id), group in grouped.items():
+        group.sort(key=lambda message: (message.created_at, message.id))
+        ids = tuple(message.id for message in group)
+        groups[ids] = group
+        batches[content_type_id, object_id, ids].add(user_id)
+
+    rows = []
+    for (content_type_id, object_id, ids), user_ids in batches.items():
+        group = groups[ids]
+        latest = group[-1]
+        readers = set()
+        for user_id in user_ids:
+            own = [index for index, message in enumerate(group) if message.sender_id == user_id]
+            if own:
+                # Writing to a conversation reads everything before it.
+                rows.append((user_id, content_type_id, object_id, latest, len(group) - own[-1] - 1,
+                             group[own[-1]].created_at))
+            else:
+                readers.add(user_id)
+        if not readers:
+            continue
+
+        existing = set(target_entries(content_type_id, object_id, readers).values_list('user_id', flat=True))
+        if existing:
+            # Entries a writer committing ahead of this one moved past ``latest`` keep their message.
+            newer = Q(last_message_at__lte=latest.created_at)
+            target_entries(content_type_id, object_id, existing).update(
+                last_message=Case(When(newer, then=Value(latest.id)), default=F('last_message'),
+                                  output_field=InboxEntry._meta.get_field('last_message')),
+                last_message_at=Case(When(newer, then=Value(latest.created_at)), default=F('last_message_at')),
+                preview=Case(When(newer, then=Value(preview(latest))), default=F('preview')),
+                unread_count=F('unread_count') + len(group))
+        rows.extend((user_id, content_type_id, object_id, latest, len(group), None)
+                    for user_id in readers - existing)
+
+    if rows:
+        upsert_entries(rows)
+
+
+def forget_message(message):
+    """
+    Take a deleted message out of its inbox entries. Runs after the delete,
+    once SET_NULL has cleared the entries that pointed at it.
+    """
+    [(_, keys)] = conversation_keys([message])
+    if not keys:
+        return
+
+    remaining = UserMessage.objects.filter(content_type=message.content_type_id)
+    if message.content_type_id == get_content_type(UserProfile).id:
+        recipient_id, _, sender_profile_id = keys[0]
+        remaining = remaining.filter(Q(sender=message.sender_id, object_id=message.object_id) |
+                                     Q(sender=recipient_id, object_id=sender_profile_id))
+    else:
+        remaining = remaining.filter(object_id=message.object_id)
+    latest = missing = object()
+
+    for (content_type_id, object_id), user_ids in by_target(keys).items():
+        entries = target_entries(content_type_id, object_id, user_ids)
+        entries.exclude(user=message.sender_id).filter(
+            Q(last_read_at=None) | Q(last_read_at__lt=message.created_at), unread_count__gt=0,
+        ).update(unread_count=F('unread_count') - 1)
+
+        emptied = entries.filter(last_message=None)
+        if not emptied.exists():
+            continue
+        if latest is missing:
+            latest = remaining.order_by('-created_at', '-id').first()
+        if latest is None:
+            emptied.delete()
+        else:
+            emptied.update(last_message=latest, last_message_at=latest.created_at, preview=preview(latest))
+
+
+def forget_soft_deleted(message):
+    """Take a soft deleted message out of its inbox entries, as deleting it would."""
+    InboxEntry.objects.filter(last_message=message).update(last_message=None)
+    forget_message(message)
+
+
+def forget_target(target):
+    """Drop every inbox entry of a deleted club or profile."""
+    content_type = get_content_type(target.__class__)
+    InboxEntry.objects.filter(content_type=content_type, object_id=target.id).delete()
+
+
+def forget_membership(club_user):
+    """Drop the club's entry from the inbox of a member who left."""
+    content_type = get_content_type(Club)
+    InboxEntry.objects.filter(user__userprofile=club_user.user_id, content_type=content_type,
+                              object_id=club_user.club_id).delete()
@@ -0,0 +1,104 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MediaJob
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the job task ``name``, called with the job's key."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, key, delay=0):
+    """
+    Queue a job. It is a row in the current transaction, so a job for an
+    object created in a transaction that rolls back is never run.
+    """
+    return MediaJob.objects.create(task=name, key=str(key),
+                                   run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def due(now):
+    return (Q(status=MediaJob.PENDING, run_after__lte=now) |
+            Q(status=MediaJob.RUNNING, locked_until__lt=now))
+
+
+def claim():
+    """
+    Take the next due job, or None. Candidates are claimed with a
+    conditional update, so of several workers racing for a job one wins and
+    the others move on to the next candidate.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'MEDIA_JOB_LEASE', 300))
+    candidates = MediaJob.objects.filter(due(now)).order_by('run_after').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = MediaJob.objects.filter(due(now), id=job_id).update(
+            status=MediaJob.RUNNING, locked_until=now + lease, attempts=F('attempts') + 1)
+        if claimed:
+            return MediaJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job. Failures are retried with exponential backoff up to MEDIA_JOB_MAX_ATTEMPTS."""
+    try:
+        TASKS[job.task](job.key)
+    except Exception:
+        logger.exception('Media job %s failed.', job)
+        job.error = traceback.format_exc()
+        if job.attempts >= getattr(settings, 'MEDIA_JOB_MAX_ATTEMPTS', 5):
+            job.status = MediaJob.FAILED
+        else:
+            job.status = MediaJob.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts * 5)
+        job.locked_until = None
+        job.save(update_fields=['status', 'run_after', 'locked_until', 'error'])
+    else:
+        job.delete()
+
+
+def run_pending():
+    """Run due jobs in this thread until none is left, returns how many ran."""
+    count = 0
+    job = claim()
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim()
+    return count
+
+
+def work(stop, poll_interval=1.0):
+    """Run jobs until the ``stop`` event is set, waiting ``poll_interval`` seconds when idle."""
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            if not run_pending():
+                stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def start_workers(count, poll_interval=1.0):
+    """Start a pool of ``count`` worker threads, returns the event stopping them and the threads."""
+    stop = threading.Event()
+    threads = [threading.Thread(target=work, args=(stop, poll_interval), name='media-worker-%s' % i, daemon=True)
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return stop, threads
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from message.archive import archive_messages, purge_deleted
+
+
+class Command(BaseCommand):
+    help = ('Purge messages deleted longer ago than MESSAGE_DELETED_RETENTION and, with '
+            'MESSAGE_ARCHIVE_ENABLED, move messages older than MESSAGE_ARCHIVE_AFTER to the archive.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'MESSAGE_ARCHIVE_BATCH_SIZE', 1000),
+                            help='Messages moved per transaction.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        retention = getattr(settings, 'MESSAGE_DELETED_RETENTION', timedelta(days=30))
+        self.stdout.write('Purged %s deleted message(s).' % purge_deleted(now - retention))
+        if getattr(settings, 'MESSAGE_ARCHIVE_ENABLED', False):
+            before = now - getattr(settings, 'MESSAGE_ARCHIVE_AFTER', timedelta(days=365))
+            moved = archive_messages(before, options['batch_size'])
+            self.stdout.write('Archived %s message(s).' % moved)
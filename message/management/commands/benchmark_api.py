@@ -0,0 +1,189 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from collections import namedtuple
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from message.benchmark import fast_hashing, format_table, measure, rolled_back, seed_messaging, unthrottled
+from message.models import Club, ClubUser, InboxEntry, MediaUpload, UserMessage
+from message.uploads import complete_upload, write_chunk
+
+PASSWORD = 'Passw0rd!'
+MEDIA = os.urandom(256 * 1024)
+COLUMNS = ('endpoint', 'status', 'calls', 'p50_ms', 'p95_ms', 'max_ms', 'rps', 'queries', 'bytes')
+
+# A streamed response, read to the end inside the timing.
+Drained = namedtuple('Drained', ('status_code', 'content'))
+
+
+def drain(response):
+    if response.streaming:
+        return Drained(response.status_code, b''.join(response.streaming_content))
+    return response
+
+
+class Command(BaseCommand):
+    help = ('Seed a realistic data set and drive every messaging API endpoint in-process, reporting '
+            'latency percentiles, throughput and SQL queries per endpoint. Seeded data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--clubs', type=int, default=20)
+        parser.add_argument('--members', type=int, default=50, help='Members per club.')
+        parser.add_argument('--messages', type=int, default=100000, help='Messages to seed, millions work.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed seeds the same data.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per endpoint.')
+        parser.add_argument('--budget', type=float, default=10.0,
+                            help='Seconds after which an endpoint stops being called again.')
+        parser.add_argument('--only', help='Only endpoints whose name contains this.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='A previous --output file to compare against.')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        results = []
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(MEDIA_ROOT=os.path.join(directory, 'media'),
+                                  MEDIA_UPLOAD_DIR=os.path.join(directory, 'uploads')), \
+                fast_hashing(), unthrottled(), rolled_back():
+            users, profiles, clubs = seed_messaging(
+                users=options['users'], clubs=options['clubs'], members=options['members'],
+                messages=options['messages'], password=PASSWORD, seed=options['seed'])
+            self.stderr.write('Seeded %s users, %s clubs, %s messages.' % (
+                len(users), len(clubs), options['messages']))
+            client = APIClient()
+            for name, func in self.cases(client, clubs[0]):
+                if options['only'] and options['only'] not in name:
+                    continue
+                try:
+                    with transaction.atomic():
+                        result = measure(func, repeat=self.repeat, budget=options['budget'])
+                except Exception as exc:
+                    result = {'error': '%s: %s' % (type(exc).__name__, exc)}
+                results.append(dict(result, endpoint=name))
+                self.stderr.write('%s: %s ms' % (name, result.get('p50_ms')))
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                compare(results, json.load(baseline)['results'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in
+                                       ('users', 'clubs', 'members', 'messages', 'seed', 'repeat', 'budget')},
+                           'results': results}, output, indent=2)
+        columns = COLUMNS + (('p50_change', 'query_change') if options['baseline'] else ()) + ('error',)
+        self.stdout.write(format_table(results, columns))
+
+    def pool(self, factory):
+        """Objects for calls that use one up, made before the timing starts."""
+        return iter([factory(i) for i in range(self.repeat + 3)])
+
+    def cases(self, client, club):
+        """(name, call) of every endpoint, the client authenticated as the club's owner."""
+        owner = club.owner
+        client.force_authenticate(owner)
+        member_ids = list(club.clubuser_set.values_list('user_id', flat=True))
+        peer = next(profile_id for profile_id in member_ids if profile_id != owner.userprofile.id)
+        message = UserMessage.objects.create(sender=owner, body='benchmark', content_object=club)
+        counter = itertools.count()
+
+        def url(name, *args):
+            return reverse('messages:%s' % name, args=args)
+
+        token = str(AccessToken.for_user(owner))
+        yield 'POST token/verify', lambda: client.post(url('verify'), {'token': token})
+
+        def register():
+            i = next(counter)
+            return client.post(url('register'), {
+                'username': 'benchapi%s' % i, 'email': 'benchapi%s@example.com' % i, 'password': PASSWORD})
+
+        yield 'POST register', register
+        credentials = {'username': owner.username, 'password': PASSWORD}
+        yield 'POST login', lambda: client.post(url('login'), credentials)
+
+        yield 'GET users', lambda: client.get(url('users-info'))
+        yield 'GET users/<id>', lambda: client.get(url('user-info', owner.id))
+        yield 'PATCH users/<id>', lambda: client.patch(url('user-info', owner.id), {'about': 'benchmarking'})
+        doomed = self.pool(lambda i: User.objects.create_user(username='benchdel%s' % i, password=PASSWORD).id)
+        yield 'DELETE users/<id>', lambda: client.delete(url('user-info', next(doomed)))
+
+        yield 'GET clubs', lambda: client.get(url('clubs'))
+        yield 'GET clubs?expand=owner', lambda: client.get(url('clubs'), {'expand': 'owner'})
+        yield 'POST clubs', lambda: client.post(url('clubs'), {'title': 'bench %s' % next(counter)})
+        yield 'GET clubs/<id>', lambda: client.get(url('club', club.id))
+        yield 'PATCH clubs/<id>', lambda: client.patch(url('club', club.id), {'about': 'benchmarking'})
+        doomed_clubs = self.pool(lambda i: ClubUser.objects.create(
+            user=owner.userprofile, club=Club.objects.create(owner=owner, title='doomed %s' % i)).club_id)
+        yield 'DELETE clubs/<id>', lambda: client.delete(url('club', next(doomed_clubs)))
+
+        yield 'GET groups/users/list', lambda: client.get(url('list-groups'))
+        outsiders = self.pool(lambda i: User.objects.create_user(
+            username='benchjoin%s' % i, password=PASSWORD).userprofile.id)
+        yield 'POST groups/users/<club>/<user>', lambda: client.post(url('post-groups', club.id, next(outsiders)))
+        yield 'GET groups/<club>', lambda: client.get(url('group', club.id))
+
+        yield 'GET inbox', lambda: client.get(url('inbox'))
+        entry = InboxEntry.objects.filter(user=owner).first() or InboxEntry.objects.create(
+            user=owner, content_type=message.content_type, object_id=club.id, last_message_at=message.created_at)
+        yield 'POST inbox/<id>/read', lambda: client.post(url('inbox-read', entry.id))
+
+        yield 'GET messages/clubs/<id>', lambda: client.get(url('message-group', club.id))
+        yield 'GET messages/clubs/<id> msgpack', lambda: client.get(url('message-group', club.id),
+                                                                    HTTP_ACCEPT='application/msgpack')
+        yield 'GET messages/clubs/<id>?fields', lambda: client.get(url('message-group', club.id),
+                                                                   {'fields': 'id,body,created_at'})
+        yield 'POST messages/clubs/<id>', lambda: client.post(url('message-group', club.id), {'body': 'bench'})
+        yield 'GET messages/users/<id>', lambda: client.get(url('message-user', peer))
+        yield 'POST messages/users/<id>', lambda: client.post(url('message-user', peer), {'body': 'bench'})
+        yield 'GET messages/export/clubs/<id>', lambda: drain(client.get(url('export-club', club.id)))
+        yield 'GET messages/export/users/<id>', lambda: drain(client.get(url('export-user', owner.id)))
+        yield 'GET messages/search', lambda: client.get(url('message-search'), {'q': 'lunch tomorrow'})
+        items = [{'body': 'bulk %s' % i, 'target_type': 'club', 'target_id': str(club.id)} for i in range(100)]
+        yield 'POST messages/bulk (100)', lambda: client.post(url('message-bulk'), items)
+
+        upload = {'target_type': 'club', 'target_id': str(club.id), 'body_type': 'AUDIO', 'filename': 'b.wav',
+                  'mime_type': 'audio/wav', 'size': len(MEDIA), 'checksum': hashlib.sha256(MEDIA).hexdigest()}
+        yield 'POST messages/uploads', lambda: client.post(url('message-uploads'), upload)
+        upload_id = client.post(url('message-uploads'), upload).data['id']
+        yield 'GET messages/uploads/<id>', lambda: client.get(url('message-upload', upload_id))
+        uploads = self.pool(lambda i: client.post(url('message-uploads'), upload).data['id'])
+        yield 'PUT messages/uploads/<id> (256KB)', lambda: client.put(
+            url('message-upload', next(uploads)), MEDIA, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE='bytes 0-%s/%s' % (len(MEDIA) - 1, len(MEDIA)))
+        uploads = self.pool(lambda i: client.post(url('message-uploads'), upload).data['id'])
+        yield 'DELETE messages/uploads/<id>', lambda: client.delete(url('message-upload', next(uploads)))
+
+        media = MediaUpload.objects.get(id=client.post(url('message-uploads'), upload).data['id'])
+        write_chunk(media, BytesIO(MEDIA), 0, len(MEDIA))
+        media = complete_upload(media).id
+        yield 'GET messages/<id>/media', lambda: drain(client.get(url('message-media', media)))
+        yield 'GET messages/<id>/media range', lambda: drain(client.get(url('message-media', media),
+                                                                         HTTP_RANGE='bytes=0-65535'))
+
+        yield 'GET messages/<id>', lambda: client.get(url('message', message.id))
+        yield 'PATCH messages/<id>', lambda: client.patch(url('message', message.id), {'body': 'edited'})
+        doomed_messages = self.pool(lambda i: UserMessage.objects.create(
+            sender=owner, body='doomed', content_object=club).id)
+        yield 'DELETE messages/<id>', lambda: client.delete(url('message', next(doomed_messages)))
+
+
+def compare(results, baseline):
+    """Annotate results with their change from a baseline run of the same endpoints."""
+    previous = {row['endpoint']: row for row in baseline}
+    for row in results:
+        before = previous.get(row['endpoint'])
+        if not before or 'p50_ms' not in row or 'p50_ms' not in before:
+            continue
+        row['p50_change'] = '%+.0f%%' % ((row['p50_ms'] / before['p50_ms'] - 1) * 100) if before['p50_ms'] else ''
+        row['query_change'] = '%+d' % (row['queries'] - before['queries'])
@@ -0,0 +1,124 @@
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from message.benchmark import fast_hashing, format_table, measure, seed_messaging, unthrottled
+from message.models import Club, InboxEntry, UserMessage
+
+MODES = (
+    ('per request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': False}),
+    ('persistent+checks', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+)
+COLUMNS = ('mode', 'endpoint', 'status', 'calls', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'rps', 'queries')
+
+Served = namedtuple('Served', ('status_code', 'content'))
+
+
+@contextmanager
+def connection_settings(overrides):
+    """Connect with other settings for a while, starting from a closed connection."""
+    saved = {key: connection.settings_dict.get(key) for key in overrides}
+    connection.close()
+    connection.settings_dict.update(overrides)
+    try:
+        yield
+    finally:
+        connection.close()
+        connection.settings_dict.update(saved)
+
+
+@contextmanager
+def seeded(**options):
+    """
+    Seed committed data, requests on new connections must see it, and delete
+    it afterwards.
+    """
+    users, profiles, clubs = seed_messaging(**options)
+    try:
+        yield users, profiles, clubs
+    finally:
+        with transaction.atomic():
+            InboxEntry.objects.filter(user__in=users).delete()
+            # Without the per message signals, every inbox they touch is gone.
+            messages = UserMessage.all_objects.filter(sender__in=users)
+            messages._raw_delete(messages.db)
+            Club.objects.filter(owner__in=users).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+class Command(BaseCommand):
+    help = ('Compare a database connection per request with persistent connections, with and without '
+            'health checks, on the message endpoints. Requests go through the WSGI handler like under '
+            'gunicorn, connections are closed or kept the way they are in production. Seeds committed '
+            'data and deletes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--clubs', type=int, default=5)
+        parser.add_argument('--members', type=int, default=20, help='Members per club.')
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=200, help='Timed requests per endpoint and mode.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = []
+        with fast_hashing(), unthrottled(), seeded(users=options['users'], clubs=options['clubs'],
+                                                    members=options['members'], messages=options['messages'],
+                                                    seed=7) as (users, profiles, clubs):
+            cases = list(self.cases(clubs[0]))
+            for mode, overrides in MODES:
+                with connection_settings(overrides):
+                    for name, call in cases:
+                        result = measure(call, repeat=options['repeat'], warmup=5)
+                        results.append(dict(result, mode=mode, endpoint=name))
+                        self.stderr.write('%s, %s: %s ms' % (mode, name, result['p50_ms']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, COLUMNS))
+
+    def cases(self, club):
+        """(name, call) of message endpoints, as the club's owner."""
+        owner = club.owner
+        member_ids = list(club.clubuser_set.values_list('user_id', flat=True))
+        peer = next(profile_id for profile_id in member_ids if profile_id != owner.userprofile.id)
+        message = UserMessage.objects.filter_by_instance(club).order_by('-created_at').first()
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+        headers = {'HTTP_AUTHORIZATION': 'Bearer %s' % AccessToken.for_user(owner), 'HTTP_HOST': host}
+
+        def serve(method, path, body=None):
+            def call():
+                environ = factory.generic(method, path, json.dumps(body) if body else '',
+                                          content_type='application/json', secure=True, **headers).environ
+                status = []
+                response = handler(environ, lambda code, response_headers: status.append(code))
+                try:
+                    content = b''.join(response)
+                finally:
+                    # Like a WSGI server: ends the request, closing connections unless kept.
+                    response.close()
+                return Served(int(status[0].split()[0]), content)
+            return call
+
+        def url(name, *args):
+            return reverse('messages:%s' % name, args=args)
+
+        yield 'GET messages/clubs/<id>', serve('GET', url('message-group', club.id))
+        yield 'GET messages/users/<id>', serve('GET', url('message-user', peer))
+        yield 'GET messages/<id>', serve('GET', url('message', message.id))
+        yield 'GET inbox', serve('GET', url('inbox'))
+        yield 'GET clubs/<id>', serve('GET', url('club', club.id))
+        yield 'POST messages/clubs/<id>', serve('POST', url('message-group', club.id), {'body': 'bench'})
@@ -0,0 +1,74 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from message.benchmark import format_table, rolled_back
+from message.ids import uuid7
+from message.models import UserMessage
+
+GENERATORS = (('uuid4', uuid.uuid4), ('uuid7', uuid7))
+TABLE = 'benchmark_ids'
+
+
+def index_bytes(table):
+    """Size of a table's primary key index, None where the database can't tell."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_relation_size(%s)', ['%s_pkey' % table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute('SELECT sum(pgsize) FROM dbstat WHERE name = %s', ['sqlite_autoindex_%s_1' % table])
+        else:
+            return None
+        return cursor.fetchone()[0]
+
+
+def insert_keys(generate, rows, batch_size):
+    """Insert ``rows`` rows keyed by ``generate`` into a scratch table, timing the inserts only."""
+    qn = connection.ops.quote_name
+    pk = UserMessage._meta.pk
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE %s (id %s PRIMARY KEY, created_at %s NOT NULL, body varchar(100) NOT NULL)' % (
+            qn(TABLE), connection.data_types['UUIDField'], connection.data_types['DateTimeField']))
+        elapsed = 0.0
+        for start in range(0, rows, batch_size):
+            now = connection.ops.adapt_datetimefield_value(timezone.now())
+            batch = [(pk.get_db_prep_value(generate(), connection), now, 'benchmark')
+                     for _ in range(min(batch_size, rows - start))]
+            started = time.perf_counter()
+            cursor.executemany('INSERT INTO %s (id, created_at, body) VALUES (%%s, %%s, %%s)' % qn(TABLE), batch)
+            elapsed += time.perf_counter() - started
+        size = index_bytes(TABLE)
+        cursor.execute('DROP TABLE %s' % qn(TABLE))
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_s': round(rows / elapsed) if elapsed else None,
+        'index_bytes': size,
+        'bytes_per_row': round(size / rows, 1) if size and rows else None,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compare random uuid4 and time-ordered uuid7 primary keys: insert throughput and primary key '
+            'index size of a scratch table. Everything is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Rows inserted per kind of key.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = []
+        with rolled_back():
+            for name, generate in GENERATORS:
+                results.append(dict(insert_keys(generate, options['rows'], options['batch_size']), ids=name))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(
+                results, ('ids', 'rows', 'seconds', 'rows_per_s', 'index_bytes', 'bytes_per_row')))
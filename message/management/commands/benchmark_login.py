@@ -0,0 +1,56 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from message.benchmark import fast_hashing, format_table, measure, rolled_back
+from message.models import UserMessage
+
+PASSWORD = 'Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = ('Time login and registration for users with growing message histories. '
+            'Seeded data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, nargs='+', default=[0, 100, 1000],
+                            help='History sizes to seed the logging in user with.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per case.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = []
+        with fast_hashing(), rolled_back():
+            client = APIClient()
+            for count in options['messages']:
+                user = User.objects.create_user(username='bench%s' % count, password=PASSWORD,
+                                                email='bench%s@example.com' % count)
+                UserMessage.objects.bulk_create(
+                    UserMessage(sender=user, body='message %s' % i, content_object=user.userprofile)
+                    for i in range(count))
+                credentials = {'username': user.username, 'password': PASSWORD}
+                login = reverse('messages:login')
+                for name, path in (('login', login),
+                                   ('login expand=profile.messages', login + '?expand=profile.messages')):
+                    result = measure(lambda: client.post(path, credentials, format='json'),
+                                     repeat=options['repeat'])
+                    results.append(dict(result, case=name, messages=count))
+
+            registered = iter(range(options['repeat'] + 3))
+
+            def register():
+                i = next(registered)
+                data = {'username': 'benchreg%s' % i, 'email': 'benchreg%s@example.com' % i,
+                        'password': PASSWORD}
+                return client.post(reverse('messages:register'), data, format='json')
+
+            results.append(dict(measure(register, repeat=options['repeat']), case='register', messages=0))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(
+                results, ('case', 'messages', 'p50_ms', 'p95_ms', 'max_ms', 'queries', 'bytes')))
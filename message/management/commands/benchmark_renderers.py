@@ -0,0 +1,65 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from message.benchmark import fast_hashing, format_table, measure, rolled_back
+from message.models import Club, ClubUser, UserMessage
+from message.prefetch import message_queryset
+from message.renderers import MessagePackRenderer
+from message.serializers import MessageSerializer
+
+FORMATS = (('json', JSONRenderer), ('msgpack', MessagePackRenderer))
+
+
+class Command(BaseCommand):
+    help = ('Compare JSON and MessagePack payload size and serialization time on message pages. '
+            'Seeded data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, nargs='+', default=[50, 200],
+                            help='Message page sizes to render.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per case.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = []
+        with fast_hashing(), rolled_back():
+            user = User.objects.create_user(username='benchrender', password='Passw0rd!')
+            club = Club.objects.create(owner=user, title='benchrender')
+            ClubUser.objects.create(user=user.userprofile, club=club)
+            UserMessage.objects.bulk_create(
+                UserMessage(sender=user, content_object=club,
+                            body='Message %s, about as long as a typical chat line.' % i)
+                for i in range(max(options['page_size'])))
+            client = APIClient()
+            client.force_authenticate(user)
+            url = reverse('messages:message-group', args=[club.id])
+
+            for page_size in options['page_size']:
+                messages = list(message_queryset().filter_by_instance(club)[:page_size])
+                for name, renderer_class in FORMATS:
+                    renderer = renderer_class()
+                    native = renderer_class is MessagePackRenderer
+
+                    def render():
+                        data = MessageSerializer(messages, many=True, native=native).data
+                        return renderer.render(data)
+
+                    result = measure(render, repeat=options['repeat'])
+                    result['bytes'] = len(render())
+                    results.append(dict(result, case='serialize+render', format=name, page_size=page_size))
+
+                    result = measure(lambda: client.get(url, {'page_size': page_size},
+                                                        HTTP_ACCEPT=renderer.media_type),
+                                     repeat=options['repeat'])
+                    results.append(dict(result, case='request', format=name, page_size=page_size))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(
+                results, ('case', 'format', 'page_size', 'p50_ms', 'p95_ms', 'max_ms', 'queries', 'bytes')))
@@ -0,0 +1,55 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from message.export import CHUNK_SIZE, club_history, export_rows, gzip_stream, ndjson, user_history
+from message.models import ArchivedMessage, Club
+from message.pagination import decode_position
+
+
+class Command(BaseCommand):
+    help = "Stream a club's or user's full message history as NDJSON."
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--club', help='Club id to export.')
+        target.add_argument('--user', help='User id to export.')
+        parser.add_argument('--cursor', help='Resume after the message with this cursor.')
+        parser.add_argument('--output', help='File to write to, defaults to stdout.')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows fetched from the database per round trip.')
+
+    def handle(self, *args, **options):
+        if options['club']:
+            club = Club.objects.filter(id=options['club']).first()
+            if club is None:
+                raise CommandError('Club %s does not exist.' % options['club'])
+            queryset, archived = club_history(club), club_history(club, ArchivedMessage)
+        else:
+            user = User.objects.filter(id=options['user']).first()
+            if user is None:
+                raise CommandError('User %s does not exist.' % options['user'])
+            queryset, archived = user_history(user), user_history(user, ArchivedMessage)
+
+        position = None
+        if options['cursor']:
+            try:
+                position = decode_position(options['cursor'])
+            except ValueError:
+                raise CommandError('Invalid cursor.')
+
+        content = ndjson(export_rows(queryset, position, options['chunk_size'], archived))
+        if options['gzip']:
+            content = gzip_stream(content)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in content:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
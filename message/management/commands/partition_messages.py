@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from message.models import UserMessage
+from message.partitioning import create_partitions, detach_partitions, is_partitioned, merge_table, partition_table
+
+
+class Command(BaseCommand):
+    help = ('Create the monthly partitions of the message table for the coming MESSAGE_PARTITIONS_AHEAD months '
+            'and detach those older than MESSAGE_PARTITION_RETENTION. Converts the table with --convert and '
+            'back with --merge. PostgreSQL only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=getattr(settings, 'MESSAGE_PARTITIONS_AHEAD', 3),
+                            help='Months after the current one to create partitions for.')
+        parser.add_argument('--convert', action='store_true',
+                            help='Partition the message table first if it is not yet, copying every row.')
+        parser.add_argument('--merge', action='store_true',
+                            help='Turn the partitioned message table back into a single table and stop.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Message partitioning needs PostgreSQL, not %s.' % connection.vendor)
+        if options['merge']:
+            with connection.schema_editor() as schema_editor:
+                merged = merge_table(schema_editor, UserMessage)
+            self.stdout.write('Merged the message table.' if merged else 'The message table is not partitioned.')
+            return
+        if not is_partitioned(connection):
+            if not options['convert']:
+                raise CommandError('The message table is not partitioned, run with --convert.')
+            with connection.schema_editor() as schema_editor:
+                partition_table(schema_editor, UserMessage, options['ahead'])
+            self.stdout.write('Partitioned the message table.')
+
+        with transaction.atomic():
+            for name in create_partitions(connection, options['ahead']):
+                self.stdout.write('Created %s.' % name)
+            retention = getattr(settings, 'MESSAGE_PARTITION_RETENTION', None)
+            if retention is not None:
+                for name in detach_partitions(connection, timezone.now() - retention):
+                    self.stdout.write('Detached %s.' % name)
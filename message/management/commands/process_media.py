@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from message import processing, uploads  # noqa: F401, registers the tasks
+from message.jobs import run_pending, start_workers
+
+
+class Command(BaseCommand):
+    help = ('Run the background media processing workers: upload checks, thumbnails, durations, waveforms '
+            'and avatar sizes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'MEDIA_WORKERS', 2),
+                            help='Worker threads.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before looking for jobs again.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs due now and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write('Ran %s job(s).' % run_pending())
+            return
+        stop, threads = start_workers(options['workers'], options['poll_interval'])
+        self.stdout.write('Started %s media worker(s).' % len(threads))
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
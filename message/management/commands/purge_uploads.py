@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from message.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Discard media uploads abandoned before completion, and their part files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float,
+                            default=getattr(settings, 'MEDIA_UPLOAD_EXPIRY', timedelta(days=1)).total_seconds() / 3600,
+                            help='Age in hours after which an unfinished upload is discarded.')
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write('Discarded %s upload(s).' % count)
@@ -0,0 +1,112 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    A window of an open file, read as if it were the whole file. Servers that
+    sendfile() from a file's ``fileno`` start at its current position and
+    send Content-Length bytes, so ranges stay zero-copy.
+    """
+    name = None
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    The (start, end) of a single ``Range: bytes=`` request within ``size``
+    bytes. None when the header is absent or not one byte range, which is
+    answered with the whole file, and ValueError when it can't be satisfied.
+    """
+    match = RANGE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range, the last ``last`` bytes.
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError('Range not satisfiable.')
+    return start, end
+
+
+def if_range_passes(request, etag, last_modified):
+    """A Range only applies while If-Range, if sent, still matches the file."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(last_modified.timestamp()) <= date
+
+
+def serve_attachment(request, attachment, variant=None, max_age=3600):
+    """
+    Respond with a message attachment, or its ``thumbnail`` variant.
+    Attachments never change, their checksum is the ETag.
+    """
+    if variant == 'thumbnail':
+        return serve_file(request, attachment.thumbnail, attachment.thumbnail.size, 'image/jpeg',
+                          '%s.jpg' % os.path.splitext(attachment.filename)[0],
+                          quote_etag('%s-thumbnail' % attachment.checksum), attachment.processed_at, max_age)
+    return serve_file(request, attachment.file, attachment.size, attachment.mime_type, attachment.filename,
+                      quote_etag(attachment.checksum), attachment.created_at, max_age)
+
+
+def serve_file(request, file, size, content_type, filename, etag, last_modified, max_age):
+    """
+    Respond with a stored file: conditional on its ETag and Last-Modified,
+    partial for a satisfiable Range, streamed from the open file either way.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is None:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%s' % size
+            return response
+        if byte_range is not None and not if_range_passes(request, etag, last_modified):
+            byte_range = None
+
+        start, end = byte_range or (0, size - 1)
+        response = FileResponse(FileRange(file.open('rb'), start, end - start + 1), content_type=content_type,
+                                filename=filename)
+        response.block_size = 64 * 1024
+        response['Content-Length'] = end - start + 1
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Access is checked per request, shared caches must not keep a copy.
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import ClubUser
+
+Membership = namedtuple('Membership', ('clubs', 'owned'))
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_membership(user):
+    """
+    The ids of the clubs a user belongs to and of those they own, from one
+    query, kept per process for MEMBERSHIP_CACHE_TTL seconds. Membership
+    changes in this process are seen at once, other processes see them when
+    their entry expires.
+    """
+    now = time.monotonic()
+    entry = _cache.get(user.id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    rows = ClubUser.objects.filter(user__user=user.id).values_list('club_id', 'club__owner_id')
+    rows = list(rows)
+    membership = Membership(frozenset(club_id for club_id, _ in rows),
+                            frozenset(club_id for club_id, owner_id in rows if owner_id == user.id))
+    ttl = getattr(settings, 'MEMBERSHIP_CACHE_TTL', 30)
+    with _lock:
+        if len(_cache) >= getattr(settings, 'MEMBERSHIP_CACHE_SIZE', 10000):
+            _cache.clear()
+        _cache[user.id] = (now + ttl, membership)
+    return membership
+
+
+def is_member(user, club_id):
+    return club_id in get_membership(user).clubs
+
+
+def is_owner(user, club_id):
+    return club_id in get_membership(user).owned
+
+
+def forget(user_id):
+    _cache.pop(user_id, None)
+
+
+def clear():
+    _cache.clear()
@@ -0,0 +1,207 @@
+"""
+Per-request instrumentation: wall time, database queries and their time,
+serializer time and response size per view, kept in in-process histograms
+and exposed in the Prometheus text format.
+
+Histograms are per process, a scrape sees the worker that answers it. With
+METRICS_SAMPLE_RATE below 1 only that share of requests is measured, the
+others pay for one random() call. Sampled requests slower than
+METRICS_SLOW_REQUEST_MS are logged to ``message.metrics``, with their SQL
+when METRICS_CAPTURE_SQL is set.
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MAX_CAPTURED_QUERIES = 100
+
+_sample = contextvars.ContextVar('metrics_sample', default=None)
+
+
+class Histogram:
+    """Bucketed observations per label set, stored per bucket and made cumulative on export."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0, 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def export(self, label_names):
+        yield '# HELP %s %s' % (self.name, self.help)
+        yield '# TYPE %s histogram' % self.name
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            labels = format_labels(label_names, labels)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield '%s_bucket{%s,le="%s"} %s' % (self.name, labels, bound, cumulative)
+            yield '%s_sum{%s} %s' % (self.name, labels, round(total, 6))
+            yield '%s_count{%s} %s' % (self.name, labels, count)
+
+
+class Registry:
+    label_names = ('view', 'method')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.histograms = {
+            'duration': Histogram('messaging_request_duration_seconds', 'Wall time of a request.', SECONDS),
+            'queries': Histogram('messaging_request_db_queries', 'Database queries of a request.', QUERIES),
+            'db': Histogram('messaging_request_db_seconds', 'Time a request spent in the database.', SECONDS),
+            'serializer': Histogram('messaging_request_serializer_seconds',
+                                    'Time a request spent serializing.', SECONDS),
+            'size': Histogram('messaging_response_size_bytes', 'Size of a response body.', BYTES),
+        }
+
+    def record(self, view, method, status, sample, duration, size):
+        labels = (view, method)
+        with self.lock:
+            key = labels + (str(status),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.histograms['duration'].observe(labels, duration)
+            self.histograms['queries'].observe(labels, sample.queries)
+            self.histograms['db'].observe(labels, sample.db_time)
+            self.histograms['serializer'].observe(labels, sample.serializer_time)
+            if size is not None:
+                self.histograms['size'].observe(labels, size)
+
+    def export(self):
+        with self.lock:
+            lines = ['# HELP messaging_requests_total Sampled requests.',
+                     '# TYPE messaging_requests_total counter']
+            lines.extend('messaging_requests_total{%s} %s' % (
+                format_labels(self.label_names + ('status',), key), count)
+                for key, count in sorted(self.requests.items()))
+            for histogram in self.histograms.values():
+                lines.extend(histogram.export(self.label_names))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    return ','.join('%s="%s"' % (name, escape(value)) for name, value in zip(names, values))
+
+
+class Sample:
+    """What one measured request spent, filled in by the query wrapper and the serializers."""
+
+    def __init__(self, capture_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.sql = [] if capture_sql else None
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if self.sql is not None and len(self.sql) < MAX_CAPTURED_QUERIES:
+                self.sql.append((round(elapsed * 1000, 3), sql))
+
+
+def timed_serialization(to_representation):
+    """Count a serializer's ``to_representation`` towards the request's serializer time, nested calls once."""
+    @functools.wraps(to_representation)
+    def wrapper(self, instance):
+        sample = _sample.get()
+        if sample is None or sample.serializing:
+            return to_representation(self, instance)
+        sample.serializing = True
+        start = time.perf_counter()
+        try:
+            return to_representation(self, instance)
+        finally:
+            sample.serializer_time += time.perf_counter() - start
+            sample.serializing = False
+    return wrapper
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length else None
+
+
+class MetricsMiddleware:
+    """Measures a METRICS_SAMPLE_RATE share of requests into ``registry``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        if not getattr(settings, 'METRICS_ENABLED', True) or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        sample = Sample(getattr(settings, 'METRICS_CAPTURE_SQL', False))
+        token = _sample.set(sample)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample.record_query))
+                response = self.get_response(request)
+        finally:
+            _sample.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        registry.record(view, request.method, response.status_code, sample, duration, response_size(response))
+        if duration * 1000 >= getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500):
+            logger.warning('Slow request %s %s (%s): %.1f ms, %s queries in %.1f ms, serializing %.1f ms.%s',
+                           request.method, request.path, view, duration * 1000, sample.queries,
+                           sample.db_time * 1000, sample.serializer_time * 1000,
+                           ''.join('\n  %s ms  %s' % query for query in sample.sql or ()))
+        return response
+
+
+def metrics_view(request):
+    """
+    The histograms in the Prometheus text format. Requires ``Authorization:
+    Bearer <METRICS_TOKEN>``, without a token set nobody is let in.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
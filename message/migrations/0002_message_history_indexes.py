@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usermessage',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at'], name='message_target_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermessage',
+            index=models.Index(fields=['sender', 'created_at'], name='message_sender_created_idx'),
+        ),
+    ]
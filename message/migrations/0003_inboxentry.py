@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('message', '0002_message_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.UUIDField()),
+                ('last_message_at', models.DateTimeField()),
+                ('preview', models.CharField(blank=True, max_length=100)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('last_message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='message.usermessage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-last_message_at'], name='inbox_user_recent_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='inboxentry',
+            unique_together={('user', 'content_type', 'object_id')},
+        ),
+    ]
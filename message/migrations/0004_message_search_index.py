@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:40
+
+from django.db import migrations
+
+# The search index as this migration built it, frozen: message.search moves
+# on. Later migrations rebuilding the index import it from here.
+POSTGRESQL = [
+    "CREATE INDEX IF NOT EXISTS message_body_search_idx ON message_usermessage "
+    "USING GIN (to_tsvector('english', coalesce(body, '')))",
+]
+SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_usermessage_fts USING fts5("
+    "body, content='message_usermessage', content_rowid='rowid')",
+    "CREATE TRIGGER IF NOT EXISTS message_usermessage_fts_insert AFTER INSERT ON message_usermessage BEGIN "
+    "INSERT INTO message_usermessage_fts(rowid, body) VALUES (new.rowid, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS message_usermessage_fts_delete AFTER DELETE ON message_usermessage BEGIN "
+    "INSERT INTO message_usermessage_fts(message_usermessage_fts, rowid, body) "
+    "VALUES ('delete', old.rowid, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS message_usermessage_fts_update AFTER UPDATE OF body ON message_usermessage BEGIN "
+    "INSERT INTO message_usermessage_fts(message_usermessage_fts, rowid, body) "
+    "VALUES ('delete', old.rowid, old.body); "
+    "INSERT INTO message_usermessage_fts(rowid, body) VALUES (new.rowid, new.body); END",
+    "INSERT INTO message_usermessage_fts(message_usermessage_fts) VALUES ('rebuild')",
+]
+
+
+def create_search_index(schema_editor):
+    statements = {'postgresql': POSTGRESQL, 'sqlite': SQLITE}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def forwards(apps, schema_editor):
+    create_search_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS message_body_search_idx")
+    elif vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute("DROP TRIGGER IF EXISTS message_usermessage_fts_%s" % suffix)
+        schema_editor.execute("DROP TABLE IF EXISTS message_usermessage_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0003_inboxentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
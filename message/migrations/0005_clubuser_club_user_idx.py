@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0004_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clubuser',
+            index=models.Index(fields=['club', 'user'], name='clubuser_club_user_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('message', '0005_clubuser_club_user_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageAttachment',
+            fields=[
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='attachment', serialize=False, to='message.usermessage')),
+                ('file', models.FileField(max_length=255, upload_to='attachments/%Y/%m/')),
+                ('filename', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MediaUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('object_id', models.UUIDField()),
+                ('body', models.TextField(blank=True, null=True)),
+                ('body_type', models.CharField(choices=[('VIDEO', 'video'), ('AUDIO', 'audio')], max_length=25)),
+                ('filename', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('PENDING', 'pending'), ('COMPLETE', 'complete'), ('FAILED', 'failed')], default='PENDING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('message', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='message.usermessage')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:30
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# The search index as 0004 built it, frozen there: message.search moves on.
+create_search_index = import_module('message.migrations.0004_message_search_index').create_search_index
+
+
+def rebuild_search_index(apps, schema_editor):
+    # Altering body_type rebuilt the message table on SQLite, and dropped
+    # the triggers keeping the search index in sync.
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0006_media_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'pending'), ('RUNNING', 'running'), ('FAILED', 'failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='thumbnail',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to='thumbnails/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='waveform',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_sizes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='mediaupload',
+            name='body_type',
+            field=models.CharField(choices=[('VIDEO', 'video'), ('AUDIO', 'audio'), ('IMAGE', 'image')], max_length=25),
+        ),
+        migrations.AlterField(
+            model_name='usermessage',
+            name='body_type',
+            field=models.CharField(choices=[('TEXT', 'text'), ('VIDEO', 'video'), ('AUDIO', 'audio'), ('IMAGE', 'image')], default='text', max_length=25),
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='mediajob',
+            index=models.Index(fields=['status', 'run_after'], name='mediajob_due_idx'),
+        ),
+    ]
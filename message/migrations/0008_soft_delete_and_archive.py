@@ -0,0 +1,103 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:40
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# The search index as 0004 built it, frozen there: message.search moves on.
+create_search_index = import_module('message.migrations.0004_message_search_index').create_search_index
+
+
+def clear_deleted_at(apps, schema_editor):
+    # deleted_at was auto_now, set on every save. Nothing was ever deleted.
+    for name in ('UserMessage', 'Club', 'ClubUser'):
+        apps.get_model('message', name).objects.update(deleted_at=None)
+
+
+def rebuild_search_index(apps, schema_editor):
+    # Altering deleted_at rebuilt the message table on SQLite, and dropped
+    # the triggers keeping the search index in sync.
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('message', '0007_media_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('body', models.TextField(blank=True, null=True)),
+                ('body_type', models.CharField(default='text', max_length=25)),
+                ('msg_type', models.CharField(default='default', max_length=25)),
+                ('object_id', models.UUIDField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='usermessage',
+            name='message_target_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usermessage',
+            name='message_sender_created_idx',
+        ),
+        migrations.AlterField(
+            model_name='club',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='clubuser',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='usermessage',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(clear_deleted_at, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usermessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['content_type', 'object_id', 'created_at'], name='message_live_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['sender', 'created_at'], name='message_live_sender_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedmessage',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype'),
+        ),
+        migrations.AddField(
+            model_name='archivedmessage',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at'], name='archive_target_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['sender', 'created_at'], name='archive_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['created_at'], name='archive_created_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:50
+
+from importlib import import_module
+
+from django.db import migrations, models
+import message.ids
+import message.models
+
+# The search index as 0004 built it, frozen there: message.search moves on.
+create_search_index = import_module('message.migrations.0004_message_search_index').create_search_index
+
+
+def rebuild_search_index(apps, schema_editor):
+    # Altering the message table's fields rebuilt it on SQLite, and dropped
+    # the triggers keeping the search index in sync.
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0008_soft_delete_and_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='club',
+            name='id',
+            field=models.UUIDField(default=message.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='usermessage',
+            name='created_at',
+            field=message.models.CreatedAtField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='usermessage',
+            name='id',
+            field=models.UUIDField(default=message.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='id',
+            field=models.UUIDField(default=message.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
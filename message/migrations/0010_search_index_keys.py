@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:50
+
+from importlib import import_module
+
+from django.db import migrations
+
+# The SQLite search index was keyed on the implicit rowid of the message
+# table, which VACUUM may renumber. Messages get an integer key of their own
+# in a key table, the rowid of their FTS5 row. PostgreSQL keeps its GIN index.
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS message_usermessage_fts_%s" % suffix for suffix in ('insert', 'delete', 'update')
+]
+# As 0004 built it.
+ROWID_INDEX = import_module('message.migrations.0004_message_search_index').SQLITE
+KEYED_INDEX = [
+    "CREATE TABLE message_usermessage_search_keys (id integer NOT NULL PRIMARY KEY, "
+    "message_id char(32) NOT NULL UNIQUE)",
+    "INSERT INTO message_usermessage_search_keys(message_id) "
+    "SELECT id FROM message_usermessage ORDER BY created_at",
+    "CREATE VIRTUAL TABLE message_usermessage_fts USING fts5(body)",
+    "INSERT INTO message_usermessage_fts(rowid, body) SELECT k.id, m.body FROM message_usermessage_search_keys k "
+    "JOIN message_usermessage m ON m.id = k.message_id",
+    "CREATE TRIGGER message_usermessage_fts_insert AFTER INSERT ON message_usermessage BEGIN "
+    "INSERT INTO message_usermessage_search_keys(message_id) VALUES (new.id); "
+    "INSERT INTO message_usermessage_fts(rowid, body) "
+    "VALUES ((SELECT id FROM message_usermessage_search_keys WHERE message_id = new.id), new.body); END",
+    "CREATE TRIGGER message_usermessage_fts_delete AFTER DELETE ON message_usermessage BEGIN "
+    "DELETE FROM message_usermessage_fts "
+    "WHERE rowid = (SELECT id FROM message_usermessage_search_keys WHERE message_id = old.id); "
+    "DELETE FROM message_usermessage_search_keys WHERE message_id = old.id; END",
+    "CREATE TRIGGER message_usermessage_fts_update AFTER UPDATE OF body ON message_usermessage BEGIN "
+    "UPDATE message_usermessage_fts SET body = new.body "
+    "WHERE rowid = (SELECT id FROM message_usermessage_search_keys WHERE message_id = new.id); END",
+]
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_TRIGGERS + ["DROP TABLE IF EXISTS message_usermessage_fts"] + KEYED_INDEX:
+            schema_editor.execute(statement)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_TRIGGERS + ["DROP TABLE IF EXISTS message_usermessage_fts",
+                                          "DROP TABLE IF EXISTS message_usermessage_search_keys"] + ROWID_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0009_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -5,10 +5,15 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Q
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from dotenv import load_dotenv
 
+from .contenttypes import get_content_type
+from .ids import uuid7, uuid7_time
+
 load_dotenv()
 
 
@@ -16,28 +21,72 @@ load_dotenv()
 class ObjectTracking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         abstract = True
         ordering = ('-created_at',)
 
 
-class ObjectManger(models.Manager):
+class CreatedAtField(models.DateTimeField):
+    """
+    Set on creation like ``auto_now_add``, to the time in the row's id when
+    it is time-ordered. Ordering on (created_at, id) is then ordering on id,
+    an id alone is a history position, see ``pagination``.
+    """
+
+    def pre_save(self, model_instance, add):
+        created_at = uuid7_time(model_instance.pk) if add else None
+        if created_at is None:
+            return super().pre_save(model_instance, add)
+        setattr(model_instance, self.attname, created_at)
+        return created_at
+
+
+class ObjectQuerySet(models.QuerySet):
 
     def filter_by_instance(self, instance):
-        content_type = ContentType.objects.get_for_model(instance.__class__)
-        obj_id = instance.id
-        return super(ObjectManger, self).filter(content_type=content_type,
-                                                object_id=obj_id)
+        return self.filter_by_target(instance.__class__, instance.id)
+
+    def filter_by_target(self, model, obj_id):
+        content_type = get_content_type(model)
+        return self.filter(content_type=content_type, object_id=obj_id)
+
+    def filter_by_conversation(self, user, profile):
+        content_type = get_content_type(profile.__class__)
+        sent = Q(sender=user.id, object_id=profile.id)
+        own_profile = UserProfile.objects.filter(user=user.id).values('id')
+        received = Q(sender=profile.user_id, object_id__in=own_profile)
+        return self.filter(sent | received, content_type=content_type)
+
+    def visible_to(self, user):
+        """Messages of the user's clubs and of the direct conversations they take part in."""
+        clubs = ClubUser.objects.filter(user__user=user.id).values('club_id')
+        profiles = UserProfile.objects.filter(user=user.id).values('id')
+        profile_type = get_content_type(UserProfile)
+        return self.filter(Q(content_type=get_content_type(Club), object_id__in=clubs) |
+                           Q(content_type=profile_type, sender=user.id) |
+                           Q(content_type=profile_type, object_id__in=profiles))
+
+
+class ObjectManger(models.Manager.from_queryset(ObjectQuerySet)):
+    pass
+
+
+class LiveObjectManager(ObjectManger):
+    """Only the rows that are not soft deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class UserMessage(models.Model):
-    id = models.UUIDField(default=uuid.uuid4, unique=True, primary_key=True,
+    id = models.UUIDField(default=uuid7, unique=True, primary_key=True,
                           editable=False)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sender")
     body = models.TextField(null=True, blank=True)
-    body_type = models.CharField(max_length=25, choices=(('TEXT', 'text'), ('VIDEO', 'video'), ('AUDIO', 'audio'),),
+    body_type = models.CharField(max_length=25, choices=(('TEXT', 'text'), ('VIDEO', 'video'), ('AUDIO', 'audio'),
+                                                         ('IMAGE', 'image'),),
                                  blank=False, default='text')
     msg_type = models.CharField(max_length=25, choices=(('DEFAULT', 'default'),
                                                         ('COMMENT', 'comment'),),
@@ -49,12 +98,62 @@ class UserMessage(models.Model):
     object_id = models.UUIDField()
     content_object = GenericForeignKey('content_type', 'object_id')
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = CreatedAtField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(auto_now=True)
+    # Set when the message is deleted, the row stays until it is purged.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveObjectManager()
+    all_objects = ObjectManger()
+
+    class Meta:
+        # Partial indexes, over live messages only.
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'created_at'],
+                         name='message_live_target_idx', condition=Q(deleted_at__isnull=True)),
+            models.Index(fields=['sender', 'created_at'],
+                         name='message_live_sender_idx', condition=Q(deleted_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return str(self.body)
+
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
+
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of the message table once old, by
+    ``archive.archive_messages``. Same columns, read back by the history
+    views after the live ones.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    body = models.TextField(null=True, blank=True)
+    body_type = models.CharField(max_length=25, default='text')
+    msg_type = models.CharField(max_length=25, default='default')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name="+")
+    object_id = models.UUIDField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    # Deleted messages are purged, never archived.
+    deleted_at = None
 
     objects = ObjectManger()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'created_at'],
+                         name='archive_target_created_idx'),
+            models.Index(fields=['sender', 'created_at'], name='archive_sender_created_idx'),
+            models.Index(fields=['created_at'], name='archive_created_idx'),
+        ]
+
     def __str__(self):
         return str(self.body)
 
@@ -63,7 +162,7 @@ DEFAULT_AVATAR_URL = os.getenv("DEFAULT_AVATAR_URL")
 
 
 class UserProfile(models.Model):
-    id = models.UUIDField(default=uuid.uuid4, unique=True,
+    id = models.UUIDField(default=uuid7, unique=True,
                           primary_key=True, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.URLField(max_length=200, blank=True, default=DEFAULT_AVATAR_URL)
@@ -71,12 +170,16 @@ class UserProfile(models.Model):
                              default='Here I am using the messaging app!')
     is_online = models.BooleanField(default=False, blank=True)
     is_verified = models.BooleanField(default=False, blank=True)
+    # Resized copies of a locally stored avatar, by size, and the avatar they were made from.
+    avatar_sizes = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return str(self.user.username)
 
     @property
     def messages(self):
+        if hasattr(self, '_prefetched_messages'):
+            return self._prefetched_messages
         return UserMessage.objects.filter_by_instance(self)
 
 
@@ -87,7 +190,7 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 class Club(models.Model):
-    id = models.UUIDField(default=uuid.uuid4, unique=True,
+    id = models.UUIDField(default=uuid7, unique=True,
                           primary_key=True, editable=False)
     owner = models.ForeignKey(User, on_delete=models.PROTECT)
     title = models.CharField(max_length=50, null=True)
@@ -97,7 +200,7 @@ class Club(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('owner', 'title',)
@@ -107,10 +210,14 @@ class Club(models.Model):
 
     @property
     def messages(self):
+        if hasattr(self, '_prefetched_messages'):
+            return self._prefetched_messages
         return UserMessage.objects.filter_by_instance(self)
 
     @property
     def clubusers(self):
+        if hasattr(self, '_prefetched_clubusers'):
+            return self._prefetched_clubusers
         club = ClubUser.objects.filter(club=self.id)
         return UserProfile.objects.filter(id__in=club.values_list('user'))
 
@@ -120,7 +227,131 @@ class ClubUser(models.Model):
     club = models.ForeignKey(Club, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('user', 'club',)
+        indexes = [
+            models.Index(fields=['club', 'user'], name='clubuser_club_user_idx'),
+        ]
+
+
+class InboxEntry(models.Model):
+    """
+    One conversation in a user's inbox, keyed by its target: a club, or the
+    other participant's profile for direct messages. Kept up to date as
+    messages are created and deleted so listing an inbox is a single read.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="inbox")
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE,
+                                     related_name="+")
+    object_id = models.UUIDField()
+    target = GenericForeignKey('content_type', 'object_id')
+
+    last_message = models.ForeignKey(UserMessage, on_delete=models.SET_NULL,
+                                     null=True, related_name="+")
+    last_message_at = models.DateTimeField()
+    preview = models.CharField(max_length=100, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'content_type', 'object_id',)
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='inbox_user_recent_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.preview)
+
+
+MEDIA_TYPES = (('VIDEO', 'video'), ('AUDIO', 'audio'), ('IMAGE', 'image'),)
+
+
+class MediaUpload(models.Model):
+    """
+    A media message being uploaded in chunks. Chunks are appended to a part
+    file outside the storage, the message and its attachment are created
+    once the last chunk arrives and the whole file matches ``checksum``.
+    """
+    PENDING = 'PENDING'
+    COMPLETE = 'COMPLETE'
+    FAILED = 'FAILED'
+
+    id = models.UUIDField(default=uuid.uuid4, unique=True, primary_key=True, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name="+")
+    object_id = models.UUIDField()
+    target = GenericForeignKey('content_type', 'object_id')
+
+    body = models.TextField(null=True, blank=True)
+    body_type = models.CharField(max_length=25, choices=MEDIA_TYPES)
+    filename = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, default=PENDING,
+                              choices=((PENDING, 'pending'), (COMPLETE, 'complete'), (FAILED, 'failed'),))
+    message = models.OneToOneField(UserMessage, on_delete=models.SET_NULL, null=True, related_name="+")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.filename)
+
+
+class MessageAttachment(models.Model):
+    """
+    The media file of a message. What is derived from it, a thumbnail, the
+    dimensions, the duration and a waveform, is filled in in the background
+    and ``processed_at`` set once done.
+    """
+    message = models.OneToOneField(UserMessage, on_delete=models.CASCADE,
+                                   primary_key=True, related_name="attachment")
+    file = models.FileField(upload_to='attachments/%Y/%m/', max_length=255)
+    filename = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    thumbnail = models.FileField(upload_to='thumbnails/%Y/%m/', max_length=255, null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    waveform = models.JSONField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.filename)
+
+
+class MediaJob(models.Model):
+    """
+    A background media processing job. The table is the queue: workers claim
+    due jobs by flipping their status, a job whose worker died is claimed
+    again once its lease runs out. Done jobs are deleted.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    FAILED = 'FAILED'
+
+    task = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, default=PENDING,
+                              choices=((PENDING, 'pending'), (RUNNING, 'running'), (FAILED, 'failed'),))
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='mediajob_due_idx'),
+        ]
+
+    def __str__(self):
+        return '%s(%s)' % (self.task, self.key)
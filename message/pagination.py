@@ -0,0 +1,158 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .archive import reaches_archive
+from .ids import uuid7_time
+from .models import ArchivedMessage
+from .partitioning import recent_bound
+
+
+def encode_position(created_at, pk):
+    """
+    Opaque cursor for the (created_at, id) position of a message: its id
+    alone when it is time-ordered and created_at was taken from it.
+    """
+    if uuid7_time(pk) == created_at:
+        return str(pk)
+    raw = '%s|%s' % (created_at.isoformat(), pk)
+    return urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_position(encoded):
+    """Inverse of encode_position, raises ValueError on a malformed cursor."""
+    created_at = uuid7_time(encoded)
+    if created_at is not None:
+        return created_at, uuid.UUID(encoded)
+    try:
+        created_at, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+        created_at = parse_datetime(created_at)
+        pk = uuid.UUID(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    return created_at, pk
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over message history ordered on (created_at, id).
+
+    Every page is a bounded index range scan starting right after the last
+    row of the previous page, so fetching an old page costs the same as the
+    newest one, unlike an OFFSET which walks the skipped rows.
+
+    ``?after=`` takes a cursor or a time-ordered message id and leaves out
+    the messages up to it, the cheap way to poll for new ones.
+    """
+    cursor_query_param = 'cursor'
+    after_query_param = 'after'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        A page of ``queryset``. Views with a ``history(model)`` method also
+        get the archived messages of the page, merged in order, when the page
+        reaches back far enough.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        self.after = self.decode_cursor(request, self.after_query_param)
+        results = self.fetch(queryset, position)
+
+        if len(results) > self.page_size:
+            oldest = results[-1].created_at
+        else:
+            oldest = self.after[0] if self.after is not None else None
+        if hasattr(view, 'history') and reaches_archive(oldest):
+            archived = self.seek(view.history(ArchivedMessage), position)[:self.page_size + 1]
+            results = sorted(results + list(archived), key=lambda message: (message.created_at, message.id),
+                             reverse=True)[:self.page_size + 1]
+
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def fetch(self, queryset, position):
+        """
+        The page and the row after it. With the message table partitioned,
+        the recent part of history comes first, bounded on created_at so only
+        its partitions are scanned, then older rows if the page isn't full.
+        """
+        limit = self.page_size + 1
+        bound = recent_bound(position)
+        if bound is None:
+            return list(self.seek(queryset, position)[:limit])
+        results = list(self.seek(queryset.filter(created_at__gte=bound), position)[:limit])
+        if len(results) < limit:
+            results += self.seek(queryset.filter(created_at__lt=bound), position)[:limit - len(results)]
+        return results
+
+    def seek(self, queryset, position):
+        """The rows of ``queryset`` after a cursor position, in page order."""
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        if self.after is not None:
+            created_at, pk = self.after
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        return queryset
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request, param=None):
+        encoded = request.query_params.get(param or self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            return decode_position(encoded)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    @classmethod
+    def encode_cursor(cls, message):
+        return encode_position(message.created_at, message.id)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,16 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .renderers import MessagePackRenderer, unpackb
+
+
+class MessagePackParser(BaseParser):
+    """Parses MessagePack request bodies, timestamps and UUID extensions included."""
+    media_type = MessagePackRenderer.media_type
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return unpackb(stream.read())
+        except (ValueError, TypeError) as exc:
+            raise ParseError('MessagePack parse error - %s' % exc)
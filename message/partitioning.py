@@ -0,0 +1,251 @@
+"""
+Monthly range partitioning of the message table by ``created_at``, on
+PostgreSQL. ``manage.py partition_messages --convert`` partitions the table,
+``--merge`` turns it back into a single one, migrations leave it alone so
+every database has the same schema whatever the settings. Run daily, the
+command creates the coming months and detaches the old ones.
+MESSAGE_PARTITIONING tells reads the table is partitioned.
+
+Every month is a partition named ``<table>_pYYYY_MM``, a default partition
+catches rows no month covers yet. PostgreSQL wants the partition key in the
+primary key of a partitioned table, so it becomes (id, created_at):
+
+- ids stay unique through a unique index on id in every partition. The
+  created_at of a time-ordered id is taken from it, see
+  ``models.CreatedAtField``, so rows with the same id would share a partition.
+- no foreign key can point at the table. Attachments, uploads and inbox
+  entries lose the constraints on their message column and the app keeps
+  them valid instead: Django applies on_delete to deletes through the ORM,
+  the archive never moves a message anything points at, and detaching a
+  partition applies on_delete to the rows pointing into it first. Merging
+  the table back restores the constraints.
+
+SQLite, and PostgreSQL until converted, keep a single table. History
+pages read the same way on either, see ``recent_bound``.
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.utils import truncate_name
+from django.db.models import CASCADE, SET_NULL
+from django.utils import timezone
+
+from .models import UserMessage
+from .search import create_search_index
+
+TABLE = UserMessage._meta.db_table
+DEFAULT_PARTITION = '%s_default' % TABLE
+PARTITION_NAME = re.compile(r'^%s_p(\d{4})_(\d{2})$' % TABLE)
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return '%s_p%04d_%02d' % (TABLE, month.year, month.month)
+
+
+def recent_bound(position):
+    """
+    Where the recent part of history starts for a page read from a cursor
+    position (None: the newest page), None without partitioning. Pages read
+    the recent part first, bounded on created_at so the planner skips all
+    older partitions, and only go further back when it doesn't fill them.
+    """
+    if not getattr(settings, 'MESSAGE_PARTITIONING', False):
+        return None
+    start = position[0] if position is not None else timezone.now()
+    return start - getattr(settings, 'MESSAGE_RECENT_WINDOW', timedelta(days=31))
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)',
+                       [TABLE])
+        return cursor.fetchone()[0]
+
+
+def partitions(connection):
+    """The months of the attached monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                       'WHERE i.inhparent = %s::regclass', [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    matches = filter(None, map(PARTITION_NAME.match, names))
+    return sorted(datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc) for match in matches)
+
+
+def incoming_relations(model):
+    """The relations of the foreign keys pointing at ``model``, hidden ones included."""
+    return [field for field in model._meta.get_fields(include_hidden=True)
+            if field.is_relation and field.auto_created and not field.concrete
+            and (field.one_to_many or field.one_to_one) and field.field.db_constraint]
+
+
+def unique_ids(cursor, partition):
+    qn = cursor.db.ops.quote_name
+    cursor.execute('CREATE UNIQUE INDEX %s ON %s (id)' % (qn('%s_id_uniq' % partition), qn(partition)))
+
+
+def create_partition(connection, month):
+    """Add the partition of a month, moving in the rows the default partition caught for it."""
+    qn = connection.ops.quote_name
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM %s WHERE created_at >= %%s AND created_at < %%s)'
+                       % qn(DEFAULT_PARTITION), bounds)
+        caught = cursor.fetchone()[0]
+        if caught:
+            # The default partition may not hold rows of a new partition's range.
+            cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (qn(TABLE), qn(DEFAULT_PARTITION)))
+        cursor.execute('CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)'
+                       % (qn(partition_name(month)), qn(TABLE)), bounds)
+        unique_ids(cursor, partition_name(month))
+        if caught:
+            cursor.execute('WITH moved AS (DELETE FROM %s WHERE created_at >= %%s AND created_at < %%s '
+                           'RETURNING *) INSERT INTO %s SELECT * FROM moved'
+                           % (qn(DEFAULT_PARTITION), qn(TABLE)), bounds)
+            cursor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (qn(TABLE), qn(DEFAULT_PARTITION)))
+
+
+def create_partitions(connection, ahead, now=None):
+    """Make sure the current month and ``ahead`` months after it have a partition, returns the new ones."""
+    existing = set(partitions(connection))
+    current = month_start(now or timezone.now())
+    created = []
+    for month in (add_months(current, offset) for offset in range(ahead + 1)):
+        if month not in existing:
+            create_partition(connection, month)
+            created.append(partition_name(month))
+    return created
+
+
+def release_references(start, end):
+    """
+    Apply on_delete to the rows pointing at the messages created from
+    ``start`` until ``end``, which are about to leave the table. No foreign
+    key does it for a partitioned table.
+    """
+    for relation in incoming_relations(UserMessage):
+        name = relation.field.name
+        rows = relation.related_model._base_manager.filter(**{
+            '%s__created_at__gte' % name: start, '%s__created_at__lt' % name: end})
+        if relation.on_delete is CASCADE:
+            rows.delete()
+        elif relation.on_delete is SET_NULL:
+            rows.update(**{name: None})
+        else:
+            raise ValueError('Cannot release %s.%s on detach.' % (relation.related_model.__name__, name))
+
+
+def detach_partitions(connection, before):
+    """
+    Detach the monthly partitions ending before ``before``, returns their
+    names. Their rows leave the message table, the tables stay for the
+    operator to back up or drop. What points at their messages goes first,
+    as if they were deleted.
+    """
+    qn = connection.ops.quote_name
+    detached = []
+    with connection.cursor() as cursor:
+        for month in partitions(connection):
+            if add_months(month, 1) <= before:
+                release_references(month, add_months(month, 1))
+                cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (qn(TABLE), qn(partition_name(month))))
+                detached.append(partition_name(month))
+    return detached
+
+
+def constraint_name(connection, *parts):
+    return truncate_name('_'.join(parts), connection.ops.max_name_length())
+
+
+def add_foreign_key(schema_editor, model, field):
+    """The foreign key constraint of ``field``, deferred like the ones Django creates."""
+    qn = schema_editor.quote_name
+    table, target = model._meta.db_table, field.target_field
+    name = constraint_name(schema_editor.connection, table, field.column, 'fk', target.model._meta.db_table)
+    schema_editor.execute(
+        'ALTER TABLE %s ADD CONSTRAINT %s FOREIGN KEY (%s) REFERENCES %s (%s) DEFERRABLE INITIALLY DEFERRED'
+        % (qn(table), qn(name), qn(field.column), qn(target.model._meta.db_table), qn(target.column)))
+
+
+def restore_schema(schema_editor, model):
+    """The indexes, foreign keys and search index of a freshly built message table."""
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    for field in model._meta.local_fields:
+        if field.db_index and not field.unique:
+            name = constraint_name(schema_editor.connection, table, field.column, 'idx')
+            schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (qn(name), qn(table), qn(field.column)))
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            add_foreign_key(schema_editor, model, field)
+    create_search_index(schema_editor)
+
+
+def partition_table(schema_editor, model, ahead=3):
+    """
+    Rebuild the message table as a partitioned one, a partition per month
+    from its oldest message to ``ahead`` months from now. Copies every row
+    in the transaction of the caller. Returns False when there is nothing to
+    do: not PostgreSQL, or already partitioned.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or is_partitioned(connection):
+        return False
+    qn = schema_editor.quote_name
+    unpartitioned = '%s_unpartitioned' % TABLE
+    schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (qn(TABLE), qn(unpartitioned)))
+    schema_editor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)'
+                          % (qn(TABLE), qn(unpartitioned)))
+    schema_editor.execute('CREATE TABLE %s PARTITION OF %s DEFAULT' % (qn(DEFAULT_PARTITION), qn(TABLE)))
+    with connection.cursor() as cursor:
+        unique_ids(cursor, DEFAULT_PARTITION)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(created_at) FROM %s' % qn(unpartitioned))
+        oldest = cursor.fetchone()[0]
+    now = timezone.now()
+    month, last = month_start(oldest or now), add_months(month_start(now), ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = add_months(month, 1)
+
+    schema_editor.execute('INSERT INTO %s SELECT * FROM %s' % (qn(TABLE), qn(unpartitioned)))
+    # Takes the foreign keys pointing at messages with it, see the module docstring.
+    schema_editor.execute('DROP TABLE %s CASCADE' % qn(unpartitioned))
+    schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (id, created_at)' % qn(TABLE))
+    restore_schema(schema_editor, model)
+    return True
+
+
+def merge_table(schema_editor, model):
+    """Undo ``partition_table``: back to a single table with the foreign keys to it restored."""
+    connection = schema_editor.connection
+    if not is_partitioned(connection):
+        return False
+    qn = schema_editor.quote_name
+    partitioned = '%s_partitioned' % TABLE
+    schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (qn(TABLE), qn(partitioned)))
+    schema_editor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (qn(TABLE), qn(partitioned)))
+    schema_editor.execute('INSERT INTO %s SELECT * FROM %s' % (qn(TABLE), qn(partitioned)))
+    schema_editor.execute('DROP TABLE %s CASCADE' % qn(partitioned))
+    schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (id)' % qn(TABLE))
+    restore_schema(schema_editor, model)
+    for relation in incoming_relations(model):
+        add_foreign_key(schema_editor, relation.related_model, relation.field)
+    return True
@@ -0,0 +1,61 @@
+import uuid
+
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from .contenttypes import get_target_model
+from .membership import is_member, is_owner
+from .models import Club, UserProfile
+
+
+def view_club_id(view):
+    try:
+        return uuid.UUID(str(view.kwargs.get('club_id')))
+    except ValueError:
+        return None
+
+
+class IsClubMember(BasePermission):
+    """Allows members of the ``club_id`` club in the URL."""
+    message = 'Only club members are allowed to do this.'
+
+    def has_permission(self, request, view):
+        club_id = view_club_id(view)
+        return club_id is not None and is_member(request.user, club_id)
+
+
+class IsClubOwner(BasePermission):
+    """Allows the owner of the ``club_id`` club in the URL."""
+    message = 'Only club owners are allowed to do this.'
+
+    def has_permission(self, request, view):
+        club_id = view_club_id(view)
+        return club_id is not None and is_owner(request.user, club_id)
+
+
+class IsClubOwnerOrMemberReadOnly(BasePermission):
+    """Members of the ``club_id`` club in the URL may read, its owner may also write."""
+    message = 'Only club owners are allowed to do this.'
+
+    def has_permission(self, request, view):
+        club_id = view_club_id(view)
+        if club_id is None:
+            return False
+        if request.method in SAFE_METHODS:
+            return is_member(request.user, club_id)
+        return is_owner(request.user, club_id)
+
+
+class CanAccessMessage(BasePermission):
+    """
+    Participants may read a message: members of its club, or the sender and
+    recipient of a direct message. Only its sender may change or delete it.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        if obj.sender_id == request.user.id:
+            return True
+        if request.method not in SAFE_METHODS:
+            return False
+        if get_target_model(obj.content_type_id) is Club:
+            return is_member(request.user, obj.object_id)
+        return UserProfile.objects.filter(id=obj.object_id, user=request.user.id).exists()
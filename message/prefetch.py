@@ -0,0 +1,113 @@
+from collections import defaultdict
+
+from .contenttypes import get_content_type
+from .fieldsets import subset, wants
+from .models import ClubUser, UserMessage
+
+# Loaded whatever the fieldset, pagination, permissions and grouping need them.
+MESSAGE_REQUIRED_FIELDS = ('id', 'created_at', 'sender', 'content_type', 'object_id')
+
+
+def only_columns(queryset, fieldset, required=('id',)):
+    """Defer the columns of fields a sparse fieldset leaves out."""
+    if fieldset is None:
+        return queryset
+    columns = [field.name for field in queryset.model._meta.concrete_fields if field.name in fieldset]
+    return queryset.only(*required, *columns)
+
+
+def user_lookups(path, fieldset=None):
+    """
+    The select_related and prefetch_related lookups rendering the user at
+    ``path`` (the queried users themselves when empty) with UserSerializer
+    narrowed to ``fieldset`` needs.
+    """
+    def lookup(name):
+        return '%s__%s' % (path, name) if path else name
+
+    select = [lookup('userprofile')] if wants(fieldset, 'profile') else [path] if path else []
+    prefetch = [lookup(name) for name in ('groups', 'user_permissions') if wants(fieldset, name)]
+    return select, prefetch
+
+
+def message_queryset(fieldset=None, model=UserMessage):
+    """
+    Messages with everything MessageSerializer renders for the sender and
+    the attachment, narrowed to the columns and relations a sparse fieldset asks for.
+    ``model`` is UserMessage or ArchivedMessage, archived messages have no attachment.
+    """
+    queryset = only_columns(model.objects.all(), fieldset, MESSAGE_REQUIRED_FIELDS)
+    if wants(fieldset, 'sender'):
+        select, prefetch = user_lookups('sender', subset(fieldset, 'sender'))
+        queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+    if model is UserMessage and wants(fieldset, 'attachment'):
+        queryset = queryset.select_related('attachment')
+    return queryset
+
+
+def without_attachments(messages):
+    """Record that freshly created messages have no attachment, sparing a query each when serialized."""
+    for message in messages:
+        UserMessage.attachment.related.set_cached_value(message, None)
+    return messages
+
+
+def prefetch_messages(targets, fieldset=None):
+    """
+    Load the messages of many Club/UserProfile targets with one query per
+    target model and cache them on each instance, where the ``messages``
+    property picks them up instead of querying again.
+    """
+    targets = list(targets)
+    by_model = defaultdict(dict)
+    for target in targets:
+        target._prefetched_messages = []
+        by_model[target.__class__][target.id] = target
+
+    for model, instances in by_model.items():
+        content_type = get_content_type(model)
+        queryset = message_queryset(fieldset).filter(content_type=content_type,
+                                                     object_id__in=list(instances))
+        for message in queryset:
+            instances[message.object_id]._prefetched_messages.append(message)
+    return targets
+
+
+def prefetch_clubs(clubs, fieldset=None, expand=None):
+    """
+    Batch-load messages and members (with their messages) of many clubs,
+    skipping whatever the fieldset leaves out.
+    """
+    clubs = list(clubs)
+    expand = expand or {}
+    if wants(fieldset, 'messages'):
+        prefetch_messages(clubs, subset(fieldset, 'messages'))
+    if not wants(fieldset, 'club_users'):
+        return clubs
+
+    by_id = {}
+    for club in clubs:
+        club._prefetched_clubusers = []
+        by_id[club.id] = club
+
+    members = subset(fieldset, 'club_users')
+    queryset = ClubUser.objects.filter(club__in=list(by_id)).select_related('user')
+    if 'user' in expand.get('club_users', {}) and wants(members, 'user'):
+        select, prefetch = user_lookups('user__user', subset(members, 'user'))
+        queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+    profiles = {}
+    for club_user in queryset:
+        profile = profiles.setdefault(club_user.user_id, club_user.user)
+        by_id[club_user.club_id]._prefetched_clubusers.append(profile)
+    if wants(members, 'messages'):
+        prefetch_messages(profiles.values(), subset(members, 'messages'))
+    return clubs
+
+
+def prefetch_users(users, fieldset=None):
+    """Batch-load the profile messages of many users selected with their profile."""
+    users = list(users)
+    profile = subset(fieldset, 'profile')
+    if wants(fieldset, 'profile') and wants(profile, 'messages'):
+        prefetch_messages((user.userprofile for user in users), subset(profile, 'messages'))
+    return users
@@ -0,0 +1,236 @@
+"""
+Background media processing tasks, run by the workers of ``jobs``.
+
+Images get a thumbnail and their dimensions. Audio and video get their
+duration, audio also a waveform summary. WAV files are read natively and
+MP4/QuickTime durations come from the movie header; anything else needs
+ffmpeg/ffprobe on the PATH. Avatars stored locally are resized to
+AVATAR_SIZES.
+"""
+import io
+import math
+import shutil
+import struct
+import subprocess
+import sys
+import wave
+from array import array
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import cache
+from .jobs import task
+from .models import MessageAttachment, UserProfile
+
+THUMBNAIL_SIZE = (320, 320)
+AVATAR_SIZES = (64, 128, 256)
+WAVEFORM_POINTS = 100
+BLOCK_FRAMES = 64 * 1024
+
+WAV_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave', 'audio/vnd.wave')
+MP4_TYPES = ('video/mp4', 'video/quicktime', 'audio/mp4', 'audio/x-m4a', 'audio/m4a')
+# Sample width in bytes: array typecode and the value of silence.
+SAMPLE_TYPES = {1: ('B', 128), 2: ('h', 0), 4: ('i', 0)}
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+
+@task('process_attachment')
+def process_attachment(message_id):
+    attachment = MessageAttachment.objects.select_related('message').filter(message_id=message_id).first()
+    if attachment is None:
+        return
+    kind = attachment.mime_type.split('/')[0]
+    with attachment.file.open('rb') as file:
+        if kind == 'image':
+            make_thumbnail(attachment, file)
+        elif kind in ('audio', 'video'):
+            attachment.duration, attachment.waveform = media_summary(attachment, file, kind == 'audio')
+    attachment.processed_at = timezone.now()
+    attachment.save()
+    cache.invalidate_targets([(attachment.message.content_type_id, attachment.message.object_id)])
+
+
+def encode_image(image, format):
+    output = io.BytesIO()
+    image.save(output, format)
+    return output.getvalue()
+
+
+def make_thumbnail(attachment, file):
+    with Image.open(file) as image:
+        attachment.width, attachment.height = image.size
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            # Rotated a quarter turn by its EXIF orientation.
+            attachment.width, attachment.height = attachment.height, attachment.width
+        # JPEGs are decoded straight at a reduced scale.
+        image.draft('RGB', THUMBNAIL_SIZE)
+        thumbnail = ImageOps.exif_transpose(image)
+        thumbnail.thumbnail(THUMBNAIL_SIZE)
+        if thumbnail.mode not in ('RGB', 'L'):
+            thumbnail = thumbnail.convert('RGB')
+        attachment.thumbnail.save('%s.jpg' % attachment.message_id,
+                                  ContentFile(encode_image(thumbnail, 'JPEG')), save=False)
+
+
+def local_path(file):
+    try:
+        return file.path
+    except NotImplementedError:
+        return None
+
+
+def media_summary(attachment, file, with_waveform):
+    """The duration in seconds and, if asked for, the waveform of an audio or video file."""
+    if attachment.mime_type in WAV_TYPES:
+        duration, waveform = wav_summary(file)
+        return duration, waveform if with_waveform else None
+    path = local_path(attachment.file)
+    if FFPROBE and FFMPEG and path:
+        return ffmpeg_summary(path, with_waveform)
+    if attachment.mime_type in MP4_TYPES:
+        return mp4_duration(file), None
+    return None, None
+
+
+def peak(samples, silence):
+    return max(max(samples) - silence, silence - min(samples)) if samples else 0
+
+
+def scale(peaks, width):
+    full = 2 ** (8 * width - 1)
+    return [min(100, round(100 * value / full)) for value in peaks]
+
+
+def wav_summary(file, points=WAVEFORM_POINTS):
+    """
+    Duration and waveform of a PCM WAV file: the peak amplitude, 0 to 100,
+    of each of ``points`` equal slices. Read in blocks, never whole.
+    """
+    with wave.open(file) as wav:
+        width, channels = wav.getsampwidth(), wav.getnchannels()
+        frames, rate = wav.getnframes(), wav.getframerate()
+        duration = frames / rate if rate else None
+        if width not in SAMPLE_TYPES or not frames:
+            return duration, None
+        typecode, silence = SAMPLE_TYPES[width]
+        per_point = math.ceil(frames / points)
+
+        peaks = []
+        remaining = frames
+        while remaining > 0:
+            count = min(per_point, remaining)
+            remaining -= count
+            value = 0
+            while count > 0:
+                data = wav.readframes(min(count, BLOCK_FRAMES))
+                if not data:
+                    remaining = 0
+                    break
+                count -= len(data) // (width * channels)
+                samples = array(typecode, data)
+                if width > 1 and sys.byteorder == 'big':
+                    samples.byteswap()
+                value = max(value, peak(samples, silence))
+            peaks.append(value)
+        return duration, scale(peaks, width)
+
+
+def ffmpeg_summary(path, with_waveform, points=WAVEFORM_POINTS, rate=8000):
+    """Duration from ffprobe and a waveform from ffmpeg decoding to 16 bit mono PCM."""
+    probe = subprocess.run([FFPROBE, '-v', 'error', '-show_entries', 'format=duration',
+                            '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                           capture_output=True, text=True, timeout=120)
+    try:
+        duration = float(probe.stdout.strip())
+    except ValueError:
+        return None, None
+    if not with_waveform:
+        return duration, None
+
+    per_point = max(1, math.ceil(duration * rate / points))
+    decoder = subprocess.Popen([FFMPEG, '-v', 'error', '-i', path, '-ac', '1', '-ar', str(rate),
+                                '-f', 's16le', '-'], stdout=subprocess.PIPE)
+    peaks = []
+    with decoder.stdout:
+        for data in iter(lambda: decoder.stdout.read(per_point * 2), b''):
+            samples = array('h', data[:len(data) // 2 * 2])
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            peaks.append(peak(samples, 0))
+    decoder.wait()
+    return duration, scale(peaks, 2)
+
+
+def mp4_boxes(file, start, end):
+    """(type, content start, end) of the boxes between two offsets of an MP4 file."""
+    position = start
+    while end is None or position + 8 <= end:
+        file.seek(position)
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size, header_size = struct.unpack('>Q', file.read(8))[0], 16
+        elif size == 0:
+            file.seek(0, io.SEEK_END)
+            size = file.tell() - position
+        if size < header_size:
+            return
+        yield kind, position + header_size, position + size
+        position += size
+
+
+def mp4_duration(file):
+    """The duration in the movie header of an MP4/QuickTime file, found by seeking from box to box."""
+    for kind, start, end in mp4_boxes(file, 0, None):
+        if kind != b'moov':
+            continue
+        for kind, start, end in mp4_boxes(file, start, end):
+            if kind == b'mvhd':
+                file.seek(start)
+                version = file.read(4)[0]
+                if version == 1:
+                    _, _, timescale, duration = struct.unpack('>QQIQ', file.read(28))
+                else:
+                    _, _, timescale, duration = struct.unpack('>IIII', file.read(16))
+                return duration / timescale if timescale else None
+    return None
+
+
+def media_name(url):
+    """The storage name of a URL under MEDIA_URL, None for anything stored elsewhere."""
+    if url and url.startswith(settings.MEDIA_URL):
+        return url[len(settings.MEDIA_URL):]
+    return None
+
+
+def avatar_outdated(profile):
+    """Whether a profile's avatar is stored locally and not resized yet."""
+    return media_name(profile.avatar) is not None and profile.avatar_sizes.get('source') != profile.avatar
+
+
+@task('resize_avatar')
+def resize_avatar(profile_id):
+    profile = UserProfile.objects.filter(id=profile_id).first()
+    if profile is None or not avatar_outdated(profile):
+        return
+    sizes = {'source': profile.avatar}
+    with default_storage.open(media_name(profile.avatar), 'rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        for size in AVATAR_SIZES:
+            name = 'avatars/%s/%s.png' % (profile.id, size)
+            default_storage.delete(name)
+            resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            sizes[str(size)] = default_storage.url(
+                default_storage.save(name, ContentFile(encode_image(resized, 'PNG'))))
+    # An update, saving the profile would queue this job again.
+    UserProfile.objects.filter(id=profile.id).update(avatar_sizes=sizes)
+    cache.invalidate_sender(profile.user_id)
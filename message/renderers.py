@@ -0,0 +1,58 @@
+import datetime
+import decimal
+import uuid
+
+import msgpack
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+# Extension type carrying a UUID as its 16 raw bytes. Datetimes use the
+# standard msgpack timestamp extension (-1).
+UUID_EXT = 1
+
+
+def encode(obj):
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(UUID_EXT, obj.bytes)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        # Aware datetimes are packed as timestamps, naive ones land here.
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (decimal.Decimal, Promise)):
+        return str(obj)
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError('Object of type %s is not MessagePack serializable' % type(obj).__name__)
+
+
+def decode(code, data):
+    if code == UUID_EXT:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def packb(data):
+    return msgpack.packb(data, default=encode, datetime=True, use_bin_type=True)
+
+
+def unpackb(data):
+    return msgpack.unpackb(data, ext_hook=decode, timestamp=3, raw=False)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack. Serializers rendered through it hand over datetimes
+    and UUIDs as they are (see ``native_values``) which are then packed as
+    timestamps and 16 byte extensions instead of ISO 8601 and hex strings.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    native_values = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return packb(data)
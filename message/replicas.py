@@ -0,0 +1,114 @@
+"""
+Read replica routing.
+
+Safe requests to views with ``ReplicaReadMixin`` read from one of
+DATABASE_REPLICAS, everything else uses the default database. Replicas lag
+behind, so reads stay on the primary:
+
+- for the rest of a request once it wrote anything,
+- for REPLICA_PIN_SECONDS after a request of the same user wrote anything,
+  ``ReplicaMiddleware`` pins the user in the shared cache.
+
+Without the middleware, or with no replica configured, every query goes to
+the default database.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class State:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def pin_key(user_id):
+    return 'replica:pin:%s' % user_id
+
+
+def pin(user_id):
+    """Keep a user's reads on the primary until replicas caught up with their writes."""
+    cache.set(pin_key(user_id), 1, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def pinned(user):
+    return user is not None and user.is_authenticated and cache.get(pin_key(user.pk)) is not None
+
+
+def read_from_replica(user):
+    """Send the reads of the current request to a replica, unless ``user`` wrote lately."""
+    state = _state.get()
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    if state is None or not replicas or state.wrote or pinned(user):
+        return None
+    state.replica = random.choice(replicas)
+    return state.replica
+
+
+def reading_replica():
+    """The replica the current request reads from, None on the primary."""
+    state = _state.get()
+    return state.replica if state is not None and not state.wrote else None
+
+
+def replica_instance(hints):
+    """The primary for an instance read from a replica, Django would use the replica for it."""
+    instance = hints.get('instance')
+    if instance is not None and instance._state.db in getattr(settings, 'DATABASE_REPLICAS', ()):
+        return DEFAULT_DB_ALIAS
+    return None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return reading_replica() or replica_instance(hints)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return replica_instance(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """Scopes routing to a request and pins users who wrote to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = State()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin(user.pk)
+        return response
+
+
+class ReplicaReadMixin:
+    """Serves safe requests of a view from a replica, once the user is authenticated."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            read_from_replica(request.user)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/v1/messages/users/<uuid:user_id>/', consumers.UserMessageConsumer.as_asgi()),
+    path('ws/v1/messages/clubs/<uuid:club_id>/', consumers.ClubMessageConsumer.as_asgi()),
+]
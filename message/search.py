@@ -0,0 +1,91 @@
+from django.db import connections
+from django.db.models import Q
+
+from .models import UserMessage
+
+TABLE = UserMessage._meta.db_table
+FTS_TABLE = '%s_fts' % TABLE
+KEYS_TABLE = '%s_search_keys' % TABLE
+SEARCH_CONFIG = 'english'
+
+
+def create_search_index(schema_editor):
+    """
+    Build the full-text index of message bodies: a GIN index over the body's
+    tsvector on PostgreSQL, an FTS5 table kept in sync by triggers on SQLite.
+    Either way the database maintains it on every insert, update and delete,
+    bulk ones included.
+
+    FTS5 rows need an integer key and the implicit rowid of the message
+    table is no key, VACUUM may renumber it. Every message gets one in a key
+    table instead, its INTEGER PRIMARY KEY is the rowid of the message's
+    FTS5 row.
+
+    On SQLite, migrations that rebuild the message table drop the triggers
+    and must create them again. Migrations keep their own copy of the SQL,
+    this is the current one.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS message_body_search_idx ON %s "
+            "USING GIN (to_tsvector('%s', coalesce(body, '')))" % (TABLE, SEARCH_CONFIG))
+    elif vendor == 'sqlite':
+        for statement in (
+            "CREATE TABLE IF NOT EXISTS {keys} (id integer NOT NULL PRIMARY KEY, "
+            "message_id char(32) NOT NULL UNIQUE)",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(body)",
+            "CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+            "INSERT INTO {keys}(message_id) VALUES (new.id); "
+            "INSERT INTO {fts}(rowid, body) "
+            "VALUES ((SELECT id FROM {keys} WHERE message_id = new.id), new.body); END",
+            "CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+            "DELETE FROM {fts} WHERE rowid = (SELECT id FROM {keys} WHERE message_id = old.id); "
+            "DELETE FROM {keys} WHERE message_id = old.id; END",
+            "CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF body ON {table} BEGIN "
+            "UPDATE {fts} SET body = new.body "
+            "WHERE rowid = (SELECT id FROM {keys} WHERE message_id = new.id); END",
+            # Catch up with whatever changed while the triggers were missing.
+            "DELETE FROM {keys} WHERE message_id NOT IN (SELECT id FROM {table})",
+            "INSERT INTO {keys}(message_id) SELECT id FROM {table} "
+            "WHERE id NOT IN (SELECT message_id FROM {keys}) ORDER BY created_at",
+            "DELETE FROM {fts}",
+            "INSERT INTO {fts}(rowid, body) SELECT k.id, m.body FROM {keys} k "
+            "JOIN {table} m ON m.id = k.message_id",
+        ):
+            schema_editor.execute(statement.format(fts=FTS_TABLE, keys=KEYS_TABLE, table=TABLE))
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS message_body_search_idx")
+    elif vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (FTS_TABLE, suffix))
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % FTS_TABLE)
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % KEYS_TABLE)
+
+
+def fts5_query(text):
+    """Quote every term so user input can't inject FTS5 query syntax."""
+    return ' '.join('"%s"' % term.replace('"', '""') for term in text.split())
+
+
+def search_messages(queryset, text):
+    """Narrow a message queryset to the messages whose body matches every term of ``text``."""
+    if not text.split():
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        where = "to_tsvector('%s', coalesce(%s.body, '')) @@ plainto_tsquery('%s', %%s)" % (
+            SEARCH_CONFIG, TABLE, SEARCH_CONFIG)
+        return queryset.extra(where=[where], params=[text])
+    if vendor == 'sqlite':
+        where = "%s.id IN (SELECT message_id FROM %s WHERE id IN (SELECT rowid FROM %s WHERE %s MATCH %%s))" % (
+            TABLE, KEYS_TABLE, FTS_TABLE, FTS_TABLE)
+        return queryset.extra(where=[where], params=[fts5_query(text)])
+    terms = Q()
+    for term in text.split():
+        terms &= Q(body__icontains=term)
+    return queryset.filter(terms)
@@ -1,13 +1,30 @@
 import re
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import (UserProfile, Club, ClubUser, UserMessage)
+from .contenttypes import TARGET_LABELS, get_target_label
+from .fieldsets import FieldsetMixin, wants
+from .models import (UserProfile, Club, ClubUser, UserMessage, InboxEntry, MediaUpload,
+                     MessageAttachment)
+
+
+def add_user_claims(token, user):
+    """The user claims StatelessJWTAuthentication serves requests from."""
+    profile = user.userprofile
+    token['username'] = user.username
+    token['email'] = user.email
+    token['avatar'] = profile.avatar
+    token['about'] = profile.about
+    token['is_staff'] = user.is_staff
+    token['id'] = user.id
+    return token
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -21,20 +38,18 @@ class RegistrationSerializer(serializers.ModelSerializer):
         model = User
         fields = ['email', 'username', 'password', 'access', 'refresh']
 
-    @classmethod
-    def get_access(cls, obj):
-        token = RefreshToken.for_user(obj)
-        token['username'] = obj.username
-        token['avatar'] = obj.userprofile.avatar
-        token['about'] = obj.userprofile.about
-        token['is_staff'] = obj.is_staff
-        token['id'] = obj.id
-        return str(token.access_token)
+    def get_tokens(self, obj):
+        # access and refresh are rendered from one token pair, minted once.
+        if getattr(self, '_tokens', (None,))[0] is not obj:
+            token = add_user_claims(RefreshToken.for_user(obj), obj)
+            self._tokens = (obj, {'access': str(token.access_token), 'refresh': str(token)})
+        return self._tokens[1]
 
-    @classmethod
-    def get_refresh(cls, obj):
-        token = RefreshToken.for_user(obj)
-        return str(token)
+    def get_access(self, obj):
+        return self.get_tokens(obj)['access']
+
+    def get_refresh(self, obj):
+        return self.get_tokens(obj)['refresh']
 
     @classmethod
     def validate_password(cls, password):
@@ -80,51 +95,69 @@ class ContentObjectRelatedField(serializers.RelatedField):
         return serializer.data
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(FieldsetMixin, serializers.ModelSerializer):
     messages = serializers.SerializerMethodField()
+    expandable_fields = {'user': 'UserSummarySerializer'}
 
     class Meta:
         model = UserProfile
         fields = '__all__'
 
-    @classmethod
-    def get_messages(cls, obj):
-        return MessageSerializer(obj.messages, many=True).data
+    def get_messages(self, obj):
+        return MessageSerializer(obj.messages, many=True, **self.nested('messages')).data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FieldsetMixin, serializers.ModelSerializer):
     profile = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         exclude = ("password",)
 
-    @classmethod
-    def get_profile(cls, obj):
+    def get_profile(self, obj):
         profile = obj.userprofile
-        serializer = UserProfileSerializer(profile, many=False)
+        serializer = UserProfileSerializer(profile, many=False, **self.nested('profile'))
         return serializer.data
 
 
-class LoginSerializer(TokenObtainPairSerializer):
+class ProfileSummarySerializer(FieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = {'user': 'UserSummarySerializer'}
+
+    class Meta:
+        model = UserProfile
+        fields = '__all__'
+
+
+class UserSummarySerializer(UserSerializer):
+    """
+    A user without the profile's messages. Used for message senders, where
+    nesting them recursed forever on two-way conversations, and at login,
+    whose cost must not grow with the user's history.
+    """
+
+    def get_profile(self, obj):
+        return ProfileSummarySerializer(obj.userprofile, **self.nested('profile')).data
+
+
+class LoginSerializer(FieldsetMixin, TokenObtainPairSerializer):
+    """
+    The tokens and a summary of the user who logged in, whose profile comes
+    without its messages unless expanded: ``?expand=profile``.
+    """
     username = serializers.CharField()
     password = serializers.CharField(style={'input_type': 'password'})
+    expandable_fields = {'profile': 'UserProfileSerializer'}
 
     @classmethod
     def get_token(cls, user):
-        token = super().get_token(user)
-        token['username'] = user.username
-        token['email'] = user.email
-        token['avatar'] = user.userprofile.avatar
-        token['is_staff'] = user.is_staff
-        token['id'] = user.id
-        return token
+        return add_user_claims(super().get_token(user), user)
 
     def validate(self, attrs):
         data = super().validate(attrs)
-        serializer = UserSerializer(self.user).data
-        for k, v in serializer.items():
-            data[k] = v
+        data.update(UserSummarySerializer(self.user, fields=self.fieldset, expand=self.expansions,
+                                          native=self.native).data)
+        if 'profile' in self.expansions and wants(self.fieldset, 'profile'):
+            data['profile'] = self.expandable('profile')(self.user.userprofile, **self.nested('profile')).data
         return data
 
 
@@ -156,9 +189,10 @@ class ResetPasswordSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ClubSerializer(serializers.ModelSerializer):
+class ClubSerializer(FieldsetMixin, serializers.ModelSerializer):
     messages = serializers.SerializerMethodField()
     club_users = serializers.SerializerMethodField()
+    expandable_fields = {'owner': 'UserSummarySerializer'}
 
     class Meta:
         model = Club
@@ -166,13 +200,28 @@ class ClubSerializer(serializers.ModelSerializer):
         read_only_fields = ('messages', 'owner', 'club_users',)
         # depth = 1
 
-    @classmethod
-    def get_messages(cls, obj):
-        return MessageSerializer(obj.messages, many=True).data
-
-    @classmethod
-    def get_club_users(cls, obj):
-        return UserProfileSerializer(obj.clubusers, many=True).data
+    def hidden(self, obj):
+        """Whether ``obj`` is left out of the ``member_clubs`` in the context, when given."""
+        clubs = self.context.get('member_clubs')
+        return clubs is not None and obj.id not in clubs
+
+    def get_messages(self, obj):
+        if self.hidden(obj):
+            return None
+        return MessageSerializer(obj.messages, many=True, **self.nested('messages')).data
+
+    def get_club_users(self, obj):
+        if self.hidden(obj):
+            return None
+        return UserProfileSerializer(obj.clubusers, many=True, **self.nested('club_users')).data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Only members see what is said in a club and who is in it.
+        if self.hidden(instance):
+            data.pop('messages', None)
+            data.pop('club_users', None)
+        return data
 
     def create(self, validated_data):
         user = self.context['user']
@@ -182,7 +231,7 @@ class ClubSerializer(serializers.ModelSerializer):
         return club
 
 
-class ClubUserSerializer(serializers.ModelSerializer):
+class ClubUserSerializer(FieldsetMixin, serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
     club = ClubSerializer(read_only=True)
 
@@ -198,10 +247,76 @@ class ClubUserSerializer(serializers.ModelSerializer):
         return club_user
 
 
-class MessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer(read_only=True)
+class MessageAttachmentSerializer(FieldsetMixin, serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MessageAttachment
+        fields = ('url', 'thumbnail_url', 'filename', 'mime_type', 'size', 'checksum',
+                  'width', 'height', 'duration', 'waveform', 'processed_at',)
+
+    @classmethod
+    def get_url(cls, obj):
+        return reverse('messages:message-media', args=[obj.message_id])
+
+    @classmethod
+    def get_thumbnail_url(cls, obj):
+        if not obj.thumbnail:
+            return None
+        return '%s?variant=thumbnail' % cls.get_url(obj)
+
+
+class MessageSerializer(FieldsetMixin, serializers.ModelSerializer):
+    sender = UserSummarySerializer(read_only=True)
+    attachment = MessageAttachmentSerializer(read_only=True, default=None)
 
     class Meta:
         model = UserMessage
         fields = '__all__'
         read_only_fields = ('content_type', 'object_id',)
+
+
+class BulkMessageSerializer(serializers.ModelSerializer):
+    """One item of a bulk ingest request, addressed to a club or a user's profile."""
+    target_type = serializers.ChoiceField(choices=tuple(TARGET_LABELS.values()))
+    target_id = serializers.UUIDField()
+
+    class Meta:
+        model = UserMessage
+        fields = ('body', 'body_type', 'msg_type', 'target_type', 'target_id',)
+
+
+class MediaUploadSerializer(serializers.ModelSerializer):
+    """Starts a chunked media upload, addressed like a bulk message item."""
+    target_type = serializers.ChoiceField(choices=tuple(TARGET_LABELS.values()), write_only=True)
+    target_id = serializers.UUIDField(write_only=True)
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', help_text='SHA-256 of the whole file.')
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = MediaUpload
+        fields = ('id', 'target_type', 'target_id', 'body', 'body_type', 'filename', 'mime_type',
+                  'size', 'checksum', 'offset', 'status', 'message', 'created_at',)
+        read_only_fields = ('status', 'message',)
+
+    @classmethod
+    def validate_size(cls, size):
+        max_size = getattr(settings, 'MEDIA_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+        if not 0 < size <= max_size:
+            raise serializers.ValidationError('Size must be between 1 and %s bytes.' % max_size)
+        return size
+
+
+class InboxEntrySerializer(serializers.ModelSerializer):
+    target_type = serializers.SerializerMethodField()
+
+    class Meta:
+        model = InboxEntry
+        fields = ('id', 'target_type', 'object_id', 'last_message', 'last_message_at',
+                  'preview', 'unread_count', 'last_read_at',)
+        read_only_fields = fields
+
+    @classmethod
+    def get_target_type(cls, obj):
+        return get_target_label(obj.content_type_id)
@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, cache, db, inbox, jobs, membership, processing
+from .models import Club, ClubUser, MessageAttachment, UserMessage, UserProfile
+
+
+@receiver(post_save, sender=UserMessage)
+def record_message(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        inbox.record_messages([instance])
+    elif update_fields and 'deleted_at' in update_fields and instance.deleted_at is not None:
+        inbox.forget_soft_deleted(instance)
+
+
+@receiver(post_delete, sender=UserMessage)
+def forget_message(sender, instance, **kwargs):
+    # A soft deleted message already left the inbox.
+    if instance.deleted_at is None:
+        inbox.forget_message(instance)
+
+
+@receiver(post_delete, sender=Club)
+@receiver(post_delete, sender=UserProfile)
+def forget_target(sender, instance, **kwargs):
+    inbox.forget_target(instance)
+
+
+@receiver(post_delete, sender=ClubUser)
+def forget_membership(sender, instance, **kwargs):
+    inbox.forget_membership(instance)
+
+
+@receiver(post_save, sender=UserMessage)
+@receiver(post_delete, sender=UserMessage)
+def invalidate_message_target(sender, instance, **kwargs):
+    cache.invalidate_targets([(instance.content_type_id, instance.object_id)])
+
+
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+def invalidate_club(sender, instance, **kwargs):
+    cache.invalidate(clubs=[instance.id])
+
+
+@receiver(post_save, sender=ClubUser)
+@receiver(post_delete, sender=ClubUser)
+def invalidate_membership(sender, instance, **kwargs):
+    cache.invalidate(clubs=[instance.club_id])
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile(sender, instance, created, **kwargs):
+    if not created:
+        cache.invalidate_sender(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, **kwargs):
+    if not created:
+        cache.invalidate_sender(instance.id)
+
+
+@receiver(post_save, sender=ClubUser)
+@receiver(post_delete, sender=ClubUser)
+def forget_membership_cache(sender, instance, **kwargs):
+    membership.forget(instance.user.user_id)
+
+
+@receiver(post_save, sender=Club)
+def forget_ownership_cache(sender, instance, created, **kwargs):
+    if not created:
+        membership.clear()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_authenticated_user(sender, instance, **kwargs):
+    authentication.forget_user(instance.id)
+
+
+@receiver(post_save, sender=MessageAttachment)
+def process_attachment(sender, instance, created, **kwargs):
+    if created:
+        jobs.enqueue('process_attachment', instance.message_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def resize_avatar(sender, instance, **kwargs):
+    if processing.avatar_outdated(instance):
+        jobs.enqueue('resize_avatar', instance.id)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    db.check_connections()
@@ -1,7 +1,1181 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+import gzip
+import hashlib
+import io
+import json
+import os
+import struct
+import tempfile
+import wave
+from unittest import mock
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import connection, router
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from config.asgi import application
+
+from . import (archive, authentication, contenttypes, db, ids, inbox, jobs, membership, metrics, partitioning,
+               processing, replicas, search, throttling)
+from .authentication import StatelessJWTAuthentication
+from .models import (ArchivedMessage, Club, ClubUser, InboxEntry, MediaJob, MediaUpload, MessageAttachment, UserMessage,
+                     UserProfile)
+from .renderers import packb, unpackb
+from .serializers import LoginSerializer
+
 
 # Create your tests here.
 class TestMessageApp(TestCase):
 
 	def test_message_app(self):
 		self.assertEquals(True, True)
+
+
+class MessageTestMixin:
+
+    def create_user(self, username):
+        return User.objects.create_user(username=username, email='%s@example.com' % username,
+                                        password='Passw0rd!')
+
+    def create_club(self, owner, title='club'):
+        club = Club.objects.create(owner=owner, title=title)
+        ClubUser.objects.create(user=owner.userprofile, club=club)
+        return club
+
+    def create_messages(self, sender, target, count):
+        # Time-ordered ids keep messages made in the same millisecond in order.
+        return [UserMessage.objects.create(sender=sender, body='message %s' % i, content_object=target)
+                for i in range(count)]
+
+
+class TestMessageHistory(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+
+    def fetch_all(self, url):
+        pages, ids = 0, []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [message['id'] for message in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return pages, ids
+
+    def test_club_history_pages_newest_first(self):
+        messages = self.create_messages(self.user, self.club, 7)
+        url = reverse('messages:message-group', args=[self.club.id]) + '?page_size=3'
+        pages, ids = self.fetch_all(url)
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [str(message.id) for message in reversed(messages)])
+
+    def test_club_history_breaks_timestamp_ties_on_id(self):
+        messages = self.create_messages(self.user, self.club, 5)
+        UserMessage.objects.update(created_at=timezone.now())
+        url = reverse('messages:message-group', args=[self.club.id]) + '?page_size=2'
+        _, ids = self.fetch_all(url)
+        self.assertEqual(sorted(ids), sorted(str(message.id) for message in messages))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_user_history_is_the_conversation(self):
+        sent = self.create_messages(self.user, self.other.userprofile, 2)
+        received = self.create_messages(self.other, self.user.userprofile, 2)
+        third = self.create_user('carol')
+        self.create_messages(third, self.other.userprofile, 2)
+        url = reverse('messages:message-user', args=[self.other.userprofile.id])
+        _, ids = self.fetch_all(url)
+        self.assertEqual(sorted(ids), sorted(str(message.id) for message in sent + received))
+
+    def test_invalid_cursor(self):
+        url = reverse('messages:message-group', args=[self.club.id]) + '?cursor=bogus'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+
+class TestQueryCounts(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.client.force_authenticate(self.user)
+        ContentType.objects.get_for_models(Club, UserProfile)
+
+    def seed(self, clubs, members, messages):
+        for i in range(Club.objects.count(), Club.objects.count() + clubs):
+            club = self.create_club(self.user, title='club %s' % i)
+            for j in range(members):
+                member = self.create_user('member%s_%s' % (i, j))
+                ClubUser.objects.create(user=member.userprofile, club=club)
+                self.create_messages(member, club, messages)
+                self.create_messages(member, self.user.userprofile, messages)
+
+    def test_club_list_is_constant(self):
+        self.seed(clubs=1, members=1, messages=1)
+        # Joining a club drops the owner's cached membership, read again each time.
+        with self.assertNumQueries(9):
+            self.client.get(reverse('messages:clubs'))
+        self.seed(clubs=4, members=3, messages=3)
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('messages:clubs'))
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(response.data[1]['club_users']), 4)
+
+    def test_user_list_is_constant(self):
+        self.seed(clubs=1, members=1, messages=1)
+        with self.assertNumQueries(6):
+            self.client.get(reverse('messages:users-info'))
+        self.seed(clubs=2, members=3, messages=2)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('messages:users-info'))
+        self.assertEqual(len(response.data), 8)
+
+
+class TestSparseFieldsets(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.create_messages(self.user, self.club, 3)
+        self.client.force_authenticate(self.user)
+        ContentType.objects.get_for_models(Club, UserProfile)
+
+    def test_messages_are_narrowed_with_their_queryset(self):
+        url = reverse('messages:message-group', args=[self.club.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(url + '?fields=id,body,created_at,sender.username')
+        self.assertEqual(response.data['results'][0], {
+            'id': response.data['results'][0]['id'], 'body': 'message 2',
+            'created_at': response.data['results'][0]['created_at'], 'sender': {'username': 'alice'}})
+
+    def test_unrequested_collections_are_not_loaded(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('messages:clubs') + '?fields=id,title')
+        self.assertEqual(response.data, [{'id': str(self.club.id), 'title': 'club'}])
+
+    def test_expand_renders_related_objects(self):
+        url = reverse('messages:club', args=[self.club.id])
+        self.assertEqual(self.client.get(url).data['owner'], self.user.id)
+        response = self.client.get(url + '?fields=title,owner.username,club_users.about&expand=owner')
+        self.assertEqual(response.data, {'title': 'club', 'owner': {'username': 'alice'},
+                                         'club_users': [{'about': self.user.userprofile.about}]})
+
+
+class TestMessagePack(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-group', args=[self.club.id])
+
+    def test_messages_render_with_native_values(self):
+        [message] = self.create_messages(self.user, self.club, 1)
+        response = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        [data] = unpackb(response.content)['results']
+        message.refresh_from_db()
+        self.assertEqual((data['id'], data['created_at'], data['object_id']),
+                         (message.id, message.created_at, self.club.id))
+        self.assertEqual(data['sender']['username'], 'alice')
+        self.assertIsInstance(self.client.get(self.url).data['results'][0]['created_at'], str)
+
+    def test_messages_can_be_posted_as_msgpack(self):
+        response = self.client.post(self.url, packb({'body': 'packed'}), content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UserMessage.objects.get().body, 'packed')
+        response = self.client.post(self.url, b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestMessageDelivery(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.other)
+
+    def connect(self, path, user):
+        return WebsocketCommunicator(application, '%s?token=%s' % (path, AccessToken.for_user(user)))
+
+    async def test_club_post_reaches_members(self):
+        await sync_to_async(ClubUser.objects.create)(user=self.other.userprofile, club=self.club)
+        communicator = self.connect('/ws/v1/messages/clubs/%s/' % self.club.id, self.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        url = reverse('messages:message-group', args=[self.club.id])
+        response = await sync_to_async(self.client.post)(url, {'body': 'hello'})
+        self.assertEqual(await communicator.receive_json_from(), response.data)
+        await communicator.disconnect()
+
+    async def test_user_post_reaches_recipient(self):
+        profile = self.user.userprofile
+        communicator = self.connect('/ws/v1/messages/users/%s/' % profile.id, self.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        url = reverse('messages:message-user', args=[profile.id])
+        response = await sync_to_async(self.client.post)(url, {'body': 'hi'})
+        self.assertEqual((await communicator.receive_json_from())['id'], response.data['id'])
+        await communicator.disconnect()
+
+    async def test_non_member_is_rejected(self):
+        communicator = self.connect('/ws/v1/messages/clubs/%s/' % self.club.id, self.other)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_sockets_are_refused_without_a_channel_layer(self):
+        profile = self.user.userprofile
+        with self.settings(CHANNEL_LAYERS={}):
+            connected, _ = await self.connect('/ws/v1/messages/users/%s/' % profile.id, self.user).connect()
+            self.assertFalse(connected)
+            url = reverse('messages:message-user', args=[profile.id])
+            response = await sync_to_async(self.client.post)(url, {'body': 'hi'})
+        self.assertEqual(response.status_code, 201)
+
+    async def test_other_inbox_is_rejected(self):
+        path = '/ws/v1/messages/users/%s/' % self.user.userprofile.id
+        connected, _ = await WebsocketCommunicator(application, path).connect()
+        self.assertFalse(connected)
+        connected, _ = await self.connect(path, self.other).connect()
+        self.assertFalse(connected)
+
+
+class TestBulkMessages(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-bulk')
+        ContentType.objects.get_for_models(Club, UserProfile)
+
+    def test_bulk_create_reports_each_item(self):
+        items = [
+            {'target_type': 'club', 'target_id': str(self.club.id), 'body': 'to club'},
+            {'target_type': 'user', 'target_id': str(self.other.userprofile.id), 'body': 'to bob'},
+            {'target_type': 'planet', 'target_id': str(self.club.id), 'body': 'nowhere'},
+            {'target_type': 'user', 'target_id': str(self.club.id), 'body': 'missing'},
+        ]
+        response = self.client.post(self.url, items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data], [201, 201, 400, 404])
+        self.assertEqual(UserMessage.objects.filter_by_instance(self.club).get().body, 'to club')
+        self.assertEqual(UserMessage.objects.filter_by_instance(self.other.userprofile).get().id,
+                         UUID(response.data[1]['id']))
+
+    def test_bulk_create_query_count_is_constant(self):
+        items = [{'target_type': 'club', 'target_id': str(self.club.id), 'body': 'one'},
+                 {'target_type': 'user', 'target_id': str(self.other.userprofile.id), 'body': 'two'}]
+        # Warms the membership cache and creates the inbox entries.
+        self.client.post(self.url, items)
+        counts = []
+        for size in (2, 50):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, items * (size // 2))
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(UserMessage.objects.count(), 54)
+
+    def test_bulk_create_expects_a_list(self):
+        response = self.client.post(self.url, {'body': 'hello'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestInbox(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        ClubUser.objects.create(user=self.other.userprofile, club=self.club)
+        self.client.force_authenticate(self.user)
+
+    def inbox(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('messages:inbox'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_club_messages_update_members(self):
+        self.create_messages(self.other, self.club, 3)
+        [entry] = self.inbox(self.user)
+        self.assertEqual((entry['target_type'], entry['unread_count']), ('club', 3))
+        self.assertEqual(entry['preview'], 'message 2')
+        [entry] = self.inbox(self.other)
+        self.assertEqual(entry['unread_count'], 0)
+
+    def test_direct_messages_are_keyed_by_the_other_side(self):
+        self.create_messages(self.other, self.user.userprofile, 2)
+        [entry] = self.inbox(self.user)
+        self.assertEqual((entry['target_type'], entry['object_id']), ('user', str(self.other.userprofile.id)))
+        self.assertEqual(entry['unread_count'], 2)
+        self.create_messages(self.user, self.other.userprofile, 1)
+        [entry] = self.inbox(self.user)
+        self.assertEqual(entry['unread_count'], 0)
+        [entry] = self.inbox(self.other)
+        self.assertEqual((entry['object_id'], entry['unread_count']), (str(self.user.userprofile.id), 1))
+
+    def test_delete_rolls_back_to_previous_message(self):
+        first, second = self.create_messages(self.other, self.club, 2)
+        second.delete()
+        [entry] = self.inbox(self.user)
+        self.assertEqual((entry['last_message'], entry['unread_count']), (first.id, 1))
+        first.delete()
+        self.assertEqual(self.inbox(self.user), [])
+
+    def test_bulk_messages_update_inbox(self):
+        items = [{'target_type': 'club', 'target_id': str(self.club.id), 'body': 'bulk'}] * 4
+        self.client.post(reverse('messages:message-bulk'), items)
+        [entry] = self.inbox(self.other)
+        self.assertEqual(entry['unread_count'], 4)
+
+    def test_mark_read_and_single_query_listing(self):
+        self.create_messages(self.other, self.club, 2)
+        self.create_messages(self.other, self.user.userprofile, 2)
+        ContentType.objects.get_for_models(Club, UserProfile)
+        with self.assertNumQueries(1):
+            entries = self.inbox(self.user)
+        self.assertEqual(len(entries), 2)
+        response = self.client.post(reverse('messages:inbox-read', args=[entries[0]['id']]))
+        self.assertEqual(response.data['unread_count'], 0)
+        self.assertEqual(sum(entry['unread_count'] for entry in self.inbox(self.user)), 2)
+
+    def test_club_post_queries_dont_grow_with_members(self):
+        url = reverse('messages:message-group', args=[self.club.id])
+        counts = []
+        for members in (1, 10):
+            for index in range(members):
+                user = self.create_user('member%s_%s' % (members, index))
+                ClubUser.objects.create(user=user.userprofile, club=self.club)
+            # Creates the entries of the new members.
+            self.client.post(url, {'body': 'warm up'})
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(url, {'body': 'hello'})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(InboxEntry.objects.get(user=self.other).unread_count, 4)
+
+    def test_new_entries_fold_into_concurrent_ones(self):
+        first, second = self.create_messages(self.other, self.club, 2)
+        club_type = ContentType.objects.get_for_model(Club)
+        # Both writers saw no entry for alice, the second one inserts after the first.
+        inbox.upsert_entries([(self.user.id, club_type.id, self.club.id, second, 1, None)])
+        entry = InboxEntry.objects.get(user=self.user)
+        self.assertEqual((entry.last_message, entry.unread_count), (second, 3))
+        inbox.upsert_entries([(self.user.id, club_type.id, self.club.id, second, 0, second.created_at)])
+        entry.refresh_from_db()
+        self.assertEqual((entry.unread_count, entry.last_read_at), (0, second.created_at))
+
+    def test_later_messages_are_not_overwritten_by_earlier_ones(self):
+        first, second = self.create_messages(self.other, self.club, 2)
+        club_type = ContentType.objects.get_for_model(Club)
+        # The writer of the first message commits after the writer of the second.
+        inbox.upsert_entries([(self.user.id, club_type.id, self.club.id, first, 1, None)])
+        entry = InboxEntry.objects.get(user=self.user)
+        self.assertEqual((entry.last_message, entry.preview, entry.unread_count), (second, 'message 1', 3))
+        inbox.record_messages([first])
+        entry.refresh_from_db()
+        self.assertEqual((entry.last_message, entry.last_message_at, entry.unread_count),
+                         (second, second.created_at, 4))
+
+
+class TestContentTypes(MessageTestMixin, TestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+
+    def test_warm_resolution_is_query_free(self):
+        contenttypes.clear()
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(1):
+            contenttypes.get_content_type(Club)
+        with self.assertNumQueries(0):
+            content_type = contenttypes.get_content_type(UserProfile)
+            self.assertEqual(contenttypes.get_target_model(content_type.id), UserProfile)
+            self.assertEqual(contenttypes.get_target_label(content_type.id), 'user')
+            self.assertEqual(contenttypes.get_label_model('club'), Club)
+            UserMessage.objects.filter_by_instance(self.club)
+
+    def test_hydrate_targets_queries_once_per_model(self):
+        others = [self.create_user('user%s' % i) for i in range(3)]
+        for other in others:
+            self.create_messages(self.user, other.userprofile, 2)
+            self.create_messages(other, self.club, 2)
+        messages = list(UserMessage.objects.all())
+        with self.assertNumQueries(2):
+            contenttypes.hydrate_targets(messages)
+        with self.assertNumQueries(0):
+            targets = {message.content_object for message in messages}
+        self.assertEqual(targets, {self.club} | {other.userprofile for other in others})
+
+
+class TestRepresentationCache(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+        self.club_url = reverse('messages:club', args=[self.club.id])
+        self.user_url = reverse('messages:user-info', args=[self.user.id])
+
+    def test_club_detail_is_served_from_cache(self):
+        first = self.client.get(self.club_url).data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.club_url).data, first)
+
+    def test_club_detail_follows_messages_and_members(self):
+        self.client.get(self.club_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_messages(self.other, self.club, 1)
+        self.assertEqual(len(self.client.get(self.club_url).data['messages']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            ClubUser.objects.create(user=self.other.userprofile, club=self.club)
+        self.assertEqual(len(self.client.get(self.club_url).data['club_users']), 2)
+
+    def test_club_detail_follows_member_profiles(self):
+        ClubUser.objects.create(user=self.other.userprofile, club=self.club)
+        self.client.get(self.club_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_messages(self.user, self.other.userprofile, 1)
+        members = self.client.get(self.club_url).data['club_users']
+        self.assertEqual(sum(len(member['messages']) for member in members), 1)
+
+    def test_user_detail_follows_sender_profiles(self):
+        self.create_messages(self.other, self.user.userprofile, 1)
+        self.client.get(self.user_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.other.userprofile
+            profile.about = 'changed'
+            profile.save()
+        [message] = self.client.get(self.user_url).data['profile']['messages']
+        self.assertEqual(message['sender']['profile']['about'], 'changed')
+
+    def test_profile_changes_dont_scan_sent_messages(self):
+        self.create_messages(self.other, self.club, 3)
+        self.client.get(self.club_url)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            profile = self.other.userprofile
+            profile.about = 'changed'
+            profile.save()
+        table = UserMessage._meta.db_table
+        self.assertFalse([query for query in queries if table in query['sql']])
+        [message, *_] = self.client.get(self.club_url).data['messages']
+        self.assertEqual(message['sender']['profile']['about'], 'changed')
+
+
+class TestMessageSearch(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.foreign_club = self.create_club(self.other)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-search')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [message['body'] for message in response.data['results']]
+
+    def test_search_is_scoped_to_the_caller(self):
+        UserMessage.objects.create(sender=self.user, body='quarterly report draft', content_object=self.club)
+        UserMessage.objects.create(sender=self.other, body='report attached', content_object=self.user.userprofile)
+        UserMessage.objects.create(sender=self.other, body='secret report', content_object=self.foreign_club)
+        UserMessage.objects.create(sender=self.user, body='lunch?', content_object=self.club)
+        self.assertEqual(sorted(self.search(q='report')), ['quarterly report draft', 'report attached'])
+        self.assertEqual(self.search(q='report draft'), ['quarterly report draft'])
+        self.assertEqual(self.search(q='report', club=self.club.id), ['quarterly report draft'])
+        self.assertEqual(self.search(q='report', user=self.other.userprofile.id), ['report attached'])
+
+    def test_index_follows_updates_and_deletes(self):
+        message = UserMessage.objects.create(sender=self.user, body='old words', content_object=self.club)
+        message.body = 'new words'
+        message.save()
+        self.assertEqual(self.search(q='old'), [])
+        self.assertEqual(self.search(q='new'), ['new words'])
+        message.delete()
+        self.assertEqual(self.search(q='new'), [])
+
+    def test_index_survives_renumbered_rowids(self):
+        UserMessage.objects.create(sender=self.user, body='first words', content_object=self.club)
+        UserMessage.objects.create(sender=self.user, body='second words', content_object=self.club)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                # Like VACUUM may do to a table without an INTEGER PRIMARY KEY.
+                cursor.execute('UPDATE %s SET rowid = -rowid' % UserMessage._meta.db_table)
+        self.assertEqual(self.search(q='first'), ['first words'])
+        # Catches up with the table, as after a migration rebuilt it.
+        search.create_search_index(connection.schema_editor())
+        self.assertEqual(sorted(self.search(q='words')), ['first words', 'second words'])
+
+    def test_query_syntax_is_escaped(self):
+        UserMessage.objects.create(sender=self.user, body='say "hi" OR bye', content_object=self.club)
+        self.assertEqual(self.search(q='"hi" OR'), ['say "hi" OR bye'])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class TestMessageExport(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.messages = self.create_messages(self.other, self.club, 5)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:export-club', args=[self.club.id])
+
+    def read(self, response):
+        content = b''.join(response.streaming_content)
+        if response['Content-Type'] == 'application/gzip':
+            content = gzip.decompress(content)
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_export_streams_oldest_first_and_resumes(self):
+        rows = self.read(self.client.get(self.url))
+        self.assertEqual([row['id'] for row in rows], [str(message.id) for message in self.messages])
+        self.assertEqual(rows[0]['target_type'], 'club')
+        rows = self.read(self.client.get(self.url, {'cursor': rows[2]['cursor'], 'compress': 'gzip'}))
+        self.assertEqual([row['id'] for row in rows], [str(message.id) for message in self.messages[3:]])
+
+    def test_export_is_restricted(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        url = reverse('messages:export-user', args=[self.other.id])
+        self.assertEqual(len(self.read(self.client.get(url))), 5)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson.gz')
+            call_command('export_messages', club=str(self.club.id), output=path, gzip=True, chunk_size=2)
+            with gzip.open(path, 'rt') as export:
+                rows = [json.loads(line) for line in export]
+        self.assertEqual(len(rows), 5)
+
+    def test_export_command_reads_the_archive(self):
+        self.addCleanup(cache.delete, archive.NEWEST_KEY)
+        for i, message in enumerate(self.messages[:2]):
+            UserMessage.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(days=400 - i))
+        with self.settings(MESSAGE_ARCHIVE_ENABLED=True):
+            call_command('archive_messages', stdout=io.StringIO())
+            self.assertEqual(ArchivedMessage.objects.count(), 2)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'export.ndjson')
+                call_command('export_messages', user=str(self.other.id), output=path)
+                with open(path) as export:
+                    rows = [json.loads(line) for line in export]
+        self.assertEqual([row['id'] for row in rows], [str(message.id) for message in self.messages])
+
+
+class TestMediaUploads(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(MEDIA_ROOT=os.path.join(directory.name, 'media'),
+                                 MEDIA_UPLOAD_DIR=os.path.join(directory.name, 'uploads'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+        self.content = os.urandom(1000)
+
+    def start(self, checksum=None, body_type='VIDEO', filename='clip.mp4', mime_type='video/mp4'):
+        response = self.client.post(reverse('messages:message-uploads'), {
+            'target_type': 'club', 'target_id': str(self.club.id), 'body_type': body_type,
+            'filename': filename, 'mime_type': mime_type, 'size': len(self.content),
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return reverse('messages:message-upload', args=[response.data['id']])
+
+    def put(self, url, start, end, **extra):
+        return self.client.put(url, self.content[start:end], content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes %s-%s/%s' % (start, end - 1, len(self.content)),
+                               **extra)
+
+    def test_chunks_assemble_into_a_media_message(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, 400).data['offset'], 400)
+        # A retried or skipped chunk is refused, the client resumes from the offset.
+        self.assertEqual(self.put(url, 0, 400).status_code, 409)
+        self.assertEqual(self.put(url, 600, 1000).status_code, 409)
+        self.assertEqual(self.client.get(url).data['offset'], 400)
+        checksum = hashlib.sha256(self.content[400:]).hexdigest()
+        response = self.put(url, 400, 1000, HTTP_X_CHUNK_CHECKSUM=checksum)
+        # The whole file is checked by the media workers.
+        self.assertEqual((response.status_code, response.data['status']), (202, 'PENDING'))
+        self.assertFalse(UserMessage.objects.exists())
+        jobs.run_pending()
+        upload = self.client.get(url).data
+        self.assertEqual(upload['status'], 'COMPLETE')
+        message = UserMessage.objects.get(id=upload['message'])
+        self.assertEqual((message.body_type, message.attachment.size), ('VIDEO', 1000))
+        with message.attachment.file.open('rb') as attachment:
+            self.assertEqual(attachment.read(), self.content)
+
+    def test_checksum_mismatch_fails_the_upload(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, 1000, HTTP_X_CHUNK_CHECKSUM='0' * 64).status_code, 400)
+        self.assertEqual(self.client.get(url).data['offset'], 0)
+        url = self.start(checksum='0' * 64)
+        self.assertEqual(self.put(url, 0, 1000).status_code, 202)
+        jobs.run_pending()
+        self.assertEqual(self.client.get(url).data['status'], 'FAILED')
+        self.assertFalse(UserMessage.objects.exists())
+
+    def test_media_is_served_by_range_and_revalidated(self):
+        message = self.upload(self.content)
+        media_url = message['attachment']['url']
+        response = self.client.get(media_url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        etag = response['ETag']
+
+        response = self.client.get(media_url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual((response.status_code, response['Content-Range'], response['Content-Length']),
+                         (206, 'bytes 100-199/1000', '100'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        response = self.client.get(media_url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        self.assertEqual(self.client.get(media_url, HTTP_RANGE='bytes=1000-').status_code, 416)
+        self.assertEqual(self.client.get(media_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.force_authenticate(self.create_user('mallory'))
+        self.assertEqual(self.client.get(media_url).status_code, 403)
+
+    def upload(self, content, **kwargs):
+        """Upload ``content`` in one chunk, returns the message it became."""
+        self.content = content
+        url = self.start(**kwargs)
+        self.put(url, 0, len(content))
+        # Completes the upload, leaving the processing it queues.
+        jobs.run_job(jobs.claim())
+        return self.client.get(reverse('messages:message', args=[self.client.get(url).data['message']])).data
+
+    def test_images_are_processed_in_the_background(self):
+        image = io.BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(image, 'PNG')
+        message = self.upload(image.getvalue(), body_type='IMAGE', filename='photo.png', mime_type='image/png')
+        self.assertIsNone(message['attachment']['processed_at'])
+        self.assertEqual(MediaJob.objects.get().task, 'process_attachment')
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(MediaJob.objects.exists())
+        attachment = self.client.get(reverse('messages:message', args=[message['id']])).data['attachment']
+        self.assertEqual((attachment['width'], attachment['height']), (640, 480))
+        response = self.client.get(attachment['thumbnail_url'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 240))
+
+    def test_wav_duration_and_waveform(self):
+        # Half a second of silence, then half a second at full scale.
+        audio = io.BytesIO()
+        with wave.open(audio, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(bytes(8000) + struct.pack('<h', -32768) * 4000)
+        message = self.upload(audio.getvalue(), body_type='AUDIO', filename='note.wav', mime_type='audio/wav')
+        jobs.run_pending()
+        attachment = UserMessage.objects.get(id=message['id']).attachment
+        self.assertEqual(attachment.duration, 1.0)
+        self.assertEqual(attachment.waveform, [0] * 50 + [100] * 50)
+
+    def test_failing_jobs_are_retried_then_failed(self):
+        with self.settings(MEDIA_JOB_MAX_ATTEMPTS=2), \
+                mock.patch.dict(jobs.TASKS, {'explode': mock.Mock(side_effect=OSError('corrupt'))}), \
+                self.assertLogs('message.jobs', 'ERROR'):
+            job = jobs.enqueue('explode', 1)
+            self.assertEqual(jobs.run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (MediaJob.PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now())
+            MediaJob.objects.update(run_after=timezone.now())
+            jobs.run_pending()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (MediaJob.FAILED, 2))
+            self.assertIn('corrupt', job.error)
+
+    def test_local_avatars_are_resized(self):
+        image = io.BytesIO()
+        Image.new('RGB', (300, 200), 'blue').save(image, 'PNG')
+        name = default_storage.save('avatars/alice.png', ContentFile(image.getvalue()))
+        profile = self.user.userprofile
+        profile.avatar = default_storage.url(name)
+        profile.save()
+        jobs.run_pending()
+        profile.refresh_from_db()
+        self.assertEqual(profile.avatar_sizes['source'], profile.avatar)
+        with default_storage.open(processing.media_name(profile.avatar_sizes['64'])) as file, \
+                Image.open(file) as resized:
+            self.assertEqual(resized.size, (64, 64))
+        # Saving again without a new avatar queues nothing.
+        profile.save()
+        self.assertFalse(MediaJob.objects.exists())
+
+
+class TestThrottling(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        throttling.clear()
+        self.addCleanup(throttling.clear)
+        for patch in (mock.patch.dict(throttling.SlidingWindowThrottle.THROTTLE_RATES, {'message_post': '3/min'}),
+                      mock.patch.object(throttling.SlidingWindowThrottle, 'timer', mock.Mock(return_value=6000.0))):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-group', args=[self.club.id])
+
+    def test_posting_and_polling_are_throttled_apart(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post(self.url, {'body': 'hi'}).status_code, 201)
+        response = self.client.post(self.url, {'body': 'hi'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # Half a minute into the next window half of the previous one still counts.
+        throttling.SlidingWindowThrottle.timer.return_value = 6090.0
+        self.assertEqual(self.client.post(self.url, {'body': 'hi'}).status_code, 201)
+        self.assertEqual(self.client.post(self.url, {'body': 'hi'}).status_code, 429)
+
+    def test_counts_are_shared_through_the_cache(self):
+        with self.settings(THROTTLE_SYNC_EVERY={'message_post': 1}):
+            self.client.post(self.url, {'body': 'hi'})
+            self.client.post(self.url, {'body': 'hi'})
+            # Another process starts counting from the shared total.
+            throttling.clear()
+            self.assertEqual(self.client.post(self.url, {'body': 'hi'}).status_code, 201)
+            self.assertEqual(self.client.post(self.url, {'body': 'hi'}).status_code, 429)
+
+
+class TestMetrics(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        metrics.registry.reset()
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.create_messages(self.user, self.club, 3)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-group', args=[self.club.id])
+
+    def test_requests_are_measured_per_view(self):
+        with self.settings(METRICS_TOKEN=None, DEBUG='False'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.client.get(self.url)
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        lines = response.content.decode().splitlines()
+        labels = 'view="messages:message-group",method="GET"'
+        self.assertIn('messaging_requests_total{%s,status="200"} 1' % labels, lines)
+        self.assertIn('messaging_request_db_queries_count{%s} 1' % labels, lines)
+        self.assertIn('messaging_request_db_queries_bucket{%s,le="5"} 1' % labels, lines)
+        serializer_time = next(line for line in lines
+                               if line.startswith('messaging_request_serializer_seconds_sum{%s}' % labels))
+        self.assertGreater(float(serializer_time.split()[-1]), 0)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('message.metrics', 'WARNING') as logs:
+            self.client.get(self.url)
+            with self.settings(METRICS_CAPTURE_SQL=True):
+                self.client.get(self.url)
+        self.assertNotIn('message_usermessage', logs.output[0])
+        self.assertIn('message_usermessage', logs.output[1])
+        with self.settings(METRICS_SAMPLE_RATE=0):
+            self.client.get(self.url)
+        self.assertEqual(sum(metrics.registry.requests.values()), 2)
+
+
+class TestMessageTiers(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.messages = self.create_messages(self.user, self.club, 5)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('messages:message-group', args=[self.club.id])
+
+    def history(self):
+        ids, url = [], self.url + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids.extend(message['id'] for message in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_deleted_messages_are_kept_until_purged(self):
+        last = self.messages[-1]
+        self.assertEqual(self.client.delete(reverse('messages:message', args=[last.id])).status_code, 204)
+        self.assertEqual(self.client.get(reverse('messages:message', args=[last.id])).status_code, 404)
+        self.assertNotIn(str(last.id), self.history())
+        self.assertIsNotNone(UserMessage.all_objects.get(id=last.id).deleted_at)
+        entry = InboxEntry.objects.get(user=self.user)
+        self.assertEqual(entry.last_message_id, self.messages[-2].id)
+
+        call_command('archive_messages', stdout=io.StringIO())
+        self.assertTrue(UserMessage.all_objects.filter(id=last.id).exists())
+        with self.settings(MESSAGE_DELETED_RETENTION=timedelta(0)):
+            call_command('archive_messages', stdout=io.StringIO())
+        self.assertFalse(UserMessage.all_objects.filter(id=last.id).exists())
+        self.assertEqual(InboxEntry.objects.get(user=self.user).last_message_id, self.messages[-2].id)
+
+    def test_archived_messages_are_read_back_in_order(self):
+        self.addCleanup(cache.delete, archive.NEWEST_KEY)
+        expected = [str(message.id) for message in reversed(self.messages)]
+        for i, message in enumerate(self.messages[:3]):
+            UserMessage.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(days=400 - i))
+        with self.settings(MESSAGE_ARCHIVE_ENABLED=True):
+            call_command('archive_messages', stdout=io.StringIO())
+            self.assertEqual(ArchivedMessage.objects.count(), 3)
+            self.assertEqual(UserMessage.objects.count(), 2)
+            self.assertEqual(self.history(), expected)
+            response = self.client.get(reverse('messages:export-club', args=[self.club.id]))
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], expected[::-1])
+
+
+class TestMessagePartitioning(MessageTestMixin, APITestCase):
+
+    def test_pages_read_recent_history_first(self):
+        user = self.create_user('alice')
+        club = self.create_club(user)
+        messages = self.create_messages(user, club, 4)
+        for i, message in enumerate(messages[:2]):
+            UserMessage.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(days=90 - i))
+        self.client.force_authenticate(user)
+        url = reverse('messages:message-group', args=[club.id]) + '?page_size=3'
+
+        with self.settings(MESSAGE_PARTITIONING=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual([message['id'] for message in response.data['results']],
+                         [str(message.id) for message in messages[:0:-1]])
+        history = [query['sql'] for query in queries if 'FROM "message_usermessage"' in query['sql']]
+        self.assertEqual(len(history), 2)
+        self.assertIn('"created_at" >=', history[0])
+        self.assertIn('"created_at" <', history[1])
+
+        with self.settings(MESSAGE_PARTITIONING=True):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([message['id'] for message in response.data['results']], [str(messages[0].id)])
+
+    def test_partition_months(self):
+        december = datetime(2026, 12, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(partitioning.month_start(datetime(2026, 12, 31, 23, tzinfo=dt_timezone.utc)), december)
+        self.assertEqual(partitioning.add_months(december, 1), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitioning.partition_name(december), 'message_usermessage_p2026_12')
+        with self.assertRaises(CommandError):
+            call_command('partition_messages', stdout=io.StringIO())
+
+    def test_detached_messages_release_what_points_at_them(self):
+        self.assertEqual({relation.related_model for relation in partitioning.incoming_relations(UserMessage)},
+                         {InboxEntry, MediaUpload, MessageAttachment})
+        user = self.create_user('alice')
+        club = self.create_club(user)
+        [old] = self.create_messages(user, club, 1)
+        MessageAttachment.objects.create(message=old, file='media/old.mp4', filename='old.mp4',
+                                         mime_type='video/mp4', size=1, checksum='0' * 64)
+        upload = MediaUpload.objects.create(owner=user, target=club, body_type='VIDEO', filename='old.mp4',
+                                            mime_type='video/mp4', size=1, checksum='0' * 64, message=old)
+        InboxEntry.objects.update(last_message=old)
+        partitioning.release_references(old.created_at, old.created_at + timedelta(milliseconds=1))
+        self.assertFalse(MessageAttachment.objects.exists())
+        upload.refresh_from_db()
+        self.assertIsNone(upload.message)
+        self.assertFalse(InboxEntry.objects.filter(last_message__isnull=False).exists())
+
+
+class TestTimeOrderedIds(MessageTestMixin, APITestCase):
+
+    def test_ids_increase_and_carry_their_time(self):
+        generated = [ids.uuid7() for _ in range(5000)]
+        self.assertEqual(sorted(generated), generated)
+        self.assertEqual({value.version for value in generated}, {7})
+        self.assertLess(abs(timezone.now() - ids.uuid7_time(generated[-1])), timedelta(seconds=1))
+        self.assertIsNone(ids.uuid7_time(UUID('5f3e0d0e-4d2b-4c59-9a3e-2f7c1b0a9d11')))
+        self.assertIsNone(ids.uuid7_time('not an id'))
+
+    def test_message_ids_are_cursors(self):
+        user = self.create_user('alice')
+        club = self.create_club(user)
+        messages = self.create_messages(user, club, 5)
+        self.assertEqual(messages[0].created_at, ids.uuid7_time(messages[0].id))
+        self.client.force_authenticate(user)
+        url = reverse('messages:message-group', args=[club.id])
+
+        response = self.client.get(url, {'page_size': 2})
+        self.assertIn('cursor=%s' % messages[3].id, response.data['next'])
+        response = self.client.get(url, {'after': str(messages[2].id)})
+        self.assertEqual([message['id'] for message in response.data['results']],
+                         [str(messages[4].id), str(messages[3].id)])
+        response = self.client.get(reverse('messages:message', args=[messages[2].id]))
+        self.assertEqual(response.data['id'], str(messages[2].id))
+
+    def test_benchmark_compares_keys(self):
+        output = io.StringIO()
+        call_command('benchmark_ids', rows=200, batch_size=50, json=True, stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertEqual([row['ids'] for row in results], ['uuid4', 'uuid7'])
+        self.assertTrue(all(row['index_bytes'] for row in results))
+
+
+class TestReplicaRouting(MessageTestMixin, APITestCase):
+    # Two SQLite databases, nothing replicates between them: a read shows
+    # which one it went to.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.client.force_authenticate(self.user)
+        self.addCleanup(cache.delete, replicas.pin_key(self.user.pk))
+        owner = User(username='replicated')
+        User.objects.using('replica').bulk_create([owner])
+        self.replicated = Club(owner=User.objects.using('replica').get(), title='replicated')
+        Club.objects.using('replica').bulk_create([self.replicated])
+
+    def titles(self):
+        return [club['title'] for club in self.client.get(reverse('messages:clubs'), {'fields': 'title'}).data]
+
+    def test_reads_follow_the_users_writes(self):
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(self.titles(), ['replicated'])
+            self.assertEqual(self.client.post(reverse('messages:clubs'), {'title': 'mine'}).status_code, 201)
+            self.assertEqual(self.titles(), ['mine'])
+            cache.delete(replicas.pin_key(self.user.pk))
+            self.assertEqual(self.titles(), ['replicated'])
+        self.assertEqual(self.titles(), ['mine'])
+
+    def test_instances_read_from_a_replica_are_saved_to_the_primary(self):
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(router.db_for_write(Club, instance=self.replicated), 'default')
+            self.assertEqual(router.db_for_read(Club, instance=self.replicated), 'default')
+        self.assertEqual(router.db_for_write(Club, instance=self.replicated), 'replica')
+
+
+class TestConnectionReuse(TestCase):
+
+    def test_dead_connections_are_replaced_before_a_request(self):
+        def kept(usable, checked=True):
+            return mock.Mock(settings_dict={'CONN_HEALTH_CHECKS': checked}, in_atomic_block=False,
+                             **{'is_usable.return_value': usable})
+
+        dead, alive, unchecked = kept(False), kept(True), kept(False, checked=False)
+        with mock.patch.object(db.connections, 'all', return_value=[dead, alive, unchecked]):
+            request_started.send(sender=None)
+        dead.close.assert_called_once_with()
+        alive.close.assert_not_called()
+        unchecked.is_usable.assert_not_called()
+
+    def test_benchmark_compares_modes(self):
+        output = io.StringIO()
+        call_command('benchmark_connections', users=5, clubs=1, members=3, messages=20, repeat=2, json=True,
+                     stdout=output, stderr=io.StringIO())
+        results = json.loads(output.getvalue())
+        self.assertEqual({row['mode'] for row in results}, {'per request', 'persistent', 'persistent+checks'})
+        self.assertEqual({row['status'] for row in results}, {200, 201})
+        self.assertFalse(User.objects.filter(username__startswith='seed7_').exists())
+
+
+class TestBenchmarkHarness(TestCase):
+
+    def test_endpoints_are_measured_into_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', users=5, clubs=2, members=3, messages=50, repeat=1,
+                         only='messages/clubs', output=path, stdout=io.StringIO(), stderr=io.StringIO())
+            with open(path) as results:
+                results = json.load(results)['results']
+        self.assertEqual({row['endpoint'] for row in results},
+                         {'GET messages/clubs/<id>', 'GET messages/clubs/<id> msgpack',
+                          'GET messages/clubs/<id>?fields', 'POST messages/clubs/<id>'})
+        for row in results:
+            self.assertIn(row['status'], (200, 201))
+            self.assertGreater(row['queries'], 0)
+        # Seeded data is rolled back.
+        self.assertFalse(UserMessage.objects.exists())
+
+
+class TestClubPermissions(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        self.user = self.create_user('alice')
+        self.other = self.create_user('bob')
+        self.club = self.create_club(self.user)
+        self.client.force_authenticate(self.other)
+
+    def test_only_members_read_and_post_club_messages(self):
+        url = reverse('messages:message-group', args=[self.club.id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.post(url, {'body': 'hi'}).status_code, 403)
+        ClubUser.objects.create(user=self.other.userprofile, club=self.club)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {'body': 'hi'}).status_code, 201)
+
+    def test_club_list_shows_messages_to_members_only(self):
+        self.create_messages(self.user, self.club, 2)
+        [club] = self.client.get(reverse('messages:clubs')).data
+        self.assertEqual(club['title'], 'club')
+        self.assertNotIn('messages', club)
+        self.assertNotIn('club_users', club)
+        ClubUser.objects.create(user=self.other.userprofile, club=self.club)
+        [club] = self.client.get(reverse('messages:clubs')).data
+        self.assertEqual(len(club['messages']), 2)
+        self.assertEqual(len(club['club_users']), 2)
+
+    def test_only_owners_add_members(self):
+        url = reverse('messages:post-groups', args=[self.club.id, self.other.userprofile.id])
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.client.force_authenticate(self.other)
+        club_url = reverse('messages:club', args=[self.club.id])
+        self.assertEqual(self.client.get(club_url).status_code, 200)
+        self.assertEqual(self.client.patch(club_url, {'about': 'mine'}).status_code, 403)
+
+    def test_message_detail_is_for_participants(self):
+        [direct] = self.create_messages(self.user, self.other.userprofile, 1)
+        [club_message] = self.create_messages(self.user, self.club, 1)
+        third = self.create_user('carol')
+        for user, message, code in ((self.other, direct, 200), (third, direct, 403),
+                                    (self.other, club_message, 403), (self.user, club_message, 200)):
+            self.client.force_authenticate(user)
+            response = self.client.get(reverse('messages:message', args=[message.id]))
+            self.assertEqual(response.status_code, code)
+        self.client.force_authenticate(self.other)
+        response = self.client.patch(reverse('messages:message', args=[direct.id]), {'body': 'edit'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_membership_is_cached(self):
+        self.client.force_authenticate(self.user)
+        self.create_messages(self.user, self.club, 1)
+        url = reverse('messages:message-group', args=[self.club.id])
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_bulk_messages_need_membership(self):
+        items = [{'target_type': 'club', 'target_id': str(self.club.id), 'body': 'spam'}]
+        response = self.client.post(reverse('messages:message-bulk'), items)
+        self.assertEqual(response.data[0]['status'], 403)
+
+
+class TestStatelessAuthentication(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        membership.clear()
+        self.user = self.create_user('alice')
+        self.club = self.create_club(self.user)
+        self.create_messages(self.user, self.club, 2)
+        self.url = reverse('messages:message-group', args=[self.club.id])
+        token = LoginSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % token)
+
+    def test_polling_authenticates_without_queries(self):
+        self.client.get(self.url)
+        # Nothing left of the user loaded by the first request.
+        authentication.forget_user(self.user.id)
+        # The club's messages and their senders' groups and permissions.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 3)
+        self.assertFalse([query for query in queries if 'FROM "auth_user" WHERE' in query['sql']])
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_full_user_is_loaded_on_demand(self):
+        request = APIRequestFactory().get(self.url, HTTP_AUTHORIZATION=self.client._credentials['HTTP_AUTHORIZATION'])
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.id, user.username), (self.user.id, 'alice'))
+        with self.assertNumQueries(1):
+            self.assertFalse(user.is_staff)
+        self.assertEqual(user, self.user)
+
+    def test_deactivated_user_fails_once_loaded(self):
+        self.user.is_active = False
+        self.user.save()
+        url = reverse('messages:message-user', args=[self.user.userprofile.id])
+        self.assertEqual(self.client.post(url, {'body': 'hi'}).status_code, 401)
+
+    def test_demoted_staff_loses_exports(self):
+        staff = self.create_user('carol')
+        staff.is_staff = True
+        staff.save()
+        token = LoginSerializer.get_token(staff).access_token
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % token)
+        url = reverse('messages:export-club', args=[self.club.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        staff.is_staff = False
+        staff.save()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        url = reverse('messages:export-user', args=[self.user.id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class TestAuthResponses(MessageTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.credentials = {'username': 'alice', 'password': 'Passw0rd!'}
+
+    def login(self, query=''):
+        return self.client.post(reverse('messages:login') + query, self.credentials, format='json')
+
+    def test_login_cost_does_not_grow_with_history(self):
+        self.login()
+        with self.assertNumQueries(4):
+            response = self.login()
+        self.assertNotIn('messages', response.data['profile'])
+        UserMessage.objects.bulk_create(
+            UserMessage(sender=self.user, body='message %s' % i, content_object=self.user.userprofile)
+            for i in range(20))
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.login().content), len(response.content))
+
+    def test_login_expands_profile_messages_on_request(self):
+        self.create_messages(self.user, self.user.userprofile, 2)
+        response = self.login('?expand=profile.messages')
+        self.assertEqual(len(response.data['profile']['messages']), 2)
+        response = self.login('?expand=profile&fields=username,profile.about')
+        self.assertEqual(set(response.data), {'access', 'refresh', 'username', 'profile'})
+        self.assertEqual(response.data['profile'], {'about': self.user.userprofile.about})
+
+    def test_registration_mints_one_token(self):
+        data = {'username': 'bob', 'email': 'bob@example.com', 'password': 'Passw0rd!'}
+        with mock.patch('message.serializers.RefreshToken.for_user', wraps=RefreshToken.for_user) as for_user:
+            response = self.client.post(reverse('messages:register'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(for_user.call_count, 1)
+        self.assertEqual(AccessToken(response.data['access'])['username'], 'bob')
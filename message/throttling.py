@@ -0,0 +1,152 @@
+"""
+Sliding-window counter throttles.
+
+DRF's throttles keep every request timestamp of a client in the cache and
+rewrite the list on each request. These keep two counters per client and
+scope, the current fixed window and the previous one, and estimate the
+sliding window as ``previous * (1 - elapsed) + current``: constant memory and
+constant work per request.
+
+Counters live in the process. They are pushed to the shared cache with an
+atomic increment every THROTTLE_SYNC_EVERY[scope] requests of a client, or
+when THROTTLE_SYNC_INTERVAL seconds passed, which also brings back the
+counts of other processes. A client may overshoot a rate by about that many
+requests per process. Scopes without a THROTTLE_SYNC_EVERY entry are only
+counted in the process, the cheapest tier for high rate, low risk scopes.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import SimpleRateThrottle
+
+_windows = {}
+_lock = threading.Lock()
+
+
+class Window:
+    __slots__ = ('index', 'current', 'previous', 'pending', 'synced_at')
+
+    def __init__(self, index, now):
+        self.index = index
+        self.current = 0
+        self.previous = 0
+        self.pending = 0
+        self.synced_at = now
+
+
+def shared_key(key, index):
+    return 'throttle:%s:%s' % (key, index)
+
+
+def push(key, index, delta):
+    """Add ``delta`` to a window's shared counter, returns its new total."""
+    key = shared_key(key, index)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, delta, getattr(settings, 'THROTTLE_WINDOW_TTL', 3600)):
+            return delta
+        return cache.incr(key, delta)
+
+
+def clear():
+    _windows.clear()
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """A throttle for ``scope``, rate in DEFAULT_THROTTLE_RATES like DRF's own throttles."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = now = self.timer()
+        index = int(now // self.duration)
+        with _lock:
+            window = _windows.get(self.key)
+            if window is None:
+                if len(_windows) >= getattr(settings, 'THROTTLE_LOCAL_SIZE', 100000):
+                    _windows.clear()
+                window = _windows[self.key] = Window(index, now)
+            rolled = window.index != index
+            if rolled:
+                stale = (window.index, window.pending)
+                window.previous = window.current if window.index == index - 1 else 0
+                window.index, window.current, window.pending = index, 0, 0
+            self.window = window
+            if self.estimate() + 1 > self.num_requests:
+                return False
+            window.current += 1
+            window.pending += 1
+            sync = self.sync_every is not None and (rolled or self.sync_due(window, now))
+            if sync:
+                delta, window.pending, window.synced_at = window.pending, 0, now
+
+        if sync:
+            if rolled and stale[1] and stale[0] == index - 1:
+                window.previous = push(self.key, stale[0], stale[1])
+            total = push(self.key, index, delta)
+            with _lock:
+                if window.index == index:
+                    window.current = max(window.current, total + window.pending)
+        return True
+
+    @property
+    def sync_every(self):
+        return getattr(settings, 'THROTTLE_SYNC_EVERY', {}).get(self.scope)
+
+    def sync_due(self, window, now):
+        return (window.pending >= self.sync_every or
+                now - window.synced_at >= getattr(settings, 'THROTTLE_SYNC_INTERVAL', 5))
+
+    def estimate(self):
+        elapsed = (self.now % self.duration) / self.duration
+        return self.window.previous * (1 - elapsed) + self.window.current
+
+    def wait(self):
+        remaining = self.duration - self.now % self.duration
+        excess = self.estimate() + 1 - self.num_requests
+        if self.window.current < self.num_requests and self.window.previous:
+            # The previous window's share drains at previous / duration a second.
+            return min(remaining, excess * self.duration / self.window.previous)
+        return remaining
+
+
+class AnonThrottle(SlidingWindowThrottle):
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return '%s:%s' % (self.scope, self.get_ident(request))
+
+
+class UserThrottle(SlidingWindowThrottle):
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return '%s:%s' % (self.scope, request.user.pk)
+        return '%s:%s' % (self.scope, self.get_ident(request))
+
+
+class MethodScopeThrottle(UserThrottle):
+    """
+    Throttles a view by the scope its ``throttle_scopes`` gives the request
+    method, e.g. ``{'POST': 'message_post', 'GET': 'poll'}``.
+    """
+
+    def __init__(self):
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(request.method)
+        if self.scope is None:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
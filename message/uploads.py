@@ -0,0 +1,174 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .events import broadcast_message
+from .jobs import task
+from .models import MediaUpload, MessageAttachment, UserMessage
+from .serializers import MessageSerializer
+
+BLOCK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The chunk does not start at the upload offset.'
+    default_code = 'conflict'
+
+
+class ChunkTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Chunk too large.'
+    default_code = 'chunk_too_large'
+
+
+class PartFile(File):
+    """A part file handed to the storage, FileSystemStorage moves it into place instead of copying."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_dir():
+    return getattr(settings, 'MEDIA_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads'))
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), '%s.part' % upload.id)
+
+
+def start_upload(upload):
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+
+
+def parse_content_range(value, upload):
+    """The (start, end) byte positions of a ``Content-Range: bytes start-end/size`` header."""
+    match = CONTENT_RANGE.match(value or '')
+    if match is None:
+        raise ValidationError({'Content-Range': ['Expected "bytes <start>-<end>/<size>".']})
+    start, end, size = map(int, match.groups())
+    if size != upload.size or end < start or end >= size:
+        raise ValidationError({'Content-Range': ['Range does not fit the upload.']})
+    return start, end
+
+
+def write_chunk(upload, stream, start, length, checksum=None):
+    """
+    Write ``length`` bytes read from ``stream`` at ``start`` of the part file,
+    a block at a time, and advance the upload's offset past them. Chunks must
+    arrive in order, a chunk that doesn't start at the offset is refused so a
+    client resumes by asking for the offset and sending from there.
+
+    ``checksum``, the chunk's SHA-256, is verified before the offset moves.
+    """
+    if upload.status != MediaUpload.PENDING:
+        raise UploadConflict('The upload is %s.' % upload.get_status_display())
+    if start != upload.received:
+        raise UploadConflict('The upload continues at byte %s.' % upload.received)
+    if length > getattr(settings, 'MEDIA_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024):
+        raise ChunkTooLarge()
+
+    digest = hashlib.sha256()
+    with open(part_path(upload), 'r+b') as part:
+        part.seek(start)
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining)) if stream is not None else b''
+            if not block:
+                raise ValidationError({'detail': 'The chunk ended before its Content-Range.'})
+            part.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        part.truncate()
+
+    if checksum and checksum.lower() != digest.hexdigest():
+        raise ValidationError({'checksum': ['Chunk checksum mismatch.']})
+    # Only one of two requests sending the same chunk moves the offset.
+    advanced = MediaUpload.objects.filter(id=upload.id, received=start, status=MediaUpload.PENDING).update(
+        received=start + length, updated_at=timezone.now())
+    if not advanced:
+        raise UploadConflict('The chunk was already received.')
+    upload.received = start + length
+    return upload.received
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    Verify a fully received upload against its checksum and turn it into a
+    message with the file as its attachment. Returns the message, None when
+    the file doesn't match and the upload failed.
+    """
+    path = part_path(upload)
+    if file_checksum(path) != upload.checksum.lower():
+        upload.status = MediaUpload.FAILED
+        upload.save(update_fields=['status', 'updated_at'])
+        os.remove(path)
+        return None
+
+    with transaction.atomic():
+        message = UserMessage.objects.create(sender=upload.owner, body=upload.body,
+                                             body_type=upload.body_type, content_type=upload.content_type,
+                                             object_id=upload.object_id)
+        attachment = MessageAttachment(message=message, filename=upload.filename,
+                                       mime_type=upload.mime_type, size=upload.size,
+                                       checksum=upload.checksum.lower())
+        name = attachment.file.field.generate_filename(attachment, upload.filename)
+        with open(path, 'rb') as part:
+            attachment.file.name = attachment.file.storage.save(name, PartFile(part, name=path))
+        attachment.save()
+        upload.status = MediaUpload.COMPLETE
+        upload.message = message
+        upload.save(update_fields=['status', 'message', 'updated_at'])
+    if os.path.exists(path):
+        os.remove(path)
+    return message
+
+
+@task('complete_upload')
+def finish_upload(upload_id):
+    """
+    Complete an upload whose last chunk arrived. Hashing the whole file
+    takes a while for large media, so the request that sent the last chunk
+    leaves it to the workers and the client follows the upload's status.
+    """
+    with transaction.atomic():
+        upload = MediaUpload.objects.select_for_update().filter(
+            id=upload_id, status=MediaUpload.PENDING).select_related('content_type').first()
+        if upload is None or upload.received < upload.size:
+            return
+        message = complete_upload(upload)
+    if message is not None:
+        broadcast_message(upload.target, MessageSerializer(message).data)
+
+
+def discard_upload(upload):
+    if os.path.exists(part_path(upload)):
+        os.remove(part_path(upload))
+    upload.delete()
+
+
+def purge_stale_uploads(before):
+    """Discard uploads not completed and last touched before ``before``, with their part files."""
+    stale = MediaUpload.objects.filter(updated_at__lt=before).exclude(status=MediaUpload.COMPLETE)
+    count = 0
+    for upload in stale.iterator():
+        discard_upload(upload)
+        count += 1
+    return count
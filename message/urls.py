@@ -18,7 +18,16 @@ urlpatterns = [
     path('groups/users/list', views.ClubUserListAPIView.as_view(), name='list-groups'),
     path('groups/users/<club_id>/<user_id>', views.ClubUserCreateAPIView.as_view(), name='post-groups'),
     path('groups/<club_id>/', views.ClubUserRetrieveUpdateDeleteAPIView.as_view(), name='group'),
+    path('inbox/', views.InboxListAPIView.as_view(), name='inbox'),
+    path('inbox/<int:entry_id>/read/', views.InboxReadAPIView.as_view(), name='inbox-read'),
     path('messages/users/<user_id>/', views.UserMessageCreateListAPIView.as_view(), name='message-user'),
     path('messages/clubs/<club_id>/', views.ClubMessageCreateListAPIView.as_view(), name='message-group'),
+    path('messages/export/users/<user_id>/', views.UserMessageExportAPIView.as_view(), name='export-user'),
+    path('messages/export/clubs/<club_id>/', views.ClubMessageExportAPIView.as_view(), name='export-club'),
+    path('messages/search/', views.MessageSearchAPIView.as_view(), name='message-search'),
+    path('messages/bulk/', views.MessageBulkCreateAPIView.as_view(), name='message-bulk'),
+    path('messages/uploads/', views.MediaUploadCreateAPIView.as_view(), name='message-uploads'),
+    path('messages/uploads/<upload_id>/', views.MediaUploadAPIView.as_view(), name='message-upload'),
+    path('messages/<message_id>/media/', views.MessageMediaAPIView.as_view(), name='message-media'),
     path('messages/<message_id>/', views.MessageRetrieveUpdateDeleteAPIView.as_view(), name='message')
 ]
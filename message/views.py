@@ -1,23 +1,55 @@
+import uuid
+
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.generics import (
     ListAPIView,
     ListCreateAPIView,
     CreateAPIView,
+    RetrieveAPIView,
     RetrieveUpdateDestroyAPIView,
 )
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import UserProfile, Club, ClubUser, UserMessage
+from .cache import CLUB, USER, cached_representation, invalidate_targets, shown_senders
+from .contenttypes import get_content_type, get_label_model
+from .events import broadcast_message
+from .export import club_history, export_rows, gzip_stream, ndjson, user_history
+from .fieldsets import request_fieldsets, subset, wants
+from .ids import created_bounds
+from .inbox import record_messages
+from .jobs import enqueue
+from .media import serve_attachment
+from .membership import get_membership, is_member
+from .models import UserProfile, Club, ClubUser, UserMessage, InboxEntry, MediaUpload, ArchivedMessage
+from .pagination import MessageCursorPagination, decode_position
+from .permissions import (
+    CanAccessMessage,
+    IsClubMember,
+    IsClubOwner,
+    IsClubOwnerOrMemberReadOnly
+    )
+from .prefetch import (
+    message_queryset,
+    only_columns,
+    prefetch_clubs,
+    prefetch_users,
+    user_lookups,
+    without_attachments
+    )
+from .replicas import ReplicaReadMixin, pin
+from .search import search_messages
 from .serializers import (
     RegistrationSerializer, 
     LoginSerializer, 
@@ -25,8 +57,12 @@ from .serializers import (
     UserProfileSerializer,
     ClubSerializer,
     ClubUserSerializer, 
-    MessageSerializer
+    MessageSerializer,
+    BulkMessageSerializer,
+    InboxEntrySerializer,
+    MediaUploadSerializer
     )
+from .uploads import discard_upload, parse_content_range, start_upload, write_chunk
 
 
 # Create your views here.
@@ -40,6 +76,8 @@ class RegistrationAPIView(CreateAPIView):
         serializer = self.serializer_class(data=user)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        # Anonymous, the middleware can't tell whose reads to keep on the primary.
+        pin(serializer.instance.pk)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -49,14 +87,23 @@ class LoginAPIView(TokenObtainPairView):
     http_method_names = ['post']
 
 
-class UserListAPIView(ListAPIView):
+class UserListAPIView(ReplicaReadMixin, ListAPIView):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     serializer_class = UserSerializer
     queryset = User.objects.all()
     http_method_names = ['get']
 
+    def get(self, request):
+        fields, _ = request_fieldsets(request)
+        select, prefetch = user_lookups('', fields)
+        queryset = self.get_queryset().prefetch_related(*prefetch)
+        if select:
+            queryset = queryset.select_related(*select)
+        serializer = self.get_serializer(prefetch_users(queryset, fields), many=True)
+        return Response(serializer.data)
+
 
-class UserRetrieveUpdateAPIView(RetrieveUpdateDestroyAPIView):
+class UserRetrieveUpdateAPIView(ReplicaReadMixin, RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     serializer_class = UserSerializer
     http_method_names = ['get', 'patch', 'delete']
@@ -64,19 +111,51 @@ class UserRetrieveUpdateAPIView(RetrieveUpdateDestroyAPIView):
 
     def get_object(self, *args, **kwargs):
         id = self.kwargs.get("user_id")
-        return get_object_or_404(User, id=id)
+        user = get_object_or_404(User.objects.select_related('userprofile'), id=id)
+        return prefetch_users([user], request_fieldsets(self.request)[0])[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        # Only the default representation is cached, in its JSON form.
+        if request_fieldsets(request) != (None, {}):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            id = int(self.kwargs.get("user_id"))
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        def build():
+            user = self.get_object()
+            return self.get_serializer(user, native=False).data, shown_senders([user.userprofile])
+
+        return Response(cached_representation(USER, id, build))
 
 
-class ClubCreateListAPIView(ListCreateAPIView):
+class ClubCreateListAPIView(ReplicaReadMixin, ListCreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = ClubSerializer
     http_method_names = ['get', 'post']
 
     def get(self, request):
-        queryset = Club.objects.all()
-        serializer = self.serializer_class(queryset, many=True)
+        # Anyone may find a club, its messages and members are listed for its members only.
+        fields, expand = request_fieldsets(request)
+        clubs = list(self.club_queryset(request))
+        joined = None
+        if wants(fields, 'messages') or wants(fields, 'club_users'):
+            joined = get_membership(request.user).clubs
+            prefetch_clubs([club for club in clubs if club.id in joined], fields, expand)
+        serializer = self.get_serializer(clubs, many=True, context=dict(self.get_serializer_context(),
+                                                                       member_clubs=joined))
         return Response(serializer.data)
 
+    @staticmethod
+    def club_queryset(request):
+        """Clubs narrowed to the requested fields, with their owner loaded when it is expanded."""
+        fields, expand = request_fieldsets(request)
+        queryset = only_columns(Club.objects.all(), fields)
+        if 'owner' in expand and wants(fields, 'owner'):
+            select, prefetch = user_lookups('owner', subset(fields, 'owner'))
+            queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+        return queryset
+
     def post(self, request):
         club = request.data
         serializer = self.serializer_class(data=club, context={'user': request.user})
@@ -85,8 +164,8 @@ class ClubCreateListAPIView(ListCreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ClubRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
-    permission_classes = (IsAuthenticated,)
+class ClubRetrieveUpdateDeleteAPIView(ReplicaReadMixin, RetrieveUpdateDestroyAPIView):
+    permission_classes = (IsAuthenticated, IsClubOwnerOrMemberReadOnly,)
     serializer_class = ClubSerializer
     http_method_names = ['get', 'patch', 'delete']
     queryset = Club.objects.all()
@@ -94,7 +173,22 @@ class ClubRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
 
     def get_object(self, *args, **kwargs):
         id = self.kwargs.get("club_id")
-        return get_object_or_404(Club, id=id)
+        club = get_object_or_404(ClubCreateListAPIView.club_queryset(self.request), id=id)
+        return prefetch_clubs([club], *request_fieldsets(self.request))[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        # Only the default representation is cached, in its JSON form.
+        if request_fieldsets(request) != (None, {}):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            id = uuid.UUID(self.kwargs.get("club_id"))
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        def build():
+            club = self.get_object()
+            return self.get_serializer(club, native=False).data, shown_senders([club, *club.clubusers])
+
+        return Response(cached_representation(CLUB, id, build))
 
 
 class ClubUserListAPIView(ListAPIView):
@@ -110,28 +204,25 @@ class ClubUserListAPIView(ListAPIView):
 
 
 class ClubUserCreateAPIView(CreateAPIView):
-    permission_classes = (IsAuthenticated,)
+    permission_classes = (IsAuthenticated, IsClubOwner,)
     serializer_class = ClubUserSerializer
     http_method_names = ['post']
     lookup_field = ['club_id', 'user_id',]
 
     def post(self, request, *args, **kwargs):
         club_user = request.data
-        club = Club.objects.filter(id=self.kwargs.get("club_id")).first()
-        user = UserProfile.objects.filter(id=self.kwargs.get("user_id")).first()
+        club = get_object_or_404(Club, id=self.kwargs.get("club_id"))
+        user = get_object_or_404(UserProfile, id=self.kwargs.get("user_id"))
         serializer_context = {'user': user, 'club': club}
-        if request.user==club.owner:
-            serializer = self.serializer_class(
-                data=club_user, context=serializer_context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        resp = {'error': 'Only group owners are alowed to add participates'}
-        return Response(resp, status=status.HTTP_201_CREATED)
+        serializer = self.serializer_class(
+            data=club_user, context=serializer_context)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class ClubUserRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
-    permission_classes = (IsAuthenticated,)
+    permission_classes = (IsAuthenticated, IsClubOwnerOrMemberReadOnly,)
     serializer_class = ClubUserSerializer
     http_method_names = ['get', 'patch', 'delete']
     lookup_field = 'club_id'
@@ -141,54 +232,219 @@ class ClubUserRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
         return get_object_or_404(ClubUser, club__id=id)
 
 
-class ClubMessageCreateListAPIView(ListCreateAPIView):
-    permission_classes = (IsAuthenticated,)
+class ClubMessageCreateListAPIView(ReplicaReadMixin, ListCreateAPIView):
+    permission_classes = (IsAuthenticated, IsClubMember,)
     serializer_class = MessageSerializer
     http_method_names = ['get', 'post']
     lookup_field = 'club_id'
+    pagination_class = MessageCursorPagination
+    throttle_scopes = {'POST': 'message_post', 'GET': 'poll'}
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        club = Club.objects.filter(id=self.kwargs.get('club_id'))
-        messages = get_object_or_404(UserMessage, (Q(sender=user.id) | Q(club=club)))
-        serializer = self.serializer_class(data=messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # IsClubMember already established that the club exists.
+        page = self.paginate_queryset(self.history())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         message = request.data
         club = Club.objects.get(id=self.kwargs.get('club_id'))
-        ct = ContentType.objects.get_for_model(club)
+        ct = get_content_type(Club)
         serializer = self.serializer_class(data=message)
         serializer.is_valid(raise_exception=True)
         serializer.save(sender=request.user, content_type=ct, object_id=club.id)
+        broadcast_message(club, serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def history(self, model=UserMessage):
+        return message_queryset(request_fieldsets(self.request)[0], model).filter_by_target(
+            Club, self.kwargs.get('club_id'))
 
-class UserMessageCreateListAPIView(ListCreateAPIView):
+
+class UserMessageCreateListAPIView(ReplicaReadMixin, ListCreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = MessageSerializer
     http_method_names = ['get', 'post']
     lookup_field = 'user_id'
+    pagination_class = MessageCursorPagination
+    throttle_scopes = {'POST': 'message_post', 'GET': 'poll'}
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        profile = UserProfile.objects.filter(id=self.kwargs.get('user_id'))
-        messages = get_object_or_404(UserMessage, (Q(sender=user.id) | Q(userprofile=profile)))
-        serializer = self.serializer_class(data=messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        self.profile = get_object_or_404(UserProfile, id=self.kwargs.get('user_id'))
+        page = self.paginate_queryset(self.history())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         message = request.data
         profile = UserProfile.objects.get(id=self.kwargs.get('user_id'))
-        ct = ContentType.objects.get_for_model(profile)
+        ct = get_content_type(UserProfile)
         serializer = self.serializer_class(data=message)
         serializer.is_valid(raise_exception=True)
         serializer.save(sender=request.user, content_type=ct, object_id=profile.id)
+        broadcast_message(profile, serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def history(self, model=UserMessage):
+        return message_queryset(request_fieldsets(self.request)[0], model).filter_by_conversation(
+            self.request.user, self.profile)
+
+
+class MessageBulkCreateAPIView(CreateAPIView):
+    """
+    Ingest many messages to many clubs/profiles in one request.
+
+    Items are validated in one pass, targets resolved with one query per
+    target model and the valid messages inserted with a single bulk_create.
+    The response holds one result per item, in request order.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BulkMessageSerializer
+    http_method_names = ['post']
+    throttle_scopes = {'POST': 'message_post'}
+    max_batch_size = 1000
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'error': 'Expected a list of messages.'})
+        if len(items) > self.max_batch_size:
+            raise ValidationError(
+                {'error': 'At most %s messages per request.' % self.max_batch_size})
+
+        serializer = self.serializer_class()
+        results, valid = [], []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, serializer.run_validation(item)))
+                results.append(None)
+            except ValidationError as exc:
+                results.append({'status': status.HTTP_400_BAD_REQUEST, 'errors': exc.detail})
+
+        targets = self.resolve_targets(data for _, data in valid)
+        sender = User.objects.select_related('userprofile').prefetch_related(
+            'groups', 'user_permissions').get(id=request.user.id)
+        messages = []
+        for index, data in valid:
+            target = targets.get((data.pop('target_type'), data.pop('target_id')))
+            if target is None:
+                results[index] = {'status': status.HTTP_404_NOT_FOUND,
+                                  'errors': {'target_id': ['Target not found.']}}
+                continue
+            if isinstance(target, Club) and not is_member(request.user, target.id):
+                results[index] = {'status': status.HTTP_403_FORBIDDEN,
+                                  'errors': {'target_id': [IsClubMember.message]}}
+                continue
+            message = UserMessage(sender=sender, content_type=get_content_type(target.__class__),
+                                  object_id=target.id, **data)
+            messages.append((index, target, message))
+
+        with transaction.atomic():
+            UserMessage.objects.bulk_create(without_attachments([message for _, _, message in messages]))
+            record_messages([message for _, _, message in messages])
+            invalidate_targets((message.content_type_id, message.object_id) for _, _, message in messages)
+
+        for index, target, message in messages:
+            broadcast_message(target, MessageSerializer(message).data)
+            results[index] = {'status': status.HTTP_201_CREATED, 'id': str(message.id)}
+
+        created = len(messages) == len(items)
+        return Response(results, status=status.HTTP_201_CREATED if created else status.HTTP_207_MULTI_STATUS)
+
+    def resolve_targets(self, items):
+        ids = {}
+        for data in items:
+            ids.setdefault(data['target_type'], set()).add(data['target_id'])
+        targets = {}
+        for target_type, target_ids in ids.items():
+            model = get_label_model(target_type)
+            for target in model.objects.filter(id__in=target_ids):
+                targets[(target_type, target.id)] = target
+        return targets
+
+
+class MediaUploadCreateAPIView(CreateAPIView):
+    """
+    Start a chunked upload of a video or audio message. The file is then PUT
+    to the upload in chunks, each with a ``Content-Range: bytes
+    <start>-<end>/<size>`` header and optionally its SHA-256 in
+    ``X-Chunk-Checksum``. A client that lost track reads the upload back and
+    resumes from its ``offset``. Once the last chunk arrives the media
+    workers check the file against the checksum given here and turn it into
+    a message: the upload's ``status`` becomes COMPLETE with its ``message``,
+    or FAILED.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = MediaUploadSerializer
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        model = get_label_model(data.pop('target_type'))
+        target = get_object_or_404(model, id=data.pop('target_id'))
+        if isinstance(target, Club) and not is_member(request.user, target.id):
+            raise PermissionDenied(IsClubMember.message)
+        upload = serializer.save(owner_id=request.user.id, content_type=get_content_type(model),
+                                 object_id=target.id)
+        start_upload(upload)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class MessageRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
+class MediaUploadAPIView(RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated,)
+    serializer_class = MediaUploadSerializer
+    http_method_names = ['get', 'put', 'delete']
+    lookup_field = 'upload_id'
+
+    def get_object(self, *args, **kwargs):
+        return get_object_or_404(MediaUpload, id=self.kwargs.get('upload_id'), owner=self.request.user.id)
+
+    def put(self, request, *args, **kwargs):
+        upload = self.get_object()
+        start, end = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), upload)
+        if int(request.META.get('CONTENT_LENGTH') or 0) != end - start + 1:
+            raise ValidationError({'Content-Range': ['Range does not match the Content-Length.']})
+        # The body is read from the request stream as it is written out,
+        # never loaded whole.
+        write_chunk(upload, request.stream, start, end - start + 1,
+                    request.META.get('HTTP_X_CHUNK_CHECKSUM'))
+        if upload.received < upload.size:
+            return Response(self.get_serializer(upload).data)
+
+        enqueue('complete_upload', upload.id)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_202_ACCEPTED)
+
+    def destroy(self, request, *args, **kwargs):
+        discard_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MessageSearchAPIView(ReplicaReadMixin, ListAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = MessageSerializer
+    http_method_names = ['get']
+    pagination_class = MessageCursorPagination
+
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '')
+        if not text.strip():
+            raise ValidationError({'q': ['This query parameter is required.']})
+        messages = message_queryset(request_fieldsets(request)[0]).visible_to(request.user)
+        if request.query_params.get('club'):
+            club = get_object_or_404(Club, id=request.query_params['club'])
+            messages = messages.filter_by_instance(club)
+        if request.query_params.get('user'):
+            profile = get_object_or_404(UserProfile, id=request.query_params['user'])
+            messages = messages.filter_by_conversation(request.user, profile)
+        page = self.paginate_queryset(search_messages(messages, text))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class MessageRetrieveUpdateDeleteAPIView(ReplicaReadMixin, RetrieveUpdateDestroyAPIView):
+    permission_classes = (IsAuthenticated, CanAccessMessage,)
     serializer_class = MessageSerializer
     http_method_names = ['get', 'patch', 'delete']
     queryset = UserMessage.objects.all()
@@ -196,5 +452,110 @@ class MessageRetrieveUpdateDeleteAPIView(RetrieveUpdateDestroyAPIView):
 
     def get_object(self, *args, **kwargs):
         id = self.kwargs.get("message_id")
-        user = self.request.user
-        return get_object_or_404(UserMessage, Q(id=id) & (Q(sender=user.id) | Q(userprofile=user.userprofile)))
+        message = get_object_or_404(message_queryset(request_fieldsets(self.request)[0]), id=id,
+                                    **created_bounds(id))
+        self.check_object_permissions(self.request, message)
+        return message
+
+    def perform_destroy(self, instance):
+        instance.soft_delete()
+
+
+class MessageMediaAPIView(RetrieveAPIView):
+    """
+    The attachment of a media message, to everyone who may read the message.
+    Supports Range requests for seeking and ETag/Last-Modified revalidation.
+    ``?variant=thumbnail`` serves the thumbnail made by media processing.
+    """
+    permission_classes = (IsAuthenticated, CanAccessMessage,)
+    http_method_names = ['get', 'head']
+    lookup_field = 'message_id'
+
+    def perform_content_negotiation(self, request, force=False):
+        # Players ask for the media type, not for anything a renderer offers.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        id = self.kwargs.get('message_id')
+        message = get_object_or_404(UserMessage.objects.select_related('attachment'), id=id,
+                                    **created_bounds(id))
+        self.check_object_permissions(request, message)
+        if not hasattr(message, 'attachment'):
+            raise NotFound('This message has no attachment.')
+        variant = request.query_params.get('variant')
+        if variant is not None and (variant != 'thumbnail' or not message.attachment.thumbnail):
+            raise NotFound('This attachment has no %s variant.' % variant)
+        return serve_attachment(request, message.attachment, variant)
+
+
+class InboxListAPIView(ReplicaReadMixin, ListAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = InboxEntrySerializer
+    http_method_names = ['get']
+    throttle_scopes = {'GET': 'poll'}
+
+    def get(self, request, *args, **kwargs):
+        queryset = InboxEntry.objects.filter(user=request.user.id).order_by('-last_message_at')
+        serializer = self.serializer_class(queryset, many=True)
+        return Response(serializer.data)
+
+
+class InboxReadAPIView(CreateAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = InboxEntrySerializer
+    http_method_names = ['post']
+    lookup_field = 'entry_id'
+
+    def post(self, request, *args, **kwargs):
+        entry = get_object_or_404(InboxEntry, id=self.kwargs.get('entry_id'), user=request.user.id)
+        entry.unread_count = 0
+        entry.last_read_at = entry.last_message_at
+        entry.save(update_fields=['unread_count', 'last_read_at'])
+        return Response(self.serializer_class(entry).data, status=status.HTTP_200_OK)
+
+
+class MessageExportAPIView(ListAPIView):
+    """
+    Stream a full message history as NDJSON, oldest first. Every line carries
+    a ``cursor``; passing the last one received as ``?cursor=`` resumes an
+    interrupted export. ``?compress=gzip`` gzips the stream.
+    """
+    permission_classes = (IsAuthenticated,)
+    http_method_names = ['get']
+
+    def export(self, request, queryset, name, archived=None):
+        position = None
+        if request.query_params.get('cursor'):
+            try:
+                position = decode_position(request.query_params['cursor'])
+            except ValueError:
+                raise ValidationError({'cursor': ['Invalid cursor.']})
+        content = ndjson(export_rows(queryset, position, archived=archived))
+        content_type, filename = 'application/x-ndjson', '%s.ndjson' % name
+        if request.query_params.get('compress') == 'gzip':
+            content = gzip_stream(content)
+            content_type, filename = 'application/gzip', filename + '.gz'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+
+class ClubMessageExportAPIView(MessageExportAPIView):
+    permission_classes = (IsAuthenticated, IsAdminUser | IsClubOwner,)
+    lookup_field = 'club_id'
+
+    def get(self, request, *args, **kwargs):
+        club = get_object_or_404(Club, id=self.kwargs.get('club_id'))
+        return self.export(request, club_history(club), 'club-%s' % club.id,
+                           club_history(club, ArchivedMessage))
+
+
+class UserMessageExportAPIView(MessageExportAPIView):
+    lookup_field = 'user_id'
+
+    def get(self, request, *args, **kwargs):
+        user = get_object_or_404(User, id=self.kwargs.get('user_id'))
+        if not (request.user.is_staff or request.user.id == user.id):
+            raise PermissionDenied('Users can only export their own history.')
+        return self.export(request, user_history(user), 'user-%s' % user.id,
+                           user_history(user, ArchivedMessage))